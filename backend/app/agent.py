@@ -4,9 +4,13 @@ Uses LangChain with Google's free Gemini models.
 """
 
 import json
+from dataclasses import dataclass
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.config import get_settings
+from app.llm_router import get_llm_router
+from app.ratelimit import BULK, INTERACTIVE
 
 
 def _get_llm(model_name: str | None = None):
@@ -20,21 +24,17 @@ def _get_llm(model_name: str | None = None):
     )
 
 
-def draft_message(master_prompt: str, row_data: dict, model_name: str | None = None) -> str:
-    """
-    Use Gemini to draft a personalized message for one data row.
-
-    Args:
-        master_prompt: The user's high-level instruction.
-        row_data: The data for this specific row as a dict.
-        model_name: Optional model override.
+@dataclass
+class Draft:
+    text: str
+    model: str  # the model that actually produced the draft (may be a hedge / fallback)
+    input_tokens: int = 0
+    output_tokens: int = 0
 
-    Returns:
-        The drafted message string.
-    """
-    llm = _get_llm(model_name)
 
-    messages = [
+def _draft_messages(master_prompt: str, row_data: dict) -> list:
+    """Prompt for drafting one row's message (shared by interactive and batch drafting)."""
+    return [
         SystemMessage(content=(
             "You are a professional communication assistant. "
             "Your task is to draft a short, personalized message based on the user's instruction "
@@ -48,11 +48,49 @@ def draft_message(master_prompt: str, row_data: dict, model_name: str | None = N
         )),
     ]
 
-    response = llm.invoke(messages)
-    return response.content.strip()
+
+def draft_message(master_prompt: str, row_data: dict, model_name: str | None = None) -> Draft:
+    """
+    Use Gemini to draft a personalized message for one data row.
+
+    Args:
+        master_prompt: The user's high-level instruction.
+        row_data: The data for this specific row as a dict.
+        model_name: Optional model override.
+
+    Returns:
+        The drafted message and the model that wrote it.
+    """
+    messages = _draft_messages(master_prompt, row_data)
+    response = get_llm_router().invoke(messages, model_name, lane=BULK)
+    return Draft(
+        text=response.content.strip(),
+        model=response.model,
+        input_tokens=response.input_tokens,
+        output_tokens=response.output_tokens,
+    )
 
 
-def process_reply(original_row_data: dict, outbound_message: str, reply_text: str, model_name: str | None = None) -> dict:
+def draft_batch_request(custom_id: str, master_prompt: str, row_data: dict, model_name: str | None = None) -> dict:
+    """The same drafting prompt as draft_message, as one JSONL record for a batch job."""
+    roles = {SystemMessage: "system", HumanMessage: "user"}
+    return {
+        "custom_id": custom_id,
+        "model": model_name or get_settings().gemini_model,
+        "messages": [
+            {"role": roles[type(m)], "content": m.content}
+            for m in _draft_messages(master_prompt, row_data)
+        ],
+    }
+
+
+def process_reply(
+    original_row_data: dict,
+    outbound_message: str,
+    reply_text: str,
+    model_name: str | None = None,
+    lane: str = INTERACTIVE,
+) -> dict:
     """
     Use Gemini to analyze an inbound reply and extract structured updates.
 
@@ -61,12 +99,11 @@ def process_reply(original_row_data: dict, outbound_message: str, reply_text: st
         outbound_message: The message that was sent to the recipient.
         reply_text: The recipient's reply.
         model_name: Optional model override.
+        lane: LLM priority lane; BULK for imports nobody is waiting on.
 
     Returns:
-        Dict with keys: intent, updates, confidence
+        Dict with keys: intent, updates, confidence, model, usage ({"input_tokens", "output_tokens"})
     """
-    llm = _get_llm(model_name)
-
     messages = [
         SystemMessage(content=(
             "You are a data extraction assistant. Analyze the reply to a message and extract:\n"
@@ -84,7 +121,7 @@ def process_reply(original_row_data: dict, outbound_message: str, reply_text: st
         )),
     ]
 
-    response = llm.invoke(messages)
+    response = get_llm_router().invoke(messages, model_name, lane=lane)
     text = response.content.strip()
 
     # Parse the JSON response — handle markdown code blocks if present
@@ -106,5 +143,7 @@ def process_reply(original_row_data: dict, outbound_message: str, reply_text: st
     result.setdefault("intent", "unclear")
     result.setdefault("updates", {})
     result.setdefault("confidence", 0.5)
+    result["model"] = response.model
+    result["usage"] = {"input_tokens": response.input_tokens, "output_tokens": response.output_tokens}
 
     return result
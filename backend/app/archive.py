@@ -0,0 +1,198 @@
+"""
+Hot/cold tiering for campaign rows.
+
+Completed campaigns untouched for `archive_after_days` are compacted: their rows
+are serialized into zlib-compressed JSON chunks (`ArchivedRowChunk`) and deleted
+from `data_rows`, so the hot table and its indexes only hold live work. Archived
+rows stay readable through the campaign detail and export endpoints.
+"""
+
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import ArchivedRowChunk, Campaign, CampaignStatus, DataRow
+from app.rowlog import compact_rows
+
+COMPRESSION_LEVEL = 6
+
+_last_run: dict | None = None
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_rows(rows: list[dict]) -> tuple[bytes, int]:
+    """Compress a list of row dicts. Returns (payload, uncompressed size)."""
+    raw = json.dumps(rows, default=_json_default, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, COMPRESSION_LEVEL), len(raw)
+
+
+def decode_rows(payload: bytes) -> list[dict]:
+    return json.loads(zlib.decompress(payload))
+
+
+# ════════════════════════════════════════════════
+# Compaction (hot → cold)
+# ════════════════════════════════════════════════
+
+def archive_campaign(db: Session, campaign: Campaign, chunk_size: int) -> int:
+    """Move a campaign's rows into compressed chunks and delete them from data_rows. Caller commits."""
+    table = DataRow.__table__
+    result = db.execute(
+        select(table)
+        .where(table.c.campaign_id == campaign.id)
+        .order_by(table.c.row_index, table.c.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    archived = 0
+    for chunk_index, partition in enumerate(result.mappings().partitions()):
+        rows = [dict(r) for r in partition]
+        payload, raw_bytes = encode_rows(rows)
+        db.execute(insert(ArchivedRowChunk), {
+            "campaign_id": campaign.id,
+            "chunk_index": chunk_index,
+            "row_count": len(rows),
+            "raw_bytes": raw_bytes,
+            "payload": payload,
+        })
+        archived += len(rows)
+
+    db.execute(delete(table).where(table.c.campaign_id == campaign.id))
+    campaign.archived_at = datetime.now(timezone.utc)
+    return archived
+
+
+def eligible_campaigns(db: Session, older_than_days: int) -> list[int]:
+    """Completed, not yet archived, idle for `older_than_days`, and nothing left to review."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    pending_review = exists().where(DataRow.campaign_id == Campaign.id, DataRow.needs_review == True)
+    return list(db.scalars(
+        select(Campaign.id).where(
+            Campaign.status == CampaignStatus.COMPLETED,
+            Campaign.archived_at.is_(None),
+            Campaign.updated_at < cutoff,
+            ~pending_review,
+        ).order_by(Campaign.id)
+    ))
+
+
+def compact(older_than_days: int | None = None) -> dict:
+    """Archive every eligible campaign, one transaction per campaign."""
+    global _last_run
+    settings = get_settings()
+    days = settings.archive_after_days if older_than_days is None else older_than_days
+    start = time.monotonic()
+    archived, rows = [], 0
+
+    db = SessionLocal()
+    try:
+        for campaign_id in eligible_campaigns(db, days):
+            campaign = db.get(Campaign, campaign_id)
+            try:
+                compact_rows(db, campaign_id)  # cold rows hold their final data
+                count = archive_campaign(db, campaign, settings.archive_chunk_size)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[ARCHIVE ERROR] Campaign {campaign_id}: {e}")
+                continue
+            archived.append(campaign_id)
+            rows += count
+            print(f"[ARCHIVE] Campaign {campaign_id}: {count} rows moved to cold storage")
+    finally:
+        db.close()
+
+    _last_run = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "older_than_days": days,
+        "campaigns": archived,
+        "rows": rows,
+        "seconds": round(time.monotonic() - start, 2),
+    }
+    return _last_run
+
+
+def _compaction_loop():
+    while not _stop.wait(get_settings().archive_interval):
+        try:
+            compact()
+        except Exception as e:
+            print(f"[ARCHIVE ERROR] Compaction pass failed: {e}")
+
+
+def start_compactor():
+    """Start the background compaction job (no-op when ARCHIVE_AFTER_DAYS=0)."""
+    global _thread
+    if get_settings().archive_after_days <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_compaction_loop, name="archive-compactor", daemon=True)
+    _thread.start()
+
+
+def stop_compactor():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+# ════════════════════════════════════════════════
+# Reading the cold tier
+# ════════════════════════════════════════════════
+
+async def iter_archived_rows(db: AsyncSession, campaign_id: int) -> AsyncIterator[list[dict]]:
+    """Yield an archived campaign's rows one decompressed chunk at a time, in row order."""
+    chunk_ids = (await db.scalars(
+        select(ArchivedRowChunk.id)
+        .where(ArchivedRowChunk.campaign_id == campaign_id)
+        .order_by(ArchivedRowChunk.chunk_index)
+    )).all()
+    for chunk_id in chunk_ids:
+        payload = await db.scalar(select(ArchivedRowChunk.payload).where(ArchivedRowChunk.id == chunk_id))
+        yield await run_in_threadpool(decode_rows, payload)
+
+
+def storage_stats(db: Session) -> dict:
+    """Row counts for the hot table and row / byte counts for the cold tier."""
+    hot_rows, hot_campaigns = db.execute(
+        select(func.count(DataRow.id), func.count(DataRow.campaign_id.distinct()))
+    ).one()
+    chunks, cold_rows, raw_bytes, compressed_bytes = db.execute(
+        select(
+            func.count(ArchivedRowChunk.id),
+            func.coalesce(func.sum(ArchivedRowChunk.row_count), 0),
+            func.coalesce(func.sum(ArchivedRowChunk.raw_bytes), 0),
+            func.coalesce(func.sum(func.length(ArchivedRowChunk.payload)), 0),
+        )
+    ).one()
+    cold_campaigns = db.scalar(select(func.count(Campaign.id)).where(Campaign.archived_at.isnot(None)))
+    return {
+        "hot": {"campaigns": hot_campaigns, "rows": hot_rows},
+        "cold": {
+            "campaigns": cold_campaigns,
+            "rows": cold_rows,
+            "chunks": chunks,
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+            "compression_ratio": round(raw_bytes / compressed_bytes, 2) if compressed_bytes else None,
+        },
+        "last_compaction": _last_run,
+    }
@@ -0,0 +1,135 @@
+"""
+Offline batch drafting backends.
+
+A batch job is a JSONL file with one drafting request per line:
+    {"custom_id": "<row id>", "model": "...", "messages": [{"role": "system", ...}, {"role": "user", ...}]}
+and produces a JSONL file of results:
+    {"custom_id": "<row id>", "content": "..." | null, "model": "...", "error": null | "...",
+     "input_tokens": 0, "output_tokens": 0}
+
+Backends are pluggable via `register_backend()`; `settings.batch_backend` picks one.
+"""
+
+import json
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator
+
+from app.config import get_settings
+
+
+class BatchBackend(ABC):
+    """Interface for asynchronous batch LLM providers."""
+
+    @abstractmethod
+    def submit(self, input_path: str) -> str:
+        """Submit a JSONL request file, return the provider's batch id."""
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        """Return "running" | "completed" | "failed"."""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Iterator[dict]:
+        """Stream result records of a completed batch."""
+
+
+def _route_request(request: dict) -> dict:
+    """Default responder for the local backend: run the request through the LLM router."""
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from app.llm_router import get_llm_router
+    from app.ratelimit import BULK
+
+    types = {"system": SystemMessage, "user": HumanMessage}
+    messages = [types[m["role"]](content=m["content"]) for m in request["messages"]]
+    response = get_llm_router().invoke(messages, request.get("model"), lane=BULK)
+    return {
+        "content": response.content.strip(),
+        "model": response.model,
+        "input_tokens": response.input_tokens,
+        "output_tokens": response.output_tokens,
+    }
+
+
+class LocalFileBatchBackend(BatchBackend):
+    """
+    File-based stand-in for a provider batch API (for local runs and tests).
+    Jobs are processed on a background thread; `responder` turns one request into
+    {"content", "model", "input_tokens", "output_tokens"} and defaults to the interactive LLM router.
+    """
+
+    def __init__(self, work_dir: str, responder: Callable[[dict], dict] | None = None):
+        self.work_dir = work_dir
+        self.responder = responder or _route_request
+        self._status: dict[str, str] = {}
+        self._lock = threading.Lock()
+        os.makedirs(work_dir, exist_ok=True)
+
+    def _output_path(self, batch_id: str) -> str:
+        return os.path.join(self.work_dir, f"{batch_id}.output.jsonl")
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._status[batch_id] = "running"
+        threading.Thread(target=self._process, args=(batch_id, input_path), daemon=True).start()
+        return batch_id
+
+    def _process(self, batch_id: str, input_path: str):
+        tmp_path = self._output_path(batch_id) + ".tmp"
+        try:
+            with open(input_path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as out:
+                for line in src:
+                    if not line.strip():
+                        continue
+                    request = json.loads(line)
+                    try:
+                        result = {**self.responder(request), "error": None}
+                    except Exception as e:
+                        result = {"content": None, "model": request.get("model"), "error": str(e)}
+                    out.write(json.dumps({"custom_id": request["custom_id"], **result}) + "\n")
+            os.replace(tmp_path, self._output_path(batch_id))
+            status = "completed"
+        except Exception as e:
+            print(f"[BATCH ERROR] {batch_id}: {e}")
+            status = "failed"
+        with self._lock:
+            self._status[batch_id] = status
+
+    def poll(self, batch_id: str) -> str:
+        with self._lock:
+            status = self._status.get(batch_id)
+        if status is None:
+            # Unknown to this process (e.g. after a restart) — trust the output file
+            return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+        return status
+
+    def results(self, batch_id: str) -> Iterator[dict]:
+        with open(self._output_path(batch_id), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+_BACKEND_FACTORIES: dict[str, Callable[[], BatchBackend]] = {
+    "local": lambda: LocalFileBatchBackend(work_dir=get_settings().batch_dir),
+}
+_backends: dict[str, BatchBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], BatchBackend]):
+    """Make a batch backend selectable with BATCH_BACKEND=<name>."""
+    _BACKEND_FACTORIES[name] = factory
+
+
+def get_batch_backend() -> BatchBackend:
+    name = get_settings().batch_backend
+    with _backends_lock:
+        if name not in _backends:
+            if name not in _BACKEND_FACTORIES:
+                raise ValueError(f"Unknown batch backend '{name}'")
+            _backends[name] = _BACKEND_FACTORIES[name]()
+        return _backends[name]
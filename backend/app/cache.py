@@ -0,0 +1,199 @@
+"""
+Read-through response cache for the dashboard endpoints.
+
+Every committed write to a campaign or one of its rows bumps that campaign's version
+counter (campaign-level writes also bump the campaign-list version). ORM writes are
+picked up by session events; Core bulk statements call `mark_changed()`. Cached
+responses are serialized JSON tagged with the version they were built at, so:
+
+- `If-None-Match` with the current ETag is answered 304 without touching the DB,
+- an unchanged campaign is served from memory,
+- anything written since is rebuilt once and cached again.
+
+Version counters live in the coordination store (COORDINATION_URL), so a write made
+by any worker process invalidates every process's entries; checking a version is
+one counter read. Cached bodies stay per process, bounded by RESPONSE_CACHE_MAX_BYTES
+with LRU eviction. If the store can't be reached, responses are built uncached.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.coordination import get_store
+
+LIST_SCOPE = "list"
+_EPOCH_COUNTER = "cache:epoch"  # bumped by each process on first use: ETags from before a restart never match
+
+
+def _counter(scope) -> str:
+    return f"cache:{scope}"
+
+
+class ResponseCache:
+    def __init__(self):
+        self._joined = False  # this process has bumped the epoch
+        self._entries: OrderedDict[tuple, tuple[str, bytes, float]] = OrderedDict()  # key -> (etag, body, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "not_modified": 0, "misses": 0, "evictions": 0}
+
+    # ── versions ──
+
+    def bump(self, campaign_ids: set[int], campaign_level: bool):
+        names = [_counter(campaign_id) for campaign_id in campaign_ids]
+        if campaign_level:
+            names.append(_counter(LIST_SCOPE))
+        try:
+            get_store().incr_counters(names)
+        except Exception as e:
+            print(f"[CACHE ERROR] Could not publish invalidation of {names}: {e}")
+            self.clear()
+
+    def etag(self, key: tuple, scope) -> str | None:
+        """
+        Strong ETag for `key` at the current version of `scope` (a campaign id or
+        LIST_SCOPE), or None if the coordination store can't be read.
+        """
+        try:
+            store = get_store()
+            if not self._joined:
+                store.incr_counters([_EPOCH_COUNTER])
+                self._joined = True
+            versions = store.read_counters([_EPOCH_COUNTER, _counter(scope)])
+        except Exception as e:
+            print(f"[CACHE ERROR] Could not read cache versions: {e}")
+            return None
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:10]
+        return f'"{versions[_EPOCH_COUNTER]}-{digest}-{versions[_counter(scope)]}"'
+
+    # ── entries ──
+
+    def get(self, key: tuple, etag: str) -> bytes | None:
+        max_age = get_settings().response_cache_max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != etag or (max_age and time.monotonic() - entry[2] > max_age):
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, etag: str, body: bytes):
+        max_bytes = get_settings().response_cache_max_bytes
+        if len(body) > max_bytes // 4:
+            return  # one huge campaign shouldn't flush everything else
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (etag, body, time.monotonic())
+            self._bytes += len(body)
+            while self._bytes > max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _drop(self, key: tuple):
+        _, body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        settings = get_settings()
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": settings.response_cache_max_bytes,
+                "max_age": settings.response_cache_max_age,
+                **self.counters,
+            }
+
+
+response_cache = ResponseCache()
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+async def cached_json(request: Request, key: tuple, scope, build: Callable[[], Awaitable[bytes]]) -> Response:
+    """
+    Serve `key` from the cache (or a 304), building and caching it on a miss.
+    `build` returns the serialized JSON body and may raise HTTPException as usual.
+    """
+    if not get_settings().response_cache_enabled:
+        return Response(await build(), media_type="application/json")
+
+    # Read the version before building: a write committed meanwhile bumps it, and the
+    # (possibly stale) body is then not cached under the new ETag
+    etag = await run_in_threadpool(response_cache.etag, key, scope)
+    if etag is None:
+        return Response(await build(), media_type="application/json")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # always revalidate
+    if _matches(request.headers.get("if-none-match"), etag):
+        response_cache.counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key, etag)
+    if body is not None:
+        response_cache.counters["hits"] += 1
+    else:
+        response_cache.counters["misses"] += 1
+        body = await build()
+        if await run_in_threadpool(response_cache.etag, key, scope) == etag:
+            response_cache.put(key, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# ════════════════════════════════════════════════
+# Write tracking
+# ════════════════════════════════════════════════
+
+def mark_changed(session: Session, campaign_ids, campaign_level: bool = False):
+    """Record writes made with Core statements (invisible to the ORM) for invalidation at commit."""
+    bucket = "cache_campaigns" if campaign_level else "cache_rows"
+    session.info.setdefault(bucket, set()).update(campaign_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, _flush_context):
+    from app.models import Campaign, DataRow  # local import to avoid circular
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Campaign):
+            mark_changed(session, {obj.id}, campaign_level=True)
+        elif isinstance(obj, DataRow):
+            mark_changed(session, {obj.campaign_id})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(session):
+    campaigns = session.info.pop("cache_campaigns", set())
+    rows = session.info.pop("cache_rows", set())
+    if campaigns or rows:
+        response_cache.bump(rows - campaigns, campaign_level=False)
+        if campaigns:
+            response_cache.bump(campaigns, campaign_level=True)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("cache_campaigns", None)
+    session.info.pop("cache_rows", None)
@@ -0,0 +1,187 @@
+"""
+Debounced coalescing of reply bursts.
+
+Chat users answer in fragments ("yes", "I'll come", "but 10 mins late"). Fragments
+matched to the same row are buffered until the sender has been quiet for
+`reply_debounce_seconds` (or `reply_debounce_max_seconds` after the first one, so a
+steady stream still gets processed), then handed to `flush` as one reply: one LLM
+call per burst, with the full context.
+
+Fragments are stored in reply_fragments before the webhook acknowledges them, so a
+crash or restart doesn't lose them, and the window is computed from the stored
+fragments, so a burst whose fragments reached different worker processes is still
+processed once, as a whole. The process that received a fragment re-checks the row
+when its window should close; a sweep every SWEEP_INTERVAL seconds picks up bursts
+whose process went away. A flush claims its fragments for FLUSH_LEASE seconds, and
+`flush` deletes them in the transaction that applies the reply. A failed flush is
+retried once the lease expires, up to MAX_FLUSH_ATTEMPTS times.
+"""
+
+import asyncio
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, func, or_, select, update
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import ReplyFragment
+
+METRICS_WINDOW = 500  # most recent bursts kept for the fragment / duration figures
+SWEEP_INTERVAL = 5.0  # seconds between checks for bursts no process is timing
+FLUSH_LEASE = 120.0  # seconds before a claimed burst whose flush never finished is retried
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def _claimable(now: float):
+    return or_(ReplyFragment.flushing_at.is_(None), ReplyFragment.flushing_at < now - FLUSH_LEASE)
+
+
+class ReplyCoalescer:
+    """Per-row debounce windows; `flush(row_id, text, fragment_ids)` processes a finished burst."""
+
+    def __init__(self, flush: Callable[[int, str, list[int]], Awaitable[None]]):
+        self._flush = flush
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._sweeper: asyncio.Task | None = None
+        self._counters = {"fragments": 0, "bursts": 0, "flushed_fragments": 0, "failed": 0, "dropped": 0}
+        self._sizes: deque[int] = deque(maxlen=METRICS_WINDOW)
+        self._durations: deque[float] = deque(maxlen=METRICS_WINDOW)
+
+    async def add(self, row_id: int, text: str) -> dict:
+        """Store a fragment and (re)arm the row's check. Must be called from the event loop."""
+        settings = get_settings()
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            db.add(ReplyFragment(row_id=row_id, text=text.strip(), received_at=now))
+            await db.commit()
+            count, first = (await db.execute(
+                select(func.count(), func.min(ReplyFragment.received_at))
+                .where(ReplyFragment.row_id == row_id, _claimable(now))
+            )).one()
+        self._counters["fragments"] += 1
+        delay = max(0.0, min(settings.reply_debounce_seconds, settings.reply_debounce_max_seconds - (now - first)))
+        self._schedule(row_id, delay)
+        return {"fragments": count, "flush_in": round(delay, 2)}
+
+    def _schedule(self, row_id: int, delay: float):
+        timer = self._timers.pop(row_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[row_id] = asyncio.get_running_loop().call_later(delay, self._start_check, row_id)
+
+    def _start_check(self, row_id: int):
+        self._timers.pop(row_id, None)
+        task = asyncio.create_task(self._check(row_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _check(self, row_id: int):
+        """Flush the row's burst if its window has closed, else re-check when it will."""
+        settings = get_settings()
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            fragments = (await db.execute(
+                select(ReplyFragment.id, ReplyFragment.text, ReplyFragment.received_at)
+                .where(ReplyFragment.row_id == row_id, _claimable(now))
+                .order_by(ReplyFragment.id)
+            )).all()
+            if not fragments:
+                return  # flushed by another process
+            first = fragments[0].received_at
+            last = max(f.received_at for f in fragments)
+            due = min(last + settings.reply_debounce_seconds, first + settings.reply_debounce_max_seconds)
+            if due > now:
+                self._schedule(row_id, due - now)
+                return
+
+            ids = [f.id for f in fragments]
+            claimed = (await db.execute(
+                update(ReplyFragment)
+                .where(ReplyFragment.id.in_(ids), _claimable(now))
+                .values(flushing_at=now, attempts=ReplyFragment.attempts + 1)
+            )).rowcount
+            if claimed != len(ids):
+                await db.rollback()  # another process claimed (some of) them first
+                return
+            await db.commit()
+
+        self._counters["bursts"] += 1
+        self._counters["flushed_fragments"] += len(ids)
+        self._sizes.append(len(ids))
+        self._durations.append(last - first)
+        try:
+            await self._flush(row_id, "\n".join(f.text for f in fragments if f.text), ids)
+        except Exception as e:
+            self._counters["failed"] += 1
+            print(f"[REPLY ERROR] Row {row_id}: burst of {len(ids)} fragment(s) failed, retrying in {FLUSH_LEASE:g}s: {e}")
+
+    async def sweep(self):
+        """Check every row with claimable fragments that this process isn't already timing."""
+        now = time.time()
+        async with AsyncSessionLocal() as db:
+            dropped = (await db.execute(
+                delete(ReplyFragment).where(
+                    ReplyFragment.attempts >= MAX_FLUSH_ATTEMPTS, ReplyFragment.flushing_at < now - FLUSH_LEASE,
+                )
+            )).rowcount
+            await db.commit()
+            row_ids = (await db.scalars(select(ReplyFragment.row_id).where(_claimable(now)).distinct())).all()
+        if dropped:
+            self._counters["dropped"] += dropped
+            print(f"[REPLY ERROR] Dropped {dropped} fragment(s) after {MAX_FLUSH_ATTEMPTS} failed flushes")
+        for row_id in row_ids:
+            if row_id not in self._timers:
+                self._start_check(row_id)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[REPLY ERROR] Burst sweep failed: {e}")
+            await asyncio.sleep(SWEEP_INTERVAL)
+
+    def start(self):
+        """Start the sweeper (also picks up bursts stored before a restart)."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def drain(self):
+        """Stop timing bursts and wait for in-flight flushes (shutdown). Buffered fragments stay stored."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def metrics(self) -> dict:
+        settings = get_settings()
+        async with AsyncSessionLocal() as db:
+            buffered_rows, buffered_fragments = (await db.execute(
+                select(func.count(ReplyFragment.row_id.distinct()), func.count())
+            )).one()
+        sizes, durations = list(self._sizes), sorted(self._durations)
+        return {
+            "window_seconds": settings.reply_debounce_seconds,
+            "max_window_seconds": settings.reply_debounce_max_seconds,
+            "buffered_rows": buffered_rows,
+            "buffered_fragments": buffered_fragments,
+            **self._counters,
+            "llm_calls_saved": self._counters["flushed_fragments"] - self._counters["bursts"],
+            "fragments_per_burst": {
+                "mean": round(statistics.mean(sizes), 2) if sizes else None,
+                "max": max(sizes, default=None),
+            },
+            "burst_seconds": {
+                "mean": round(statistics.mean(durations), 2) if durations else None,
+                "p95": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2) if durations else None,
+                "max": round(durations[-1], 2) if durations else None,
+            },
+        }
@@ -0,0 +1,388 @@
+"""
+Cross-process coordination for multi-worker deployments.
+
+Several uvicorn workers (or API and worker processes) share one store that holds:
+
+- token buckets, so a rate limit on an upstream (Gemini, WAHA) is global rather than
+  per process,
+- runtime settings changed through the API (e.g. the active model), with a version
+  counter so every process can keep its in-memory `Settings` current by polling a
+  single integer,
+- named counters, e.g. the response cache's per-campaign versions.
+
+The store is picked by COORDINATION_URL:
+    sqlite:///./data/coordination.db   (default; a small SQLite file, locked per write)
+    redis://host:6379/0                (needs the `redis` package; for several hosts)
+    memory://                          (this process only)
+Other schemes can be added with `register_store()`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from pydantic import TypeAdapter
+
+from app.config import Settings, get_settings
+
+# Settings that may be changed at runtime (POST /settings/...) and propagate to every process
+RUNTIME_SETTINGS = ("gemini_model", "confidence_threshold")
+STORE_RETRY = 5.0  # seconds a process works without the store after an error before trying it again
+
+
+class CoordinationStore(ABC):
+    """Interface for the shared state behind global rate limits and runtime settings."""
+
+    @abstractmethod
+    def take(self, bucket: str, rate: float, capacity: float, tokens: float = 1.0) -> float:
+        """
+        Atomically refill `bucket` (`rate` tokens/sec, at most `capacity`) and take `tokens`.
+        Returns 0.0 if they were taken, else the seconds until enough will have accrued.
+        """
+
+    @abstractmethod
+    def settings_version(self) -> int:
+        """Version of the runtime settings (one cheap read, polled by every process)."""
+
+    @abstractmethod
+    def load_settings(self) -> tuple[int, dict]:
+        """(version, {name: value}) of the runtime settings."""
+
+    @abstractmethod
+    def save_settings(self, values: dict) -> int:
+        """Store runtime settings and bump the version. Returns the new version."""
+
+    @abstractmethod
+    def buckets(self) -> dict[str, dict]:
+        """Bucket name -> {"tokens", "updated"} (diagnostics)."""
+
+    @abstractmethod
+    def incr_counters(self, names: list[str]):
+        """Increment each named counter by one (a missing counter starts at 0)."""
+
+    @abstractmethod
+    def read_counters(self, names: list[str]) -> dict[str, int]:
+        """Current value of each named counter, 0 if it was never incremented."""
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryStore(CoordinationStore):
+    """In-process store: correct for a single process, and for tests."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._settings: dict = {}
+        self._version = 0
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def take(self, bucket, rate, capacity, tokens=1.0):
+        with self._lock:
+            now = time.time()
+            available, updated = self._buckets.get(bucket, (capacity, now))
+            available = _refill(available, updated, now, rate, capacity)
+            wait = 0.0 if available >= tokens else (tokens - available) / rate
+            self._buckets[bucket] = (available - tokens if not wait else available, now)
+            return wait
+
+    def settings_version(self):
+        return self._version
+
+    def load_settings(self):
+        with self._lock:
+            return self._version, dict(self._settings)
+
+    def save_settings(self, values):
+        with self._lock:
+            self._settings.update(values)
+            self._version += 1
+            return self._version
+
+    def buckets(self):
+        with self._lock:
+            return {name: {"tokens": round(t, 3), "updated": u} for name, (t, u) in self._buckets.items()}
+
+    def incr_counters(self, names):
+        with self._lock:
+            for name in names:
+                self._counters[name] = self._counters.get(name, 0) + 1
+
+    def read_counters(self, names):
+        with self._lock:
+            return {name: self._counters.get(name, 0) for name in names}
+
+
+class SqliteStore(CoordinationStore):
+    """
+    A SQLite file shared by every process on the host. Bucket updates run in a
+    BEGIN IMMEDIATE transaction, so the database's file lock serializes them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS runtime_settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are explicit
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # losing the last bucket update in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def take(self, bucket, rate, capacity, tokens=1.0):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)).fetchone()
+            available = capacity if row is None else _refill(row[0], row[1], now, rate, capacity)
+            wait = 0.0 if available >= tokens else (tokens - available) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (bucket, available - tokens if not wait else available, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def settings_version(self):
+        row = self._connect().execute("SELECT value FROM counters WHERE name = 'settings'").fetchone()
+        return row[0] if row else 0
+
+    def load_settings(self):
+        conn = self._connect()
+        conn.execute("BEGIN")  # one snapshot for the version and the values
+        try:
+            version = self.settings_version()
+            values = {name: json.loads(value) for name, value in conn.execute("SELECT name, value FROM runtime_settings")}
+        finally:
+            conn.execute("COMMIT")
+        return version, values
+
+    def save_settings(self, values):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO runtime_settings (name, value) VALUES (?, ?)",
+                [(name, json.dumps(value)) for name, value in values.items()],
+            )
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('settings', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+            version = self.settings_version()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def buckets(self):
+        rows = self._connect().execute("SELECT name, tokens, updated FROM buckets ORDER BY name")
+        return {name: {"tokens": round(tokens, 3), "updated": updated} for name, tokens, updated in rows}
+
+    def incr_counters(self, names):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1",
+                [(name,) for name in names],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def read_counters(self, names):
+        placeholders = ", ".join("?" * len(names))
+        rows = self._connect().execute(f"SELECT name, value FROM counters WHERE name IN ({placeholders})", names)
+        return {name: 0 for name in names} | dict(rows.fetchall())
+
+
+# Refill and take in one round trip; the server clock keeps hosts consistent
+_REDIS_TAKE = """
+local rate, capacity, tokens = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local available = capacity
+if state[1] then
+    available = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local wait = 0
+if available >= tokens then available = available - tokens else wait = (tokens - available) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(available), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisStore(CoordinationStore):
+    """Redis (or a compatible server) shared by processes on any number of hosts."""
+
+    def __init__(self, url: str, prefix: str = "sentinalgrid:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("COORDINATION_URL uses redis but the 'redis' package is not installed") from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._take = self._redis.register_script(_REDIS_TAKE)
+        self._prefix = prefix
+
+    def take(self, bucket, rate, capacity, tokens=1.0):
+        self._redis.sadd(f"{self._prefix}buckets", bucket)
+        return float(self._take(keys=[f"{self._prefix}bucket:{bucket}"], args=[rate, capacity, tokens]))
+
+    def settings_version(self):
+        return int(self._redis.get(f"{self._prefix}settings:version") or 0)
+
+    def load_settings(self):
+        with self._redis.pipeline() as pipe:  # MULTI / EXEC: one snapshot
+            version, values = pipe.get(f"{self._prefix}settings:version").hgetall(f"{self._prefix}settings").execute()
+        return int(version or 0), {name: json.loads(value) for name, value in values.items()}
+
+    def save_settings(self, values):
+        with self._redis.pipeline() as pipe:
+            pipe.hset(f"{self._prefix}settings", mapping={k: json.dumps(v) for k, v in values.items()})
+            pipe.incr(f"{self._prefix}settings:version")
+            return pipe.execute()[-1]
+
+    def buckets(self):
+        result = {}
+        for name in sorted(self._redis.smembers(f"{self._prefix}buckets")):
+            state = self._redis.hgetall(f"{self._prefix}bucket:{name}")
+            if state:
+                result[name] = {"tokens": round(float(state["tokens"]), 3), "updated": float(state["updated"])}
+        return result
+
+    def incr_counters(self, names):
+        with self._redis.pipeline() as pipe:
+            for name in names:
+                pipe.incr(f"{self._prefix}counter:{name}")
+            pipe.execute()
+
+    def read_counters(self, names):
+        values = self._redis.mget([f"{self._prefix}counter:{name}" for name in names])
+        return {name: int(value or 0) for name, value in zip(names, values)}
+
+
+_STORE_FACTORIES: dict[str, Callable[[str], CoordinationStore]] = {
+    "sqlite": lambda url: SqliteStore(url.removeprefix("sqlite:///")),
+    "redis": RedisStore,
+    "rediss": RedisStore,
+    "memory": lambda url: MemoryStore(),
+}
+_store: CoordinationStore | None = None
+_store_lock = threading.Lock()
+
+
+def register_store(scheme: str, factory: Callable[[str], CoordinationStore]):
+    """Make a store selectable with COORDINATION_URL=<scheme>://..."""
+    _STORE_FACTORIES[scheme] = factory
+
+
+def get_store() -> CoordinationStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            url = get_settings().coordination_url
+            scheme = url.partition(":")[0]
+            if scheme not in _STORE_FACTORIES:
+                raise ValueError(f"Unknown coordination store '{scheme}'")
+            _store = _STORE_FACTORIES[scheme](url)
+        return _store
+
+
+# ════════════════════════════════════════════════
+# Runtime settings
+# ════════════════════════════════════════════════
+
+_applied_version = 0
+_checked_at = 0.0
+_retry_at = 0.0  # after a store error: no check before this (monotonic)
+_settings_lock = threading.Lock()
+
+
+def validate_setting(name: str, value):
+    """Coerce a runtime setting to its declared type; ValueError if it can't be changed or is invalid."""
+    if name not in RUNTIME_SETTINGS:
+        raise ValueError(f"'{name}' cannot be changed at runtime")
+    return TypeAdapter(Settings.model_fields[name].annotation).validate_python(value)
+
+
+def settings_stale() -> bool:
+    """True once SETTINGS_REFRESH_INTERVAL (STORE_RETRY after a store error) has passed since the last check (no I/O)."""
+    now = time.monotonic()
+    return now - _checked_at >= get_settings().settings_refresh_interval and now >= _retry_at
+
+
+def refresh_settings(force: bool = False) -> int:
+    """
+    Apply runtime settings changed by any process to this process's `Settings`.
+    Costs one version read per SETTINGS_REFRESH_INTERVAL; values are reloaded only
+    when the version moved. While the store is unreachable the settings applied last
+    are kept and it is tried again every STORE_RETRY seconds. Returns the applied version.
+    """
+    global _applied_version, _checked_at, _retry_at
+    if not force and not settings_stale():
+        return _applied_version
+    with _settings_lock:
+        _checked_at = time.monotonic()
+        try:
+            store = get_store()
+            if store.settings_version() != _applied_version:
+                version, values = store.load_settings()
+                settings = get_settings()
+                for name, value in values.items():
+                    if name in RUNTIME_SETTINGS:
+                        setattr(settings, name, value)
+                _applied_version = version
+        except Exception as e:
+            if not _retry_at:
+                print(f"[COORDINATION ERROR] Store unavailable, keeping the current settings: {e}")
+            _retry_at = _checked_at + STORE_RETRY
+            return _applied_version
+        if _retry_at:
+            print("[COORDINATION] Store reachable again")
+            _retry_at = 0.0
+        return _applied_version
+
+
+def update_settings(values: dict) -> int:
+    """Validate and publish runtime settings to every process; applied here immediately."""
+    values = {name: validate_setting(name, value) for name, value in values.items()}
+    get_store().save_settings(values)
+    return refresh_settings(force=True)
+
+
+def coordination_stats() -> dict:
+    store = get_store()
+    return {
+        "store": type(store).__name__,
+        "settings_version": store.settings_version(),
+        "applied_settings_version": _applied_version,
+        "buckets": store.buckets(),
+    }
@@ -1,12 +1,26 @@
 """
-SQLite database setup using SQLAlchemy.
+Database setup using SQLAlchemy: SQLite by default, PostgreSQL for production.
+
+Two engines share one database: a synchronous one for background workers and
+sync helpers, and an async one (aiosqlite / asyncpg) for the async API endpoints
+so their queries don't block the event loop.
+
+On PostgreSQL both engines use a bounded connection pool (DB_POOL_SIZE connections
+plus at most DB_MAX_OVERFLOW more under bursts) that pings connections before reuse,
+so a database restart or an idle-timeout on the network costs a reconnect rather
+than a failed request.
 """
 
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from app.config import get_settings
 
+# Async driver for each backend when DATABASE_URL names the plain (sync) dialect
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
 
 class Base(DeclarativeBase):
     """Base class for all ORM models."""
@@ -21,20 +35,78 @@ def _get_engine():
     if url.startswith("sqlite"):
         db_path = url.replace("sqlite:///", "")
         os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
-        return create_engine(url, connect_args={"check_same_thread": False})
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+
+        event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+
+    return create_engine(url, **_pool_options())
+
+
+def _pool_options() -> dict:
+    settings = get_settings()
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets readers run alongside the campaign workers' writes;
+    # busy_timeout makes concurrent writers wait instead of failing.
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=10000")
+    cursor.close()
+
+
+def _get_async_engine():
+    url = make_url(get_settings().database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.get_driver_name() != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    if backend == "sqlite":
+        async_engine = create_async_engine(url)
+        event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+        return async_engine
 
-    return create_engine(url)
+    return create_async_engine(url, **_pool_options())
 
 
 engine = _get_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = _get_async_engine()
+# expire_on_commit=False: attributes stay loaded after commit, so responses can be
+# built from committed objects without an implicit (sync) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# pg_advisory_xact_lock key: one process at a time runs the startup schema step
+SCHEMA_LOCK_KEY = 0x5E47_1A11
+
 
 def create_tables():
-    """Create all tables. If schema has changed, drop and recreate (prototype only)."""
+    """
+    Create missing tables and indexes. On SQLite (prototype) a model column missing
+    from an existing table drops and recreates every table. Elsewhere that is only
+    reported (add the column with a migration); on PostgreSQL the whole step runs in
+    one transaction under an advisory lock, so workers starting together don't race.
+    """
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        _create_schema(conn)
+
+
+def _create_schema(conn: Connection):
     from sqlalchemy import inspect
 
-    inspector = inspect(engine)
+    inspector = inspect(conn)
     existing_tables = inspector.get_table_names()
 
     # Check if schema is outdated by comparing columns
@@ -44,15 +116,36 @@ def create_tables():
             existing_cols = {c["name"] for c in inspector.get_columns(table_name)}
             model_cols = {c.name for c in table.columns}
             if not model_cols.issubset(existing_cols):
-                needs_recreate = True
                 print(f"[DB] Schema change detected in '{table_name}': missing {model_cols - existing_cols}")
-                break
+                needs_recreate = True
+
+    from app.search import ensure_fts, drop_fts
 
-    if needs_recreate:
+    if needs_recreate and conn.dialect.name == "sqlite":
         print("[DB] Dropping all tables and recreating...")
-        Base.metadata.drop_all(bind=engine)
+        drop_fts(conn)
+        Base.metadata.drop_all(bind=conn)
+    elif needs_recreate:
+        print("[DB WARNING] Tables are left as they are; add the missing columns with a migration")
 
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=conn)
+
+    # create_all() skips existing tables, so add any indexes declared since they were created
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+    # Full-text index + sync triggers, expression indexes for segment keys (SQLite only);
+    # the row_data GIN index on PostgreSQL (tables created before it was declared)
+    from app.models import ROW_DATA_GIN_INDEX
+    from app.segments import create_segment_index
+
+    ensure_fts(conn)
+    if conn.dialect.name == "sqlite":
+        for key in get_settings().segment_index_keys:
+            create_segment_index(conn, key)
+    elif conn.dialect.name == "postgresql":
+        conn.execute(ROW_DATA_GIN_INDEX)
 
 
 def get_db():
@@ -62,3 +155,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """FastAPI dependency for async endpoints — yields an AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,162 @@
+"""
+Inbound email parsing for reply ingestion.
+
+Replies arrive either as raw MIME (the local SMTP / LMTP receiver, or providers that
+forward the raw message) or as a provider's parsed payload (SendGrid Inbound Parse,
+Mailgun routes, Postmark inbound JSON). Both become an `InboundEmail`, whose thread
+ids (In-Reply-To, then References newest first) identify the row we emailed. Quoted
+history and signatures are stripped so only the new text reaches reply extraction.
+"""
+
+import email
+import html
+import json
+import re
+from dataclasses import dataclass
+from email import policy
+from email.utils import parseaddr
+
+_MESSAGE_ID_RE = re.compile(r"<([^<>\s]+)>")
+_ON_WROTE_RE = re.compile(r"^\s*On\s.+\swrote:\s*$", re.IGNORECASE)  # Gmail, Apple Mail, Thunderbird
+_ORIGINAL_RE = re.compile(r"^\s*-{2,}\s*(Original Message|Forwarded message)\s*-{2,}", re.IGNORECASE)
+_OUTLOOK_RULE_RE = re.compile(r"^\s*_{10,}\s*$")
+_OUTLOOK_FROM_RE = re.compile(r"^\s*\**From:\**\s", re.IGNORECASE)
+_OUTLOOK_NEXT_RE = re.compile(r"^\s*\**(Sent|Date|To):\**\s", re.IGNORECASE)
+SIGNATURE_DELIMITERS = ("-- ", "--")  # RFC 3676 (the trailing space is often lost)
+
+# Provider payload fields, in order of preference (keys are matched case-insensitively)
+RAW_FIELDS = ("email", "body-mime", "rawemail")  # SendGrid "send raw", Mailgun MIME route
+STRIPPED_TEXT_FIELDS = ("strippedtextreply", "stripped-text")  # Postmark, Mailgun
+TEXT_FIELDS = ("text", "textbody", "body-plain", "plain")
+HTML_FIELDS = ("html", "htmlbody", "body-html")
+
+
+@dataclass
+class InboundEmail:
+    message_id: str | None  # without <>
+    in_reply_to: list[str]
+    references: list[str]
+    sender: str | None  # lowercased address
+    subject: str
+    text: str  # body with quoted history removed
+
+    @property
+    def thread_ids(self) -> list[str]:
+        """Message-IDs this email answers, most specific first."""
+        return list(dict.fromkeys(self.in_reply_to + self.references[::-1]))
+
+
+def message_ids(header) -> list[str]:
+    """The Message-IDs in a Message-ID / In-Reply-To / References header, without <>."""
+    if not header:
+        return []
+    value = str(header)
+    # Some clients drop the angle brackets
+    return _MESSAGE_ID_RE.findall(value) or [t.strip("<>,") for t in value.split() if "@" in t]
+
+
+def html_to_text(markup: str) -> str:
+    """Plain text of an HTML body, with quoted blocks (blockquote, gmail_quote) removed."""
+    markup = re.sub(r"(?is)<(style|script|head)\b.*?</\1>", "", markup)
+    markup = re.sub(r"(?is)<blockquote\b.*?</blockquote>", "", markup)
+    markup = re.sub(r'(?is)<div[^>]*class="[^"]*gmail_quote.*', "", markup)
+    markup = re.sub(r"(?i)<br\s*/?>|</(p|div|li|tr|h\d)>", "\n", markup)
+    return html.unescape(re.sub(r"<[^>]+>", "", markup))
+
+
+def strip_quoted(text: str) -> str:
+    """
+    The new part of a reply: stops at the quoted-history header ("On … wrote:", Outlook's
+    "From: / Sent:" block, "Original Message" separators) or the signature, and drops
+    ">"-quoted lines. Returns the whole text if nothing would be left.
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    kept = []
+    for i, line in enumerate(lines):
+        following = lines[i + 1] if i + 1 < len(lines) else ""
+        if (
+            line in SIGNATURE_DELIMITERS
+            or _ON_WROTE_RE.match(line)
+            or (line.lstrip().startswith("On ") and _ON_WROTE_RE.match(f"{line} {following}"))  # wrapped
+            or _ORIGINAL_RE.match(line)
+            or _OUTLOOK_RULE_RE.match(line)
+            or (_OUTLOOK_FROM_RE.match(line) and _OUTLOOK_NEXT_RE.match(following))
+        ):
+            break
+        if not line.lstrip().startswith(">"):
+            kept.append(line)
+    reply = "\n".join(kept).strip()
+    return reply or text.strip()
+
+
+def parse_mime(raw: bytes | str) -> InboundEmail:
+    """Parse a raw RFC 5322 message."""
+    if isinstance(raw, bytes):
+        msg = email.message_from_bytes(raw, policy=policy.default)
+    else:
+        msg = email.message_from_string(raw, policy=policy.default)
+
+    text = ""
+    body = msg.get_body(preferencelist=("plain", "html"))
+    if body is not None:
+        content = body.get_content()
+        text = html_to_text(content) if body.get_content_type() == "text/html" else content
+
+    return InboundEmail(
+        message_id=next(iter(message_ids(msg["Message-ID"])), None),
+        in_reply_to=message_ids(msg["In-Reply-To"]),
+        references=message_ids(msg["References"]),
+        sender=parseaddr(str(msg["From"] or ""))[1].lower() or None,
+        subject=str(msg["Subject"] or ""),
+        text=strip_quoted(text),
+    )
+
+
+def _payload_headers(fields: dict) -> dict[str, str]:
+    """Headers from a provider payload: a raw header block, [{"Name", "Value"}] or [[name, value]]."""
+    headers = fields.get("headers") or fields.get("message-headers")
+    if isinstance(headers, str):
+        stripped = headers.lstrip()
+        if stripped.startswith("["):
+            headers = json.loads(stripped)  # Mailgun sends its header list as a JSON string
+        else:
+            parsed = email.message_from_string(headers.strip() + "\n\n", policy=policy.default)
+            return {k.lower(): str(v) for k, v in parsed.items()}
+    pairs = []
+    for item in headers or []:
+        if isinstance(item, dict):
+            pairs.append((item.get("Name") or item.get("name"), item.get("Value") or item.get("value")))
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            pairs.append(tuple(item))
+    return {str(k).lower(): str(v) for k, v in pairs if k}
+
+
+def parse_provider_payload(payload: dict) -> InboundEmail:
+    """Parse a provider's inbound-email payload (JSON body or form fields)."""
+    fields = {str(k).lower(): v for k, v in payload.items()}
+    raw = next((fields[f] for f in RAW_FIELDS if isinstance(fields.get(f), str) and fields[f].strip()), None)
+    if raw:
+        return parse_mime(raw)
+
+    headers = _payload_headers(fields)
+
+    def header(name: str):
+        return fields.get(name) or headers.get(name)
+
+    text = next((fields[f] for f in STRIPPED_TEXT_FIELDS + TEXT_FIELDS if fields.get(f)), None)
+    if text is None:
+        markup = next((fields[f] for f in HTML_FIELDS if fields.get(f)), "")
+        text = html_to_text(markup)
+
+    sender = header("from") or fields.get("sender") or ""
+    if isinstance(sender, dict):  # Postmark FromFull
+        sender = sender.get("Email") or ""
+
+    return InboundEmail(
+        message_id=next(iter(message_ids(header("message-id"))), None),
+        in_reply_to=message_ids(header("in-reply-to")),
+        references=message_ids(header("references")),
+        sender=parseaddr(str(sender))[1].lower() or None,
+        subject=str(header("subject") or ""),
+        text=strip_quoted(str(text)),
+    )
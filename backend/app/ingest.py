@@ -0,0 +1,413 @@
+"""
+Data ingestion — contact detection, validation / normalization and bulk row writes.
+All per-column work is vectorized with pandas so large uploads stay fast.
+
+Every row gets a `row_key` (the campaign's key column, or a hash of the row's
+content) so later uploads of the same roster can be merged with `RowMerger`.
+"""
+
+import hashlib
+import io
+import json
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import JSON, bindparam, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from app.cache import mark_changed
+from app.models import DataRow
+from app.rowlog import replace_rows
+
+# Pragmatic syntax check (not full RFC 5322): local@domain.tld, no spaces
+EMAIL_RE = r"[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)+"
+
+INSERT_CHUNK_SIZE = 1000
+UPDATE_CHUNK_SIZE = 500
+
+
+# ────────────────────── column detection ──────────────────────
+
+def detect_email_column(columns: list[str]) -> str | None:
+    """Try to find the email column by name."""
+    for col in columns:
+        low = col.lower().strip()
+        if any(k in low for k in ["email", "mail", "e-mail"]):
+            return col
+    return None
+
+
+def detect_phone_column(columns: list[str]) -> str | None:
+    """Try to find the phone/WhatsApp column by name."""
+    # Priority 1: exact patterns
+    for col in columns:
+        low = col.lower().strip()
+        if any(k in low for k in ["phone", "mobile", "whatsapp", "cell"]):
+            return col
+
+    # Priority 2: columns with "contact" + number-like words (e.g., "Contact No.", "Contact Number")
+    for col in columns:
+        low = col.lower().strip()
+        if "contact" in low and any(k in low for k in ["no", "num", "number", "#"]):
+            return col
+        if "contact" in low:
+            return col
+
+    # Priority 3: "tel" or "telephone"
+    for col in columns:
+        low = col.lower().strip()
+        if any(k in low for k in ["tel", "telephone"]):
+            return col
+
+    return None
+
+
+# ────────────────────── normalization ──────────────────────
+
+def normalize_emails(values: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Strip + lowercase emails. Returns (normalized, is_valid)."""
+    emails = values.astype("string").str.strip().str.lower()
+    valid = emails.str.fullmatch(EMAIL_RE).fillna(False).astype(bool)
+    return emails.where(valid, None), valid
+
+
+def normalize_phones(values: pd.Series, default_country_code: str, national_length: int) -> tuple[pd.Series, pd.Series]:
+    """
+    Normalize phone numbers to E.164 ("+919876543210"). Returns (normalized, is_valid).
+
+    Handles numbers read as floats from Excel ("9876543210.0"), "+CC ..." and "00CC ..."
+    international prefixes, a leading trunk "0", and bare national numbers, which get
+    `default_country_code` prepended.
+    """
+    raw = values.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True)
+    digits = raw.str.replace(r"\D", "", regex=True)
+
+    international = raw.str.startswith("+").fillna(False)
+    double_zero = ~international & digits.str.startswith("00").fillna(False)
+    trunk = ~international & ~double_zero & digits.str.startswith("0").fillna(False)
+    national = ~international & ~double_zero & ~trunk & (digits.str.len() == national_length).fillna(False)
+
+    e164 = digits.copy()
+    e164[double_zero] = digits[double_zero].str.slice(2)
+    e164[trunk] = default_country_code + digits[trunk].str.slice(1)
+    e164[national] = default_country_code + digits[national]
+
+    # E.164: up to 15 digits; anything shorter than 8 can't be a routable mobile number
+    lengths = e164.str.len()
+    valid = ((lengths >= 8) & (lengths <= 15)).fillna(False).astype(bool)
+    return ("+" + e164).where(valid, None), valid
+
+
+# ────────────────────── row keys ──────────────────────
+
+def content_hash(row_data: dict) -> str:
+    """Hash of a row's content, independent of column order."""
+    raw = json.dumps(row_data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def row_key(row_data: dict, digest: str, key_column: str | None) -> str:
+    """The row's `key_column` value, or its content hash (no key column, or the cell is empty)."""
+    value = row_data.get(key_column) if key_column else None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # 1042 and 1042.0 (a column with blanks is read as float) are the same key
+    if value is None or not str(value).strip():
+        return digest
+    return str(value).strip()
+
+
+# ────────────────────── row building ──────────────────────
+
+def build_row_records(
+    df: pd.DataFrame,
+    campaign_id: int,
+    default_country_code: str,
+    national_length: int,
+    key_column: str | None = None,
+) -> tuple[list[dict], dict[str, int]]:
+    """
+    Turn a DataFrame into DataRow insert dicts, validating contacts on the way.
+
+    Rows with no usable contact get status "invalid"; rows whose recipient already
+    appeared earlier in the file get "duplicate". Neither is ever drafted or sent.
+    Returns (records, counts).
+    """
+    columns = [str(c) for c in df.columns]
+    df = df.set_axis(columns, axis=1)
+    email_col = detect_email_column(columns)
+    phone_col = detect_phone_column(columns)
+    if email_col == phone_col:
+        phone_col = None
+
+    empty = pd.Series([None] * len(df), index=df.index, dtype="string")
+    emails, email_ok = normalize_emails(df[email_col]) if email_col else (empty, empty.notna())
+    phones, phone_ok = (
+        normalize_phones(df[phone_col], default_country_code, national_length)
+        if phone_col else (empty, empty.notna())
+    )
+
+    # Prefer WhatsApp if the phone is valid, otherwise email
+    channel = pd.Series("email", index=df.index).where(~phone_ok, "whatsapp")
+    recipient = phones.where(phone_ok, emails)
+    valid = phone_ok | email_ok
+
+    status = pd.Series("pending", index=df.index)
+    status[~valid] = "invalid"
+    status[valid & recipient.duplicated(keep="first")] = "duplicate"
+
+    # Convert numpy types to native Python types (SQLite JSON can't serialize numpy)
+    row_dicts = df.astype(object).where(pd.notna(df), None).to_dict(orient="records")
+    row_dicts = [
+        {k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+        for row in row_dicts
+    ]
+
+    digests = [content_hash(row_data) for row_data in row_dicts]
+    records = [
+        {
+            "campaign_id": campaign_id,
+            "row_index": int(idx),
+            "row_data": row_data,
+            "row_key": row_key(row_data, digest, key_column),
+            "content_hash": digest,
+            "contact_email": email,
+            "contact_phone": phone,
+            "channel": ch,
+            "message_status": st,
+        }
+        for idx, row_data, digest, email, phone, ch, st in zip(
+            df.index,
+            row_dicts,
+            digests,
+            emails.astype(object).where(emails.notna(), None),
+            phones.astype(object).where(phones.notna(), None),
+            channel,
+            status,
+        )
+    ]
+
+    counts = status.value_counts()
+    return records, {
+        "total": len(records),
+        "pending": int(counts.get("pending", 0)),
+        "invalid": int(counts.get("invalid", 0)),
+        "duplicate": int(counts.get("duplicate", 0)),
+    }
+
+
+def write_rows(db: Session, records: list[dict]):
+    """
+    Bulk-insert DataRow dicts: one COPY on PostgreSQL, chunked executemany (no per-object
+    ORM overhead) elsewhere.
+    """
+    if records and db.get_bind().dialect.driver in COPY_DRIVERS:
+        _copy_rows(db, records)
+    else:
+        for start in range(0, len(records), INSERT_CHUNK_SIZE):
+            db.execute(insert(DataRow), records[start:start + INSERT_CHUNK_SIZE])
+    mark_changed(db, {r["campaign_id"] for r in records})
+
+
+# ────────────────────── COPY (PostgreSQL) ──────────────────────
+
+COPY_DRIVERS = ("psycopg", "psycopg2", "asyncpg")
+
+
+def _copy_values(records: list[dict]) -> tuple[list[str], list[tuple]]:
+    """(column names, value tuples) for COPY: Python-side defaults filled in, JSON as text."""
+    columns = [c for c in DataRow.__table__.columns if not c.primary_key]
+    rows = []
+    for record in records:
+        values = []
+        for column in columns:
+            if column.name in record:
+                value = record[column.name]
+            elif column.default is None:
+                value = None
+            else:
+                value = column.default.arg(None) if column.default.is_callable else column.default.arg
+            if value is not None and isinstance(column.type, JSON):
+                value = json.dumps(value)
+            values.append(value)
+        rows.append(tuple(values))
+    return [c.name for c in columns], rows
+
+
+def _copy_text(value) -> str:
+    """A value in COPY's text format."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(db: Session, records: list[dict]):
+    """
+    Stream rows into data_rows with COPY ... FROM STDIN, in the session's transaction.
+    Several times faster than INSERTs on large uploads: no per-statement parsing, planning
+    or round trips. Works from sync sessions (psycopg, psycopg2) and from AsyncSession.run_sync
+    (asyncpg, whose coroutine is awaited on the calling greenlet).
+    """
+    columns, rows = _copy_values(records)
+    driver = db.get_bind().dialect.driver
+    raw = db.connection().connection.driver_connection
+    if driver == "asyncpg":
+        await_only(raw.copy_records_to_table(DataRow.__tablename__, records=rows, columns=columns))
+        return
+
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    sql = f"COPY {DataRow.__tablename__} ({', '.join(quote(c) for c in columns)}) FROM STDIN"
+    with raw.cursor() as cursor:
+        if driver == "psycopg":
+            with cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            buffer = io.StringIO("".join("\t".join(_copy_text(v) for v in row) + "\n" for row in rows))
+            cursor.copy_expert(sql, buffer)
+
+
+# ────────────────────── incremental upserts ──────────────────────
+
+# Columns an upload replaces on a changed row, and the per-row send / reply / review state it clears
+SYNCED_COLUMNS = ("row_data", "content_hash", "contact_email", "contact_phone", "channel", "message_status")
+# row_data itself is logged as a `replaces` row update (app/rowlog.py) and applied at once
+RESET_ON_CHANGE = {
+    "outbound_message": None, "draft_model": None, "email_message_id": None,
+    "attempt_count": 0, "next_attempt_at": None, "last_error": None, "claimed_at": None,
+    "reply_text": None, "confidence": None, "reply_message_id": None,
+    "needs_review": False, "suggested_update": None,
+}
+
+
+def _recipient(channel: str | None, email: str | None, phone: str | None) -> str | None:
+    return phone if channel == "whatsapp" else email
+
+
+def rekey_rows(db: Session, campaign_id: int, key_column: str):
+    """Recompute a campaign's row keys from `key_column` (first keyed upload of a hash-keyed campaign). Caller commits."""
+    table = DataRow.__table__
+    stmt = update(table).where(table.c.id == bindparam("row_id")).values(row_key=bindparam("new_key"))
+    rows = db.execute(
+        select(table.c.id, table.c.row_data, table.c.content_hash).where(table.c.campaign_id == campaign_id)
+    ).all()
+    keys = [
+        {"row_id": row_id, "new_key": row_key(row_data, digest or content_hash(row_data), key_column)}
+        for row_id, row_data, digest in rows
+    ]
+    for start in range(0, len(keys), UPDATE_CHUNK_SIZE):
+        db.execute(stmt, keys[start:start + UPDATE_CHUNK_SIZE])
+
+
+class RowMerger:
+    """
+    Merges uploads of a campaign's roster (build_row_records output) by row_key, one or
+    more chunks at a time; existing rows are read once. Caller commits.
+
+    - unchanged rows (same content hash) are skipped without any write,
+    - changed rows take the new data and go back to "pending" (or "invalid" / "duplicate")
+      with their draft, send, reply and review state cleared, so they are drafted again,
+    - new rows are inserted after the existing ones,
+    - a new or changed row whose recipient belongs to an existing row not (yet) in this
+      upload, or to a row written from an earlier chunk, is a "duplicate".
+    Existing rows missing from the upload are left as they are.
+    """
+
+    def __init__(self, db: Session, campaign_id: int):
+        self.db = db
+        self.campaign_id = campaign_id
+        table = DataRow.__table__
+        self._update = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(
+                **{c: bindparam(f"new_{c}") for c in SYNCED_COLUMNS},
+                applied_update_id=bindparam("new_applied_update_id"),
+                **RESET_ON_CHANGE,
+            )
+        )
+        self._existing: dict[str, tuple[int, str | None, str | None]] = {}  # key -> (id, content hash, recipient)
+        self._unkeyed_recipients = set()
+        self._claimed = set()  # recipients of rows this merge wrote
+        self._seen = set()
+        self._next_index = 0
+        self.counts = dict.fromkeys(
+            ("total", "inserted", "updated", "unchanged", "duplicate_keys", "pending", "invalid", "duplicate"), 0,
+        )
+        for row_id, key, digest, index, channel, email, phone in db.execute(
+            select(
+                table.c.id, table.c.row_key, table.c.content_hash, table.c.row_index,
+                table.c.channel, table.c.contact_email, table.c.contact_phone,
+            ).where(table.c.campaign_id == campaign_id)
+        ):
+            self._next_index = max(self._next_index, index + 1)
+            if key is None:
+                self._unkeyed_recipients.add(_recipient(channel, email, phone))
+            else:
+                self._existing[key] = (row_id, digest, _recipient(channel, email, phone))
+
+    def merge(self, records: list[dict]):
+        inserts, updates = [], []
+        for record in records:
+            key = record["row_key"]
+            if key in self._seen:
+                self.counts["duplicate_keys"] += 1  # the first row with a key wins
+                continue
+            self._seen.add(key)
+            match = self._existing.get(key)
+            if match is None:
+                inserts.append(record)
+            elif match[1] == record["content_hash"]:
+                self.counts["unchanged"] += 1
+            else:
+                updates.append({"row_id": match[0], **{f"new_{c}": record[c] for c in SYNCED_COLUMNS}})
+
+        taken = self._claimed | self._unkeyed_recipients | {
+            recipient for key, (_, _, recipient) in self._existing.items() if key not in self._seen
+        }
+        for record in inserts:
+            record["row_index"] = self._next_index
+            self._next_index += 1
+            recipient = _recipient(record["channel"], record["contact_email"], record["contact_phone"])
+            if record["message_status"] == "pending" and recipient in taken:
+                record["message_status"] = "duplicate"
+        for u in updates:
+            recipient = _recipient(u["new_channel"], u["new_contact_email"], u["new_contact_phone"])
+            if u["new_message_status"] == "pending" and recipient in taken:
+                u["new_message_status"] = "duplicate"
+        write_rows(self.db, inserts)
+
+        logged = replace_rows(self.db, self.campaign_id, {u["row_id"]: u["new_row_data"] for u in updates})
+        for u in updates:
+            u["new_applied_update_id"] = logged[u["row_id"]]
+        for start in range(0, len(updates), UPDATE_CHUNK_SIZE):
+            self.db.execute(self._update, updates[start:start + UPDATE_CHUNK_SIZE])
+        if updates:
+            mark_changed(self.db, {self.campaign_id})
+
+        written = [
+            (r["message_status"], _recipient(r["channel"], r["contact_email"], r["contact_phone"])) for r in inserts
+        ] + [
+            (u["new_message_status"], _recipient(u["new_channel"], u["new_contact_email"], u["new_contact_phone"]))
+            for u in updates
+        ]
+        self._claimed.update(recipient for status, recipient in written if status == "pending")
+        self.counts["total"] += len(records)
+        self.counts["inserted"] += len(inserts)
+        self.counts["updated"] += len(updates)
+        for status, _ in written:
+            self.counts[status] += 1
+
+    def result(self) -> dict[str, int]:
+        return {**self.counts, "missing": sum(1 for key in self._existing if key not in self._seen)}
+
+
+def upsert_rows(db: Session, campaign_id: int, records: list[dict]) -> dict[str, int]:
+    """Merge a whole upload into the campaign (see RowMerger). Caller commits."""
+    merger = RowMerger(db, campaign_id)
+    merger.merge(records)
+    return merger.result()
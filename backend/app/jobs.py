@@ -0,0 +1,61 @@
+"""
+In-memory registry for long-running background jobs (bulk imports etc.).
+Jobs are per-process and not persisted — clients poll them by id while they run.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+MAX_JOBS = 200  # oldest jobs are forgotten beyond this
+MAX_ERRORS = 100  # per job, to keep progress responses small
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    total: int = 0
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    status: str = "queued"  # queued | running | completed | failed
+    errors: list[dict] = field(default_factory=list)
+    result: dict = field(default_factory=dict)  # kind-specific summary, set when the job finishes
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: datetime | None = None
+
+    def record(self, ok: bool, error: dict | None = None):
+        with _lock:
+            self.processed += 1
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+                if error and len(self.errors) < MAX_ERRORS:
+                    self.errors.append(error)
+
+    def finish(self, status: str = "completed"):
+        with _lock:
+            self.status = status
+            self.finished_at = datetime.now(timezone.utc)
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def create_job(kind: str, total: int = 0) -> Job:
+    job = Job(id=uuid.uuid4().hex, kind=kind, total=total)
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+    return job
+
+
+def get_job(job_id: str) -> Job | None:
+    with _lock:
+        return _jobs.get(job_id)
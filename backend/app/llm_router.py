@@ -0,0 +1,209 @@
+"""
+Latency-aware LLM router with hedged requests and model failover.
+
+Every call goes to the requested model first. If it hasn't answered by the time its
+observed latency percentile (p95 by default) has passed since it was admitted by the
+limiter (time spent queued for a slot or a rate token doesn't count: hedging a queued
+call would only add to the queue), a duplicate "hedge" request
+is sent to the fastest other model in `available_models`; whichever answers first wins
+and the other request is cancelled. Errors fail over to the next model.
+
+Calls are admitted through the limiter's priority lanes (app/ratelimit.py): reply
+processing runs in the interactive lane, drafting in the bulk lane.
+
+Token usage is reported for the winning call only: a cancelled hedge or a failed
+attempt returns no usage metadata, so its tokens (if billed) can't be attributed.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from app.config import get_settings
+from app.profiling import track
+from app.ratelimit import INTERACTIVE, get_llm_limiter
+
+MIN_SAMPLES = 20  # latency samples needed before a model's percentiles are trusted
+
+
+@dataclass
+class RoutedResponse:
+    content: str
+    model: str
+    latency: float
+    hedged: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class LatencyTracker:
+    """Rolling per-model latency samples and call counters."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, model: str, key: str):
+        counters = self._counters.setdefault(model, {"calls": 0, "errors": 0, "hedges": 0, "hedge_wins": 0})
+        counters[key] += 1
+
+    def record(self, model: str, latency: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(latency)
+            self._count(model, "calls")
+
+    def record_event(self, model: str, event: str):
+        """event: "errors" | "hedges" | "hedge_wins"."""
+        with self._lock:
+            self._count(model, event)
+
+    def percentile(self, model: str, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = set(self._samples) | set(self._counters)
+            counters = {m: dict(self._counters.get(m, {})) for m in models}
+        return {
+            m: {**counters[m], "p50": self.percentile(m, 50), "p95": self.percentile(m, 95)}
+            for m in sorted(models)
+        }
+
+
+class LLMRouter:
+    def __init__(self):
+        settings = get_settings()
+        self.tracker = LatencyTracker(window=settings.llm_latency_window)
+
+    def _candidates(self, model: str) -> list[str]:
+        """Requested model first, then the other available models, fastest (p50) first."""
+        settings = get_settings()
+        others = [m for m in settings.available_models if m != model]
+        unknown = float("inf")
+        others.sort(key=lambda m: self.tracker.percentile(m, 50) or unknown)
+        return [model] + others
+
+    def _hedge_delay(self, model: str) -> float:
+        settings = get_settings()
+        observed = self.tracker.percentile(model, settings.llm_hedge_percentile)
+        if observed is None:
+            return settings.llm_hedge_default_delay
+        return max(settings.llm_hedge_min_delay, observed)
+
+    async def _call(
+        self, model: str, messages, lane: str, admitted: asyncio.Event | None = None,
+    ) -> tuple[str, float, dict]:
+        """One admitted call; sets `admitted` once the limiter lets it through."""
+        from app.agent import _get_llm  # local import to avoid circular
+
+        limiter = get_llm_limiter()
+        await limiter.acquire(lane)
+        if admitted is not None:
+            admitted.set()
+        try:
+            start = time.monotonic()
+            response = await _get_llm(model).ainvoke(messages)
+            return response.content, time.monotonic() - start, response.usage_metadata or {}
+        finally:
+            limiter.release(lane)
+
+    async def ainvoke(self, messages, model: str | None = None, lane: str = INTERACTIVE) -> RoutedResponse:
+        settings = get_settings()
+        candidates = self._candidates(model or settings.gemini_model)
+        primary, fallbacks = candidates[0], candidates[1:]
+        hedge_enabled = settings.llm_hedging_enabled
+
+        admitted = asyncio.Event()
+        tasks: dict[asyncio.Task, str] = {asyncio.create_task(self._call(primary, messages, lane, admitted)): primary}
+        admitted_at: float | None = None
+        hedged = False
+        last_error: Exception | None = None
+
+        try:
+            while tasks:
+                can_hedge = hedge_enabled and not hedged and fallbacks
+                if can_hedge and admitted_at is None:
+                    # Still queued in the limiter: wait for admission (or an early result), never hedge
+                    waiter = asyncio.create_task(admitted.wait())
+                    done, _ = await asyncio.wait([*tasks, waiter], return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    done.discard(waiter)
+                    if admitted.is_set():
+                        admitted_at = time.monotonic()
+                    if not done:
+                        continue
+                else:
+                    timeout = max(0.0, admitted_at + self._hedge_delay(primary) - time.monotonic()) if can_hedge else None
+                    done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is past its latency percentile — hedge on the next model
+                    hedged = True
+                    hedge_model = fallbacks.pop(0)
+                    self.tracker.record_event(hedge_model, "hedges")
+                    print(f"[LLM] {primary} slower than p{settings.llm_hedge_percentile:g}, hedging with {hedge_model}")
+                    tasks[asyncio.create_task(self._call(hedge_model, messages, lane))] = hedge_model
+                    continue
+
+                for task in done:
+                    task_model = tasks.pop(task)
+                    if task.exception() is None:
+                        content, latency, usage = task.result()
+                        self.tracker.record(task_model, latency)
+                        if task_model != primary:
+                            self.tracker.record_event(task_model, "hedge_wins")
+                        return RoutedResponse(
+                            content=content, model=task_model, latency=latency, hedged=hedged,
+                            input_tokens=usage.get("input_tokens", 0),
+                            output_tokens=usage.get("output_tokens", 0),
+                        )
+
+                    last_error = task.exception()
+                    self.tracker.record_event(task_model, "errors")
+                    print(f"[LLM ERROR] {task_model}: {last_error}")
+
+                # Everything in flight failed — fail over to the next model (its own admission restarts the hedge clock)
+                if not tasks and fallbacks:
+                    next_model = fallbacks.pop(0)
+                    admitted, admitted_at = asyncio.Event(), None
+                    tasks[asyncio.create_task(self._call(next_model, messages, lane, admitted))] = next_model
+        finally:
+            # Cancel the loser(s)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        raise last_error or RuntimeError("No model available")
+
+    def invoke(self, messages, model: str | None = None, lane: str = INTERACTIVE) -> RoutedResponse:
+        """Synchronous wrapper — safe to call from worker threads and from async endpoints."""
+        with track("llm"):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.ainvoke(messages, model, lane))
+            # Already inside an event loop (sync helper called from an async endpoint)
+            return _sync_bridge.submit(asyncio.run, self.ainvoke(messages, model, lane)).result()
+
+
+_sync_bridge = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-bridge")
+_router: LLMRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter()
+        return _router
@@ -0,0 +1,151 @@
+"""
+Local SMTP / LMTP receiver for inbound email (development and tests).
+
+A minimal asyncio implementation of the RFC 5321 / RFC 2033 subset a mail client or
+MTA needs to deliver a message: HELO / EHLO / LHLO, MAIL, RCPT, DATA, RSET, NOOP,
+QUIT. No TLS or AUTH. It listens only when INBOUND_SMTP_PORT is set, and every
+delivered message goes through the same ingestion as /webhooks/email.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import get_settings
+
+MAX_MESSAGE_BYTES = 10 * 1024 * 1024
+MAX_LINE_BYTES = 64 * 1024
+HOSTNAME = "sentinalgrid.local"
+
+_server: "MailServer | None" = None
+
+
+class MailServer:
+    """Accepts messages over SMTP or LMTP and passes each raw message to `handler`."""
+
+    def __init__(self, handler: Callable[[bytes], Awaitable[None]], host: str, port: int):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self._server: asyncio.base_events.Server | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._session, self.host, self.port, limit=MAX_LINE_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]  # resolves port 0 in tests
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def reply(*lines: str):
+            writer.write("".join(f"{line}\r\n" for line in lines).encode())
+
+        lmtp = False
+        sender, recipients = None, []
+        reply(f"220 {HOSTNAME} ready")
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    return
+                command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+                command = command.upper()
+
+                if command in ("HELO", "EHLO", "LHLO"):
+                    lmtp = command == "LHLO"
+                    sender, recipients = None, []
+                    if command == "HELO":
+                        reply(f"250 {HOSTNAME}")
+                    else:
+                        reply(f"250-{HOSTNAME}", f"250-SIZE {MAX_MESSAGE_BYTES}", "250 8BITMIME")
+                elif command == "MAIL":
+                    sender, recipients = argument, []
+                    reply("250 OK")
+                elif command == "RCPT":
+                    if sender is None:
+                        reply("503 MAIL first")
+                    else:
+                        recipients.append(argument)
+                        reply("250 OK")
+                elif command == "DATA":
+                    if not recipients:
+                        reply("503 RCPT first")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    status = await self._receive(reader)
+                    # LMTP answers once per recipient, SMTP once per message
+                    reply(*([status] * (len(recipients) if lmtp else 1)))
+                    sender, recipients = None, []
+                elif command == "RSET":
+                    sender, recipients = None, []
+                    reply("250 OK")
+                elif command == "NOOP":
+                    reply("250 OK")
+                elif command == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    return
+                else:
+                    reply("502 Command not implemented")
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            return
+        finally:
+            writer.close()
+
+    async def _receive(self, reader: asyncio.StreamReader) -> str:
+        """Read one message up to the lone "." line and deliver it. Returns the status line."""
+        chunks, size = [], 0
+        while True:
+            line = await reader.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            if line.startswith(b".."):
+                line = line[1:]  # dot-stuffing
+            size += len(line)
+            if size <= MAX_MESSAGE_BYTES:
+                chunks.append(line)
+        if size > MAX_MESSAGE_BYTES:
+            return "552 Message too large"
+        try:
+            await self.handler(b"".join(chunks))
+        except Exception as e:
+            print(f"[MAIL ERROR] Delivery failed: {e}")
+            return "451 Delivery failed, try again later"
+        return "250 OK"
+
+
+async def ingest_raw_email(raw: bytes):
+    """Default handler: parse the message and run it through reply ingestion."""
+    from app.database import AsyncSessionLocal  # local imports to avoid circular
+    from app.inbound_email import parse_mime
+    from app.routers.webhooks import ingest_email
+
+    inbound = await run_in_threadpool(parse_mime, raw)
+    async with AsyncSessionLocal() as db:
+        result = await ingest_email(db, inbound)
+    print(f"[MAIL] <{inbound.message_id}> from {inbound.sender}: {result['status']}")
+
+
+async def start_mail_server() -> MailServer | None:
+    """Start the local receiver if INBOUND_SMTP_PORT is set."""
+    global _server
+    settings = get_settings()
+    if settings.inbound_smtp_port <= 0 or _server is not None:
+        return _server
+    _server = MailServer(ingest_raw_email, settings.inbound_smtp_host, settings.inbound_smtp_port)
+    await _server.start()
+    print(f"[MAIL] Listening for SMTP / LMTP on {settings.inbound_smtp_host}:{_server.port}")
+    return _server
+
+
+async def stop_mail_server():
+    global _server
+    if _server is not None:
+        await _server.stop()
+        _server = None
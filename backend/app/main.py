@@ -3,22 +3,53 @@ FastAPI application entry point.
 """
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
-from app.database import create_tables
+from app.coordination import refresh_settings, settings_stale
+from app.database import create_tables, async_engine
+from app.scheduler import shutdown_scheduler
+from app.archive import start_compactor, stop_compactor
+from app.retry import start_retry_sweeper, stop_retry_sweeper
+from app.rowlog import start_row_compactor, stop_row_compactor
+from app.sources import start_source_syncer, stop_source_syncer
+from app.mailserver import start_mail_server, stop_mail_server
+from app.profiling import instrument_request
 from app.auth import router as auth_router
 from app.routers.campaigns import router as campaigns_router
-from app.routers.webhooks import router as webhooks_router
+from app.routers.webhooks import router as webhooks_router, reply_coalescer
 from app.routers.settings import router as settings_router
+from app.routers.reviews import router as reviews_router
+from app.routers.admin import router as admin_router
+from app.routers.search import router as search_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Create DB tables on startup."""
+    """
+    Create DB tables, load runtime settings, start archive and row log compaction, the
+    retry sweeper, scheduled source syncs, the local mail receiver and the reply burst
+    sweeper; stop them on shutdown.
+    """
     create_tables()
+    refresh_settings(force=True)
+    start_compactor()
+    start_row_compactor()
+    start_retry_sweeper()
+    start_source_syncer()
+    await start_mail_server()
+    reply_coalescer.start()
     yield
+    await stop_mail_server()
+    await reply_coalescer.drain()
+    stop_source_syncer()
+    stop_retry_sweeper()
+    stop_row_compactor()
+    stop_compactor()
+    shutdown_scheduler()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -38,11 +69,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ── Runtime settings changed by other worker processes ──
+@app.middleware("http")
+async def settings_refresh_middleware(request: Request, call_next):
+    if settings_stale():  # at most one store read per SETTINGS_REFRESH_INTERVAL
+        await run_in_threadpool(refresh_settings)
+    return await call_next(request)
+
+
+# ── Per-request timings, slow-request log, route-scoped profiling ──
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    return await instrument_request(request, call_next)
+
+
 # ── Routers ──
 app.include_router(auth_router)
 app.include_router(campaigns_router)
 app.include_router(webhooks_router)
 app.include_router(settings_router)
+app.include_router(reviews_router)
+app.include_router(admin_router)
+app.include_router(search_router)
 
 
 @app.get("/health", tags=["system"])
@@ -1,58 +1,102 @@
 """
 Messaging service — Email (SMTP) + WhatsApp (WAHA).
+
+`deliver_*` raise SendError (flagged transient or permanent, for retries);
+`send_*` return True / False and log failures.
 """
 
 import asyncio
 from email.message import EmailMessage
+from email.utils import make_msgid
 import aiosmtplib
 import httpx
 
 from app.config import get_settings
+from app.profiling import track
+from app.ratelimit import get_waha_bucket
+from app.retry import TRANSIENT_HTTP_STATUS
+
+
+class SendError(Exception):
+    """A message was not delivered. `transient` failures may succeed if retried."""
+
+    def __init__(self, message: str, transient: bool):
+        super().__init__(message)
+        self.transient = transient
+
+
+def _run_sync(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
 
 
 # ════════════════════════════════════════════════
 # EMAIL (Gmail SMTP)
 # ════════════════════════════════════════════════
 
-async def send_email(to: str, subject: str, body: str) -> bool:
-    """Send a plain-text email via SMTP."""
+def new_message_id() -> str:
+    """A unique Message-ID (with angle brackets) for an outbound email."""
+    settings = get_settings()
+    domain = settings.email_domain or settings.smtp_user.rpartition("@")[2] or "sentinalgrid.local"
+    return make_msgid(domain=domain)
+
+
+async def deliver_email(to: str, subject: str, body: str, message_id: str | None = None):
+    """Send a plain-text email via SMTP. Replies can be threaded back through `message_id`."""
     settings = get_settings()
 
     msg = EmailMessage()
     msg["From"] = settings.smtp_user
     msg["To"] = to
     msg["Subject"] = subject
+    msg["Message-ID"] = message_id or new_message_id()
     msg.set_content(body)
 
     try:
-        await aiosmtplib.send(
-            msg,
-            hostname=settings.smtp_host,
-            port=settings.smtp_port,
-            username=settings.smtp_user,
-            password=settings.smtp_pass,
-            start_tls=True,
-        )
+        with track("transport"):
+            await aiosmtplib.send(
+                msg,
+                hostname=settings.smtp_host,
+                port=settings.smtp_port,
+                # No credentials → no AUTH (e.g. a local relay or INBOUND_SMTP_PORT)
+                username=settings.smtp_user if settings.smtp_pass else None,
+                password=settings.smtp_pass or None,
+                start_tls=settings.smtp_starttls,
+            )
+    # SMTP 4xx replies are temporary (greylisting, mailbox busy), 5xx are final
+    except aiosmtplib.SMTPRecipientsRefused as e:
+        raise SendError(str(e), transient=all(400 <= r.code < 500 for r in e.recipients)) from e
+    except aiosmtplib.SMTPResponseException as e:
+        raise SendError(f"{e.code} {e.message}", transient=400 <= e.code < 500) from e
+    except (OSError, asyncio.TimeoutError) as e:  # connection refused / dropped, timeouts
+        raise SendError(str(e) or type(e).__name__, transient=True) from e
+    except aiosmtplib.SMTPException as e:
+        raise SendError(str(e), transient=False) from e
+
+
+async def send_email(to: str, subject: str, body: str, message_id: str | None = None) -> bool:
+    """Send a plain-text email via SMTP; False (logged) if it failed."""
+    try:
+        await deliver_email(to, subject, body, message_id)
         return True
     except Exception as e:
         print(f"[EMAIL ERROR] Failed to send to {to}: {e}")
         return False
 
 
-def send_email_sync(to: str, subject: str, body: str) -> bool:
+def send_email_sync(to: str, subject: str, body: str, message_id: str | None = None) -> bool:
     """Synchronous wrapper for send_email (used in BackgroundTasks)."""
-    loop = asyncio.new_event_loop()
-    try:
-        return loop.run_until_complete(send_email(to, subject, body))
-    finally:
-        loop.close()
+    return _run_sync(send_email(to, subject, body, message_id))
 
 
 # ════════════════════════════════════════════════
 # WHATSAPP via WAHA (self-hosted HTTP API)
 # ════════════════════════════════════════════════
 
-def send_whatsapp(to: str, body: str) -> bool:
+def deliver_whatsapp(to: str, body: str):
     """
     Send a WhatsApp message via WAHA API.
 
@@ -60,8 +104,8 @@ def send_whatsapp(to: str, body: str) -> bool:
         to: Phone number with country code (e.g. "919876543210")
         body: Message text
 
-    Returns:
-        True if sent successfully, False otherwise.
+    Raises:
+        SendError: transient for network errors, 429 and 5xx; permanent otherwise.
     """
     settings = get_settings()
 
@@ -79,13 +123,24 @@ def send_whatsapp(to: str, body: str) -> bool:
         "session": settings.waha_session,
     }
 
+    get_waha_bucket().acquire()
     try:
-        resp = httpx.post(url, json=payload, headers=headers, timeout=30)
-        if resp.status_code == 201 or resp.status_code == 200:
-            return True
-        else:
-            print(f"[WAHA ERROR] Status {resp.status_code}: {resp.text}")
-            return False
+        with track("transport"):
+            resp = httpx.post(url, json=payload, headers=headers, timeout=30)
+    except httpx.TransportError as e:  # connect errors, timeouts
+        raise SendError(str(e) or type(e).__name__, transient=True) from e
+    if resp.status_code not in (200, 201):
+        raise SendError(
+            f"WAHA status {resp.status_code}: {resp.text}",
+            transient=resp.status_code in TRANSIENT_HTTP_STATUS or resp.status_code >= 500,
+        )
+
+
+def send_whatsapp(to: str, body: str) -> bool:
+    """Send a WhatsApp message via WAHA; False (logged) if it failed."""
+    try:
+        deliver_whatsapp(to, body)
+        return True
     except Exception as e:
         print(f"[WAHA ERROR] Failed to send to {to}: {e}")
         return False
@@ -95,17 +150,20 @@ def send_whatsapp(to: str, body: str) -> bool:
 # UNIFIED SEND (auto-detect channel)
 # ════════════════════════════════════════════════
 
-def send_message(to: str, body: str, channel: str = "email", subject: str = "Message") -> bool:
+def deliver_message(
+    to: str, body: str, channel: str = "email", subject: str = "Message", message_id: str | None = None
+):
     """
-    Send a message via the appropriate channel.
+    Send a message via the appropriate channel. Raises SendError if it wasn't delivered.
 
     Args:
         to: Recipient (email address or phone number)
         body: Message body
         channel: "email" or "whatsapp"
         subject: Email subject (ignored for WhatsApp)
+        message_id: Email Message-ID header (ignored for WhatsApp)
     """
     if channel == "whatsapp":
-        return send_whatsapp(to, body)
+        deliver_whatsapp(to, body)
     else:
-        return send_email_sync(to, subject, body)
+        _run_sync(deliver_email(to, subject, body, message_id))
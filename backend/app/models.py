@@ -1,15 +1,48 @@
 """
-ORM models for Campaign and DataRow.
+ORM models for Campaign, DataRow, the row update log, buffered reply fragments,
+the archived (cold) row tier and LLM usage.
+
+Timestamps are timezone-aware and row_data is JSONB on PostgreSQL (see database.py);
+SQLite stores both as before.
 """
 
+import enum
 from datetime import datetime, timezone
 from sqlalchemy import (
-    Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, JSON
+    Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, JSON, Index, Enum, LargeBinary, DDL, event
 )
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
+class CampaignStatus(str, enum.Enum):
+    DRAFT = "draft"
+    RUNNING = "running"
+    PAUSED = "paused"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+# Allowed status changes. Re-launching a finished campaign picks up rows that are pending again.
+CAMPAIGN_TRANSITIONS = {
+    CampaignStatus.DRAFT: {CampaignStatus.RUNNING, CampaignStatus.CANCELLED},
+    CampaignStatus.RUNNING: {
+        CampaignStatus.PAUSED, CampaignStatus.COMPLETED, CampaignStatus.CANCELLED, CampaignStatus.FAILED,
+    },
+    CampaignStatus.PAUSED: {CampaignStatus.RUNNING, CampaignStatus.COMPLETED, CampaignStatus.CANCELLED},
+    CampaignStatus.COMPLETED: {CampaignStatus.RUNNING},
+    CampaignStatus.CANCELLED: {CampaignStatus.RUNNING},
+    CampaignStatus.FAILED: {CampaignStatus.RUNNING},
+}
+
+
+class InvalidTransition(ValueError):
+    """Raised when a campaign status change is not allowed by CAMPAIGN_TRANSITIONS."""
+
+
 class Campaign(Base):
     __tablename__ = "campaigns"
 
@@ -17,13 +50,47 @@ class Campaign(Base):
     user_email = Column(String, nullable=False, index=True)
     name = Column(String, nullable=False)
     master_prompt = Column(Text, nullable=False)
-    status = Column(String, default="draft")  # draft | running | completed | failed
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc),
+    status = Column(
+        Enum(CampaignStatus, native_enum=False, length=16, values_callable=lambda e: [m.value for m in e]),
+        default=CampaignStatus.DRAFT,
+        nullable=False,
+    )
+    weight = Column(Float, default=1.0)  # share of the owner's scheduler capacity
+    send_rate = Column(Float, nullable=True)  # rows/sec; None = settings.campaign_send_rate
+    max_concurrency = Column(Integer, nullable=True)  # in-flight rows; None = no per-campaign cap
+    drafting_mode = Column(String, default="interactive")  # interactive | batch
+    batch_id = Column(String, nullable=True)  # last batch drafting job (batch mode)
+    segment = Column(Text, nullable=True)  # row_data filter of the last launch (see app/segments.py)
+    archived_at = Column(DateTime(timezone=True), nullable=True)  # rows moved to archived_row_chunks (see app/archive.py)
+    budget_usd = Column(Float, nullable=True)  # LLM spend limit; reaching it pauses the campaign
+    spent_usd = Column(Float, default=0.0, nullable=False)  # running total of llm_usage.cost_usd
+    key_column = Column(String, nullable=True)  # row_data column identifying rows in syncs; None = content hash
+    source_url = Column(Text, nullable=True)  # SQLAlchemy URL of an external SQL source (see app/sources.py)
+    source_query = Column(Text, nullable=True)
+    watermark_column = Column(String, nullable=True)  # source column for incremental syncs; None = full re-read
+    watermark = Column(Text, nullable=True)  # highest watermark_column value synced so far (encoded)
+    sync_interval = Column(Float, nullable=True)  # seconds between scheduled syncs; None = on request only
+    next_sync_at = Column(DateTime(timezone=True), nullable=True)
+    synced_at = Column(DateTime(timezone=True), nullable=True)  # end of the last successful sync
+    run_owner = Column(String, nullable=True)  # process whose scheduler holds the campaign's live run
+    run_heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # refreshed by that run's status syncs
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
                         onupdate=lambda: datetime.now(timezone.utc))
 
     rows = relationship("DataRow", back_populates="campaign", cascade="all, delete-orphan")
 
+    @property
+    def source(self) -> str | None:
+        """The source URL with its password masked."""
+        return make_url(self.source_url).render_as_string(hide_password=True) if self.source_url else None
+
+    def transition(self, new_status: CampaignStatus):
+        """Move to `new_status`, enforcing the campaign state machine."""
+        if new_status not in CAMPAIGN_TRANSITIONS[self.status]:
+            raise InvalidTransition(f"Cannot go from '{self.status.value}' to '{new_status.value}'")
+        self.status = new_status
+
     def __repr__(self):
         return f"<Campaign {self.id}: {self.name}>"
 
@@ -35,8 +102,11 @@ class DataRow(Base):
     campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False, index=True)
     row_index = Column(Integer, nullable=False)
 
-    # Original row data stored as JSON
-    row_data = Column(JSON, nullable=False)
+    # Row data as uploaded, plus the row_updates up to applied_update_id (see app/rowlog.py)
+    row_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)
+    applied_update_id = Column(Integer, nullable=True)  # last row_updates.id folded into row_data
+    row_key = Column(String, nullable=True)  # key_column value or content_hash: matches rows across syncs
+    content_hash = Column(String, nullable=True)  # hash of the row as uploaded (reply updates don't change it)
 
     # Contact info extracted from the row
     contact_email = Column(String, nullable=True, index=True)
@@ -44,20 +114,145 @@ class DataRow(Base):
     channel = Column(String, default="email")  # email | whatsapp
 
     # Messaging state
-    message_status = Column(String, default="pending")  # pending | sent | replied | review | failed
+    message_status = Column(String, default="pending")  # pending | retry | sent | replied | review | failed | invalid | duplicate
     outbound_message = Column(Text, nullable=True)
+    draft_model = Column(String, nullable=True)  # model that produced outbound_message
+    email_message_id = Column(String, nullable=True)  # Message-ID of the sent email, without <> (threads replies)
+    attempt_count = Column(Integer, default=0, nullable=False)  # failed draft / send attempts (see app/retry.py)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # when a "retry" row is due
+    last_error = Column(Text, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # held by the worker drafting / sending the row
 
     # Reply processing
     reply_text = Column(Text, nullable=True)
     confidence = Column(Float, nullable=True)
     needs_review = Column(Boolean, default=False)
     suggested_update = Column(JSON, nullable=True)
+    reply_message_id = Column(String, nullable=True)  # last inbound email processed (skips redelivery)
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc),
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
                         onupdate=lambda: datetime.now(timezone.utc))
 
     campaign = relationship("Campaign", back_populates="rows")
 
+    __table_args__ = (
+        # Campaign workers stream pending rows in id order (keyset chunks)
+        Index("ix_data_rows_campaign_status", "campaign_id", "message_status", "id"),
+        # Review queue: cross-campaign, ordered by confidence or by age (keyset pagination)
+        Index("ix_data_rows_review_confidence", "needs_review", "confidence", "id"),
+        Index("ix_data_rows_review_age", "needs_review", "updated_at", "id"),
+        # Review queue scoped to one campaign
+        Index("ix_data_rows_campaign_review", "campaign_id", "needs_review", "confidence"),
+        # Email replies: In-Reply-To / References resolve to a row in one lookup
+        Index("ix_data_rows_email_message_id", "email_message_id", unique=True),
+        # Upsert uploads look rows up by key
+        Index("ix_data_rows_campaign_key", "campaign_id", "row_key"),
+        # Retry sweeper: due "retry" rows
+        Index("ix_data_rows_retry_due", "message_status", "next_attempt_at"),
+    )
+
     def __repr__(self):
         return f"<DataRow {self.id} (campaign={self.campaign_id}, row={self.row_index})>"
+
+
+# Segment filters on PostgreSQL: one GIN index serves `row_data @> {...}` for every key
+# (SQLite gets per-key expression indexes instead, see app/segments.py)
+ROW_DATA_GIN_INDEX = DDL(
+    "CREATE INDEX IF NOT EXISTS ix_data_rows_row_data_gin ON data_rows USING gin (row_data jsonb_path_ops)"
+)
+event.listen(DataRow.__table__, "after_create", ROW_DATA_GIN_INDEX.execute_if(dialect="postgresql"))
+
+
+class RowUpdate(Base):
+    """
+    Append-only log of changes to a row's data: the fields a reply, review or re-upload
+    set, and (once folded into row_data) the values they replaced. See app/rowlog.py.
+    `row_id` is not a foreign key: the history outlives rows moved to the cold tier.
+    """
+    __tablename__ = "row_updates"
+
+    id = Column(Integer, primary_key=True)
+    row_id = Column(Integer, nullable=False)
+    campaign_id = Column(Integer, nullable=False)
+    source = Column(String(16), nullable=False)  # whatsapp | email | manual_reply | import | review | correction | upload
+    updates = Column(JSON, nullable=False)  # field -> new value (the whole document when `replaces`)
+    replaces = Column(Boolean, default=False, nullable=False)  # a re-upload: `updates` replaces row_data
+    previous = Column(JSON, nullable=True)  # field -> value before this update (absent = field was new)
+    confidence = Column(Float, nullable=True)  # extraction confidence for reply updates
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        # Pending updates of a row (id > its applied_update_id) and its history
+        Index("ix_row_updates_row", "row_id", "id"),
+        # Point-in-time reconstruction of a campaign
+        Index("ix_row_updates_campaign_time", "campaign_id", "created_at"),
+    )
+
+
+class ReplyFragment(Base):
+    """
+    A WhatsApp reply fragment waiting to be processed with the rest of its burst (see
+    app/coalesce.py). Stored before the webhook is acknowledged, deleted with the reply's
+    transaction. Times are epoch seconds, compared across processes.
+    """
+    __tablename__ = "reply_fragments"
+
+    id = Column(Integer, primary_key=True)
+    row_id = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    received_at = Column(Float, nullable=False)
+    flushing_at = Column(Float, nullable=True)  # claimed by a process processing the burst
+    attempts = Column(Integer, default=0, nullable=False)  # failed or interrupted flushes
+
+    __table_args__ = (
+        Index("ix_reply_fragments_row", "row_id", "id"),
+    )
+
+
+class ArchivedRowChunk(Base):
+    """
+    Cold tier: a compressed block of an archived campaign's rows.
+    `payload` is zlib-compressed JSON — a list of DataRow column dicts in row order.
+    """
+    __tablename__ = "archived_row_chunks"
+
+    id = Column(Integer, primary_key=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)  # size of the JSON before compression
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_archived_row_chunks_campaign", "campaign_id", "chunk_index", unique=True),
+    )
+
+
+class LlmUsage(Base):
+    """
+    Token usage aggregated per (campaign, row, model, kind) — one row per combination,
+    updated in place on every call, so the table stays as small as the campaigns it covers.
+    `row_id` is not a foreign key: usage outlives rows moved to the cold tier.
+    """
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    model = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # draft | reply
+    calls = Column(Integer, default=0, nullable=False)
+    input_tokens = Column(Integer, default=0, nullable=False)
+    output_tokens = Column(Integer, default=0, nullable=False)
+    cost_usd = Column(Float, default=0.0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                        onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # Upsert key; its campaign_id prefix also serves the per-campaign aggregates
+        Index("ix_llm_usage_key", "campaign_id", "row_id", "model", "kind", unique=True),
+        # Estimates: average output tokens per model across campaigns
+        Index("ix_llm_usage_model_kind", "model", "kind"),
+    )
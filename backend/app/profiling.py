@@ -0,0 +1,233 @@
+"""
+Runtime profiling hooks.
+
+- Per-request timings: time spent in the DB, the LLM and message transports is
+  accumulated in a context variable; requests slower than `slow_request_ms` are
+  appended to the slow-request log (JSON lines).
+- On-demand cProfile captures scoped to a campaign id (its row work) or a route
+  prefix, started / stopped at runtime from the admin API and saved as .pstats.
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import get_settings
+
+RECENT_SLOW_REQUESTS = 100  # kept in memory for /admin/slow-requests
+
+_timings: contextvars.ContextVar[dict | None] = contextvars.ContextVar("timings", default=None)
+_recent_slow: deque[dict] = deque(maxlen=RECENT_SLOW_REQUESTS)
+_log_lock = threading.Lock()
+
+
+# ════════════════════════════════════════════════
+# Per-request timings
+# ════════════════════════════════════════════════
+
+@contextmanager
+def track(category: str):
+    """Add the elapsed time of the block to the current request's `category` bucket."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[f"{category}_ms"] = timings.get(f"{category}_ms", 0.0) + (time.perf_counter() - start) * 1000
+        timings[f"{category}_calls"] = timings.get(f"{category}_calls", 0) + 1
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    timings = _timings.get()
+    if timings is not None:
+        timings["db_ms"] = timings.get("db_ms", 0.0) + (time.perf_counter() - start) * 1000
+        timings["db_calls"] = timings.get("db_calls", 0) + 1
+
+
+def _log_slow_request(entry: dict):
+    settings = get_settings()
+    _recent_slow.append(entry)
+    print(f"[SLOW] {entry['method']} {entry['path']} {entry['total_ms']:.0f}ms "
+          f"(db {entry.get('db_ms', 0):.0f}ms, llm {entry.get('llm_ms', 0):.0f}ms, "
+          f"transport {entry.get('transport_ms', 0):.0f}ms)")
+    try:
+        os.makedirs(os.path.dirname(settings.slow_request_log) or ".", exist_ok=True)
+        with _log_lock, open(settings.slow_request_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"[SLOW ERROR] Could not write slow-request log: {e}")
+
+
+def recent_slow_requests() -> list[dict]:
+    return list(_recent_slow)
+
+
+async def instrument_request(request, call_next):
+    """HTTP middleware body: per-request timings, slow-request log, route-scoped profiling."""
+    timings: dict = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        with profile_scope(route=request.url.path):
+            response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        _timings.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+        if total_ms >= get_settings().slow_request_ms:
+            _log_slow_request({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "total_ms": round(total_ms, 1),
+                **{k: round(v, 1) if isinstance(v, float) else v for k, v in timings.items()},
+            })
+
+
+# ════════════════════════════════════════════════
+# On-demand cProfile captures
+# ════════════════════════════════════════════════
+
+class ProfileCapture:
+    """Accumulates cProfile data from every execution that matches its scope."""
+
+    def __init__(self, campaign_id: int | None, route: str | None, duration: float | None):
+        self.id = uuid.uuid4().hex[:12]
+        self.campaign_id = campaign_id
+        self.route = route
+        self.started_at = datetime.now(timezone.utc)
+        self.expires_at = time.monotonic() + duration if duration else None
+        self.samples = 0
+        self._stats: pstats.Stats | None = None
+        self._lock = threading.Lock()
+
+    def matches(self, campaign_id: int | None, route: str | None) -> bool:
+        if self.campaign_id is not None:
+            return campaign_id == self.campaign_id
+        return route is not None and route.startswith(self.route)
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.samples += 1
+
+    def save(self, directory: str) -> dict:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}.pstats")
+        summary_path = os.path.join(directory, f"{self.id}.txt")
+        with self._lock:
+            if self._stats is None:
+                return {"id": self.id, "samples": 0, "path": None}
+            self._stats.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(50)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        return {"id": self.id, "samples": self.samples, "path": path, "summary_path": summary_path}
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "campaign_id": self.campaign_id,
+            "route": self.route,
+            "started_at": self.started_at.isoformat(),
+            "samples": self.samples,
+        }
+
+
+_captures: dict[str, ProfileCapture] = {}
+_captures_lock = threading.Lock()
+
+
+def start_capture(campaign_id: int | None = None, route: str | None = None, duration: float | None = None) -> ProfileCapture:
+    if (campaign_id is None) == (route is None):
+        raise ValueError("Give exactly one of campaign_id or route")
+    capture = ProfileCapture(campaign_id, route, duration)
+    with _captures_lock:
+        _captures[capture.id] = capture
+    return capture
+
+
+def stop_capture(capture_id: str) -> dict | None:
+    """Stop a capture and write its .pstats (+ text summary) to `profile_dir`."""
+    with _captures_lock:
+        capture = _captures.pop(capture_id, None)
+    if capture is None:
+        return None
+    return capture.save(get_settings().profile_dir)
+
+
+def active_captures() -> list[dict]:
+    _expire()
+    with _captures_lock:
+        return [c.describe() for c in _captures.values()]
+
+
+def _expire():
+    now = time.monotonic()
+    with _captures_lock:
+        expired = [cid for cid, c in _captures.items() if c.expires_at and now >= c.expires_at]
+    for capture_id in expired:
+        result = stop_capture(capture_id)
+        if result:
+            print(f"[PROFILE] Capture {capture_id} expired, saved to {result['path']}")
+
+
+@contextmanager
+def profile_scope(campaign_id: int | None = None, route: str | None = None):
+    """
+    Profile the block if an active capture matches it. Costs one dict scan otherwise.
+    cProfile profiles the current thread only; for async routes that thread is the event
+    loop, so concurrent requests can leak into a route capture.
+    """
+    if not _captures:
+        yield
+        return
+    _expire()
+    with _captures_lock:
+        matching = [c for c in _captures.values() if c.matches(campaign_id, route)]
+    if not matching:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is already active on this thread (nested scope)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        for capture in matching:
+            capture.add(profile)
@@ -0,0 +1,264 @@
+"""
+Rate limiting shared by everything that calls an upstream API.
+
+Per-upstream request rates are global: their buckets live in the coordination store
+(app/coordination.py), so every process draws from the same budget. Concurrency caps
+(with the LLM's priority lanes) and per-campaign send rates stay in-process.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from app.config import get_settings
+from app.coordination import STORE_RETRY, get_store
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float):
+        """Change the refill rate; tokens accrued so far are kept."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take `tokens` if available right now; never blocks."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket held in the coordination store, shared by all processes. Same interface
+    as TokenBucket. A refused caller skips the store until the tokens it asked for could
+    have accrued, so pollers don't turn into a stream of writes. A rate <= 0 means unlimited.
+    If the store fails, the process limits with a local bucket at the same rate and
+    tries the store again after STORE_RETRY seconds.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float | None = None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._retry_at = 0.0
+        self._fallback: TokenBucket | None = None
+        self._fallback_until = 0.0  # local limiting until then (monotonic); 0 = store healthy
+
+    def set_rate(self, rate: float):
+        self.rate = rate
+        if self._fallback is not None:
+            self._fallback.set_rate(rate)
+
+    def _take(self, tokens: float) -> float:
+        """0.0 if taken, else seconds to wait."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        if now < self._fallback_until:
+            return self._take_local(tokens)
+        if now < self._retry_at:
+            return self._retry_at - now
+        try:
+            wait = get_store().take(self.name, self.rate, self.capacity, tokens)
+        except Exception as e:
+            if not self._fallback_until:
+                print(f"[RATELIMIT ERROR] Shared bucket '{self.name}' unavailable, limiting per process: {e}")
+            if self._fallback is None:
+                self._fallback = TokenBucket(self.rate, self.capacity)
+            self._fallback_until = now + STORE_RETRY
+            return self._take_local(tokens)
+        if self._fallback_until:
+            print(f"[RATELIMIT] Shared bucket '{self.name}' reachable again")
+            self._fallback_until = 0.0
+        self._retry_at = now + wait
+        return wait
+
+    def _take_local(self, tokens: float) -> float:
+        return 0.0 if self._fallback.try_acquire(tokens) else tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        return self._take(tokens) == 0.0
+
+    def acquire(self, tokens: float = 1.0):
+        while (wait := self._take(tokens)) > 0:
+            time.sleep(wait)
+
+
+# LLM priority lanes, highest first
+INTERACTIVE = "interactive"  # reply processing: someone is waiting in a chat
+BULK = "bulk"  # campaign and batch drafting
+LANES = (INTERACTIVE, BULK)
+LIMITER_POLL = 0.05  # seconds between admission attempts of a queued call
+WAIT_WINDOW = 500  # recent queue waits kept per lane for percentiles
+
+
+def _ms(sorted_waits: list[float], q: float) -> float | None:
+    if not sorted_waits:
+        return None
+    return round(sorted_waits[min(len(sorted_waits) - 1, int(len(sorted_waits) * q / 100))] * 1000, 1)
+
+
+@dataclass
+class _Lane:
+    reserved: int
+    in_flight: int = 0
+    waiting: int = 0
+    admitted: int = 0
+    queued: int = 0  # admissions that had to wait
+    waits: deque = field(default_factory=lambda: deque(maxlen=WAIT_WINDOW))
+
+
+class LaneLimiter:
+    """
+    Caps in-flight calls (per process) and call rate (global token bucket) for one
+    upstream, with priority lanes. A lane may always run up to its reserved slots.
+    Above that, a call is admitted only when no higher-priority lane has callers
+    queued, and it must leave free the unused reserved slots of higher-priority lanes
+    (held even while they are idle) and of lower-priority lanes that have callers
+    queued. So bulk work is throttled as soon as interactive demand appears, and
+    neither lane starves. Running calls are never preempted.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, requests_per_minute: float, reserved: dict[str, int]):
+        self.max_concurrency = max_concurrency
+        self.bucket = SharedTokenBucket(name, rate=requests_per_minute / 60.0)
+        self._lanes = {lane: _Lane(reserved=min(reserved.get(lane, 0), max_concurrency)) for lane in LANES}
+        self._lock = threading.Lock()
+
+    def _admissible(self, lane: str) -> bool:
+        free = self.max_concurrency - sum(l.in_flight for l in self._lanes.values())
+        if free <= 0:
+            return False
+        state = self._lanes[lane]
+        if state.in_flight < state.reserved:
+            return True
+        rank = LANES.index(lane)
+        for other in LANES:
+            if other == lane:
+                continue
+            other_state = self._lanes[other]
+            higher = LANES.index(other) < rank
+            if higher and other_state.waiting:
+                return False
+            if higher or other_state.waiting:
+                free -= max(0, other_state.reserved - other_state.in_flight)
+        return free > 0
+
+    def try_acquire(self, lane: str) -> bool:
+        """Non-blocking: take a slot in `lane` and a rate token, or nothing. Pair with release()."""
+        with self._lock:
+            if not self._admissible(lane):
+                return False
+            self._lanes[lane].in_flight += 1
+        if not self.bucket.try_acquire():
+            self.release(lane)
+            return False
+        return True
+
+    async def acquire(self, lane: str) -> float:
+        """
+        Wait for a slot in `lane` and a rate token; returns the seconds spent queued.
+        Polls instead of blocking, so a cancelled caller (e.g. a losing hedge) never strands a slot.
+        """
+        start = time.monotonic()
+        queued = not self.try_acquire(lane)
+        if queued:
+            with self._lock:
+                self._lanes[lane].waiting += 1
+            try:
+                while not self.try_acquire(lane):
+                    await asyncio.sleep(LIMITER_POLL)
+            finally:
+                with self._lock:
+                    self._lanes[lane].waiting -= 1
+        waited = time.monotonic() - start if queued else 0.0
+        with self._lock:
+            state = self._lanes[lane]
+            state.admitted += 1
+            state.queued += queued
+            state.waits.append(waited)
+        return waited
+
+    def release(self, lane: str):
+        with self._lock:
+            self._lanes[lane].in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lanes = {lane: (state, sorted(state.waits)) for lane, state in self._lanes.items()}
+            return {
+                "max_concurrency": self.max_concurrency,
+                "lanes": {
+                    lane: {
+                        "reserved": state.reserved,
+                        "in_flight": state.in_flight,
+                        "waiting": state.waiting,
+                        "admitted": state.admitted,
+                        "queued": state.queued,
+                        "wait_ms": {"p50": _ms(waits, 50), "p95": _ms(waits, 95), "max": _ms(waits, 100)},
+                    }
+                    for lane, (state, waits) in lanes.items()
+                },
+            }
+
+
+_llm_limiter: LaneLimiter | None = None
+_llm_lock = threading.Lock()
+
+
+def get_llm_limiter() -> LaneLimiter:
+    """Limiter for Gemini calls (shared by campaigns, webhooks and bulk imports in every process)."""
+    global _llm_limiter
+    with _llm_lock:
+        if _llm_limiter is None:
+            settings = get_settings()
+            _llm_limiter = LaneLimiter(
+                "gemini",
+                max_concurrency=settings.llm_max_concurrency,
+                requests_per_minute=settings.llm_requests_per_minute,
+                reserved=settings.llm_lane_reserved,
+            )
+        return _llm_limiter
+
+
+_waha_bucket: SharedTokenBucket | None = None
+
+
+def get_waha_bucket() -> SharedTokenBucket:
+    """Global send rate for WAHA (WhatsApp), across campaigns, quick sends and processes."""
+    global _waha_bucket
+    with _llm_lock:
+        if _waha_bucket is None:
+            _waha_bucket = SharedTokenBucket("waha", rate=get_settings().waha_requests_per_minute / 60.0)
+        return _waha_bucket
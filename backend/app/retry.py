@@ -0,0 +1,186 @@
+"""
+Automatic retries for rows whose draft or send failed.
+
+A failure is either transient (timeouts, connection errors, rate limiting, 5xx
+responses, SMTP 4xx replies) or permanent (rejected recipient, bad request, ...).
+A transient failure puts the row in "retry" with `next_attempt_at` set by jittered
+exponential backoff; a permanent one, or the last of `retry_max_attempts` attempts,
+marks it "failed". The sweeper moves due retry rows of running campaigns back to
+"pending" and queues them on the scheduler. Rows that were sent are never touched.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.cache import mark_changed
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Campaign, CampaignStatus, DataRow
+
+TRANSIENT_HTTP_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Upstream errors that are worth retrying, matched by class name (incl. base classes) so the
+# optional client libraries (google-api-core, httpx, ...) needn't be imported here
+TRANSIENT_ERRORS = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "GatewayTimeout", "Aborted", "TransportError",
+}
+MAX_ERROR_LENGTH = 1000
+
+_last_run: dict | None = None
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _status_code(exc: Exception) -> int | None:
+    for value in (getattr(exc, "status_code", None), getattr(exc, "code", None),
+                  getattr(getattr(exc, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient(exc: Exception) -> bool:
+    """Whether a failed attempt may succeed if repeated. Errors that say so (SendError) decide for themselves."""
+    transient = getattr(exc, "transient", None)
+    if transient is not None:
+        return transient
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__):
+        return True
+    return _status_code(exc) in TRANSIENT_HTTP_STATUS
+
+
+def backoff(attempt: int) -> float:
+    """Seconds before retry number `attempt`: exponential, capped, with equal jitter."""
+    settings = get_settings()
+    delay = min(settings.retry_max_delay, settings.retry_base_delay * 2 ** (attempt - 1))
+    # Rows that failed together (e.g. an SMTP outage) shouldn't all come back at once
+    return delay * random.uniform(0.5, 1.0)
+
+
+def record_failure(row: DataRow, exc: Exception) -> str:
+    """Count a failed attempt and schedule the row's retry, or fail it. Caller commits. Returns the new status."""
+    row.attempt_count = (row.attempt_count or 0) + 1
+    row.last_error = f"{type(exc).__name__}: {exc}"[:MAX_ERROR_LENGTH]
+    if is_transient(exc) and row.attempt_count < get_settings().retry_max_attempts:
+        row.message_status = "retry"
+        row.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=backoff(row.attempt_count))
+    else:
+        row.message_status = "failed"
+        row.next_attempt_at = None
+    return row.message_status
+
+
+def requeue_due(db: Session, campaign_id: int, include_failed: bool = False) -> int:
+    """
+    Move a campaign's due retry rows back to "pending" (with `include_failed`, also its
+    failed rows, with their attempt count reset). Caller commits. Returns the row count.
+    """
+    table = DataRow.__table__
+    count = db.execute(
+        update(table)
+        .where(
+            table.c.campaign_id == campaign_id,
+            table.c.message_status == "retry",
+            table.c.next_attempt_at <= datetime.now(timezone.utc),
+        )
+        .values(message_status="pending", next_attempt_at=None)
+    ).rowcount
+    if include_failed:
+        count += db.execute(
+            update(table)
+            .where(table.c.campaign_id == campaign_id, table.c.message_status == "failed")
+            .values(message_status="pending", attempt_count=0, next_attempt_at=None)
+        ).rowcount
+    if count:
+        mark_changed(db, {campaign_id})
+    return count
+
+
+# ════════════════════════════════════════════════
+# Sweeper
+# ════════════════════════════════════════════════
+
+def sweep() -> dict:
+    """
+    Queue the due retry rows of every running campaign that has no live run in this
+    process (a live run is left to finish first; its campaign is picked up on a later pass).
+    """
+    from app.worker import is_campaign_active, queue_run  # local import to avoid circular
+
+    global _last_run
+    start = time.monotonic()
+    db = SessionLocal()
+    try:
+        campaign_ids = db.scalars(
+            select(DataRow.campaign_id)
+            .distinct()
+            .join(Campaign, Campaign.id == DataRow.campaign_id)
+            .where(
+                DataRow.message_status == "retry",
+                DataRow.next_attempt_at <= datetime.now(timezone.utc),
+                Campaign.status == CampaignStatus.RUNNING,
+            )
+        ).all()
+    finally:
+        db.close()
+
+    queued = [campaign_id for campaign_id in campaign_ids if not is_campaign_active(campaign_id)]
+    for campaign_id in queued:
+        queue_run(campaign_id)  # claims the due rows, then queues every pending row
+
+    _last_run = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "campaigns": queued,
+        "seconds": round(time.monotonic() - start, 2),
+    }
+    return _last_run
+
+
+def _sweep_loop():
+    while not _stop.wait(get_settings().retry_sweep_interval):
+        try:
+            sweep()
+        except Exception as e:
+            print(f"[RETRY ERROR] Sweep failed: {e}")
+
+
+def start_retry_sweeper():
+    """Start the background retry sweeper (no-op when RETRY_SWEEP_INTERVAL=0)."""
+    global _thread
+    if get_settings().retry_sweep_interval <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_sweep_loop, name="retry-sweeper", daemon=True)
+    _thread.start()
+
+
+def stop_retry_sweeper():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+def retry_stats(db: Session) -> dict:
+    """Rows waiting for a retry (and how many are due), failed rows, and the last sweep."""
+    now = datetime.now(timezone.utc)
+    waiting, due = db.execute(
+        select(func.count(), func.count().filter(DataRow.next_attempt_at <= now))
+        .where(DataRow.message_status == "retry")
+    ).one()
+    failed = db.scalar(select(func.count()).where(DataRow.message_status == "failed"))
+    return {
+        "waiting": waiting,
+        "due": due,
+        "failed": failed,
+        "max_attempts": get_settings().retry_max_attempts,
+        "last_sweep": _last_run,
+    }
@@ -0,0 +1,165 @@
+"""
+Operational endpoints — scheduler state and other runtime diagnostics.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.archive import compact, storage_stats
+from app.cache import response_cache
+from app.coordination import coordination_stats
+from app.database import engine, get_db
+from app.llm_router import get_llm_router
+from app.ratelimit import get_llm_limiter
+from app.routers.webhooks import reply_coalescer
+from app.retry import retry_stats, sweep
+from app.rowlog import compact as compact_row_log, rowlog_stats
+from app.profiling import start_capture, stop_capture, active_captures, recent_slow_requests
+from app.scheduler import get_scheduler
+from app.segments import SegmentError, create_segment_index, drop_segment_index, list_segment_indexes
+from app.schemas import ProfileStartRequest
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """Per-tenant throughput, in-flight rows and active campaigns of the fair scheduler."""
+    return get_scheduler().stats()
+
+
+@router.get("/llm")
+async def llm_stats():
+    """Per-model latency percentiles, error / hedge counters of the LLM router."""
+    return get_llm_router().tracker.stats()
+
+
+@router.get("/llm/lanes")
+async def llm_lane_stats():
+    """LLM priority lanes: reserved slots, in-flight and queued calls, queue-wait percentiles per lane."""
+    return get_llm_limiter().stats()
+
+
+@router.get("/retries")
+def retry_state(db: Session = Depends(get_db)):
+    """Rows waiting for an automatic retry (and how many are due), failed rows, and the last sweep."""
+    return retry_stats(db)
+
+
+@router.post("/retries/sweep")
+async def sweep_retries():
+    """Queue due retry rows now instead of waiting for the sweeper."""
+    return await run_in_threadpool(sweep)
+
+
+@router.get("/row-log")
+def row_log_state(db: Session = Depends(get_db)):
+    """Logged row updates, how many are not yet folded into row_data, and the last compaction."""
+    return rowlog_stats(db)
+
+
+@router.post("/row-log/compact")
+def run_row_log_compaction():
+    """Fold pending row updates into row_data now."""
+    return compact_row_log()
+
+
+@router.get("/reply-bursts")
+async def reply_burst_stats():
+    """WhatsApp reply coalescing: debounce window, buffered bursts, fragments per burst, LLM calls saved."""
+    return await reply_coalescer.metrics()
+
+
+@router.get("/coordination")
+async def coordination_state():
+    """Shared store: global rate-limit buckets and the runtime settings version (store vs. this process)."""
+    return await run_in_threadpool(coordination_stats)
+
+
+# ── Profiling ──
+
+@router.post("/profiling/start")
+async def start_profiling(req: ProfileStartRequest):
+    """
+    Start a cProfile capture for one campaign's row work or for requests under a route prefix.
+    With `duration_seconds` the capture stops and saves itself once it expires.
+    """
+    try:
+        capture = start_capture(campaign_id=req.campaign_id, route=req.route, duration=req.duration_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return capture.describe()
+
+
+@router.post("/profiling/{capture_id}/stop")
+async def stop_profiling(capture_id: str):
+    """Stop a capture and save it (.pstats + cumulative-time text summary) to PROFILE_DIR."""
+    result = stop_capture(capture_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return result
+
+
+@router.get("/profiling")
+async def list_profiling():
+    return {"captures": active_captures()}
+
+
+@router.get("/slow-requests")
+async def slow_requests():
+    """Most recent requests over SLOW_REQUEST_MS with their DB / LLM / transport breakdown."""
+    return {"requests": recent_slow_requests()}
+
+
+@router.get("/response-cache")
+async def response_cache_stats():
+    """Dashboard response cache: entries, bytes, hits / 304s / misses, evictions."""
+    return response_cache.stats()
+
+
+# ── Hot/cold storage ──
+
+@router.get("/storage")
+def storage(db: Session = Depends(get_db)):
+    """Hot (data_rows) vs. cold (archived chunks) size, plus the last compaction run."""
+    return storage_stats(db)
+
+
+@router.post("/archive/compact")
+def run_compaction(older_than_days: int | None = Query(None, ge=0)):
+    """Run a compaction pass now (defaults to ARCHIVE_AFTER_DAYS)."""
+    return compact(older_than_days)
+
+
+# ── Segment expression indexes ──
+
+def _require_sqlite():
+    if engine.dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Segment indexes are only managed on SQLite (PostgreSQL uses one GIN index on row_data)")
+
+
+@router.get("/segment-indexes")
+def segment_indexes():
+    """Expression indexes on row_data keys (created from SEGMENT_INDEX_KEYS or below)."""
+    _require_sqlite()
+    with engine.connect() as conn:
+        return {"indexes": list_segment_indexes(conn)}
+
+
+@router.post("/segment-indexes")
+def add_segment_index(key: str = Query(..., min_length=1)):
+    """Index a hot row_data key so segments filtering on it use an index scan."""
+    _require_sqlite()
+    try:
+        with engine.begin() as conn:
+            return {"name": create_segment_index(conn, key), "key": key}
+    except SegmentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/segment-indexes")
+def remove_segment_index(key: str = Query(..., min_length=1)):
+    _require_sqlite()
+    with engine.begin() as conn:
+        return {"dropped": drop_segment_index(conn, key), "key": key}
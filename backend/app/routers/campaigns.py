@@ -2,61 +2,86 @@
 Campaign CRUD + file upload + launch endpoints.
 """
 
+import csv
 import io
-import time
+import json
 from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterator
 
 import pandas as pd
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.models import Campaign, DataRow
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.archive import iter_archived_rows
+from app.cache import LIST_SCOPE, cached_json
+from app.database import AsyncSessionLocal, get_async_db
+from app.models import Campaign, CampaignStatus, DataRow, InvalidTransition, RowUpdate
 from app.schemas import (
-    CampaignResponse, CampaignListResponse, CampaignDetailResponse,
-    DataRowResponse, ReviewAction,
+    CampaignResponse, CampaignCreateResponse, CampaignSyncResponse, CampaignListResponse, CampaignDetailResponse,
+    CampaignSourceSyncResponse, JobResponse, SqlSourceCreate, RowUpdateResponse,
+    DataRowResponse, ReviewAction, CampaignThrottle, CampaignBudget, CampaignEstimate, CampaignUsageResponse,
 )
-from app.agent import draft_message, process_reply
-from app.messaging import send_message
 from app.config import get_settings
+from app.ingest import build_row_records, rekey_rows, upsert_rows, write_rows
+from app.jobs import create_job, get_job
+from app.retry import requeue_due
+from app.rowlog import campaign_state_at, current_data_many, has_pending_updates, overlay_pending
+from app.routers.reviews import apply_review
+from app.scheduler import get_scheduler
+from app.segments import SegmentError, compile_segment, segment_matcher
+from app.sources import SourceError, is_syncing, run_sync_job, source_columns
+from app.usage import campaign_usage, estimate_campaign, top_rows
+from app.worker import start_campaign, is_campaign_active, run_held_elsewhere
 
 router = APIRouter(prefix="/campaigns", tags=["campaigns"])
 
+# Per-row columns included in exports alongside the original row data
+EXPORT_COLUMNS = [
+    "message_status", "contact_email", "contact_phone", "channel",
+    "outbound_message", "reply_text", "confidence", "needs_review",
+]
+
 
 # ────────────────────────── helpers ──────────────────────────
 
-def _detect_email_column(columns: list[str]) -> str | None:
-    """Try to find the email column by name."""
-    for col in columns:
-        low = col.lower().strip()
-        if any(k in low for k in ["email", "mail", "e-mail"]):
-            return col
-    return None
+async def _get_campaign_or_404(db: AsyncSession, campaign_id: int) -> Campaign:
+    campaign = await db.get(Campaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+
+def _transition_or_409(campaign: Campaign, new_status: CampaignStatus):
+    try:
+        campaign.transition(new_status)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 
+def _budget_or_409(campaign: Campaign):
+    if campaign.budget_usd is not None and (campaign.spent_usd or 0) >= campaign.budget_usd:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Budget of ${campaign.budget_usd:.4f} reached (${campaign.spent_usd:.4f} spent); raise it first",
+        )
 
-def _detect_phone_column(columns: list[str]) -> str | None:
-    """Try to find the phone/WhatsApp column by name."""
-    # Priority 1: exact patterns
-    for col in columns:
-        low = col.lower().strip()
-        if any(k in low for k in ["phone", "mobile", "whatsapp", "cell"]):
-            return col
 
-    # Priority 2: columns with "contact" + number-like words (e.g., "Contact No.", "Contact Number")
-    for col in columns:
-        low = col.lower().strip()
-        if "contact" in low and any(k in low for k in ["no", "num", "number", "#"]):
-            return col
-        if "contact" in low:
-            return col
+def _segment_or_400(segment: str):
+    """Compile a segment expression to a SQL filter, or reject the request."""
+    try:
+        return compile_segment(segment)
+    except SegmentError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid segment: {e}")
 
-    # Priority 3: "tel" or "telephone"
-    for col in columns:
-        low = col.lower().strip()
-        if any(k in low for k in ["tel", "telephone"]):
-            return col
 
-    return None
+def _key_column_or_400(df: pd.DataFrame, key_column: str):
+    if key_column not in df.columns:
+        raise HTTPException(status_code=400, detail=f"Key column '{key_column}' is not in the file")
 
 
 def _parse_file(file: UploadFile) -> pd.DataFrame:
@@ -93,203 +118,555 @@ def _parse_file(file: UploadFile) -> pd.DataFrame:
 
 # ────────────────────── campaign CRUD ────────────────────────
 
-@router.post("", response_model=CampaignResponse)
+@router.post("", response_model=CampaignCreateResponse)
 async def create_campaign(
     name: str = Form(...),
     master_prompt: str = Form(...),
     user_email: str = Form("anonymous@example.com"),
+    key_column: str | None = Form(None),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Create a new campaign by uploading a data file and providing a prompt."""
-    # Parse file
-    df = _parse_file(file)
+    """
+    Create a new campaign by uploading a data file and providing a prompt.
+    `key_column` names the column that identifies a row when updated versions of the
+    file are uploaded later (POST /campaigns/{id}/rows); without it rows are matched by content.
+    """
+    # Parse file (pandas is CPU-bound — keep it off the event loop)
+    df = await run_in_threadpool(_parse_file, file)
+    if key_column:
+        _key_column_or_400(df, key_column)
 
     # Create campaign record
     campaign = Campaign(
         user_email=user_email,
         name=name,
         master_prompt=master_prompt,
-        status="draft",
+        status=CampaignStatus.DRAFT,
+        key_column=key_column or None,
     )
     db.add(campaign)
-    db.flush()  # get the ID
-
-    # Detect email and phone columns
-    email_col = _detect_email_column(df.columns.tolist())
-    phone_col = _detect_phone_column(df.columns.tolist())
-
-    # Insert data rows
-    for idx, row in df.iterrows():
-        row_dict = row.where(pd.notna(row), None).to_dict()
-
-        # Convert numpy types to native Python types (SQLite JSON can't serialize numpy)
-        row_dict = {
-            k: (v.item() if hasattr(v, 'item') else v)
-            for k, v in row_dict.items()
-        }
-
-        # Determine channel and contact info
-        contact_email = str(row_dict.get(email_col, "")) if email_col else None
-        contact_phone = str(int(row_dict.get(phone_col, ""))) if phone_col and row_dict.get(phone_col) is not None else None
-
-        # Prefer WhatsApp if phone is available, otherwise email
-        if contact_phone and contact_phone.strip():
-            channel = "whatsapp"
-        elif contact_email and contact_email.strip():
-            channel = "email"
-        else:
-            channel = "email"
-
-        data_row = DataRow(
-            campaign_id=campaign.id,
-            row_index=int(idx),
-            row_data=row_dict,
-            contact_email=contact_email,
-            contact_phone=contact_phone,
-            channel=channel,
-            message_status="pending",
+    await db.flush()  # get the ID
+
+    # Validate + normalize contacts, flag invalid / duplicate recipients, bulk insert
+    settings = get_settings()
+    records, counts = await run_in_threadpool(
+        build_row_records, df, campaign.id,
+        default_country_code=settings.default_country_code,
+        national_length=settings.phone_national_length,
+        key_column=campaign.key_column,
+    )
+    await db.run_sync(write_rows, records)
+
+    await db.commit()
+    await db.refresh(campaign)
+    return {**CampaignResponse.model_validate(campaign).model_dump(), "ingest": counts}
+
+
+@router.post("/{campaign_id}/rows", response_model=CampaignSyncResponse)
+async def sync_campaign_rows(
+    campaign_id: int,
+    key_column: str | None = Form(None),
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Merge an updated version of the campaign's file into it. Rows are matched on the
+    campaign's key column (`key_column` sets it if the campaign has none yet), else on
+    their content. Unchanged rows are skipped, changed rows go back to pending with their
+    drafts and replies discarded, new rows are added; rows missing from the file are kept.
+    Nothing is sent until the campaign is launched again.
+    """
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if campaign.archived_at:
+        raise HTTPException(status_code=409, detail="Campaign is archived")
+    if is_campaign_active(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is running; pause or cancel it first")
+    if is_syncing(campaign_id):
+        raise HTTPException(status_code=409, detail="A sync of this campaign is already running")
+    if key_column and campaign.key_column and key_column != campaign.key_column:
+        raise HTTPException(
+            status_code=400, detail=f"Campaign rows are keyed by '{campaign.key_column}', not '{key_column}'",
         )
-        db.add(data_row)
 
-    db.commit()
-    db.refresh(campaign)
-    return campaign
+    df = await run_in_threadpool(_parse_file, file)
+    key_column = key_column or campaign.key_column
+    if key_column:
+        _key_column_or_400(df, key_column)
+
+    settings = get_settings()
+    records, _ = await run_in_threadpool(
+        build_row_records, df, campaign_id,
+        default_country_code=settings.default_country_code,
+        national_length=settings.phone_national_length,
+        key_column=key_column,
+    )
+    if key_column and not campaign.key_column:
+        await db.run_sync(rekey_rows, campaign_id, key_column)
+        campaign.key_column = key_column
+    counts = await db.run_sync(upsert_rows, campaign_id, records)
+
+    await db.commit()
+    await db.refresh(campaign)
+    return {**CampaignResponse.model_validate(campaign).model_dump(), "sync": counts}
+
+
+@router.post("/sql", response_model=CampaignSourceSyncResponse)
+async def create_sql_campaign(
+    body: SqlSourceCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Create a campaign whose rows are read from a query on an external SQL database.
+    The query is checked up front; the rows are then streamed in by a background job —
+    poll GET /campaigns/{id}/sync/{job_id}. POST /campaigns/{id}/sync re-reads the source
+    (only rows from the last `watermark_column` value on, if set); `sync_interval` does it on a schedule.
+    """
+    if body.watermark_column and not body.key_column:
+        raise HTTPException(status_code=400, detail="An incremental source (watermark_column) needs a key_column")
+    try:
+        columns = await run_in_threadpool(source_columns, body.url, body.query)
+    except SourceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for column in (body.key_column, body.watermark_column):
+        if column and column not in columns:
+            raise HTTPException(status_code=400, detail=f"Column '{column}' is not in the query result")
+
+    campaign = Campaign(
+        user_email=body.user_email,
+        name=body.name,
+        master_prompt=body.master_prompt,
+        status=CampaignStatus.DRAFT,
+        key_column=body.key_column,
+        source_url=body.url,
+        source_query=body.query,
+        watermark_column=body.watermark_column,
+        sync_interval=body.sync_interval,
+        next_sync_at=(
+            datetime.now(timezone.utc) + timedelta(seconds=body.sync_interval) if body.sync_interval else None
+        ),
+    )
+    db.add(campaign)
+    await db.commit()
+    await db.refresh(campaign)
+
+    job = create_job("sql_sync")
+    background_tasks.add_task(run_sync_job, campaign.id, job)
+    return {**CampaignResponse.model_validate(campaign).model_dump(), "job": job}
+
+
+@router.post("/{campaign_id}/sync", response_model=CampaignSourceSyncResponse)
+async def sync_campaign_source(
+    campaign_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Re-read the campaign's SQL source in the background (merged like POST /campaigns/{id}/rows)."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if not campaign.source_url:
+        raise HTTPException(status_code=400, detail="Campaign has no SQL source")
+    if campaign.archived_at:
+        raise HTTPException(status_code=409, detail="Campaign is archived")
+    if is_campaign_active(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is running; pause or cancel it first")
+    if is_syncing(campaign_id):
+        raise HTTPException(status_code=409, detail="A sync of this campaign is already running")
+
+    job = create_job("sql_sync")
+    background_tasks.add_task(run_sync_job, campaign_id, job)
+    return {**CampaignResponse.model_validate(campaign).model_dump(), "job": job}
+
+
+@router.get("/{campaign_id}/sync/{job_id}", response_model=JobResponse)
+async def sync_status(campaign_id: int, job_id: str):
+    """Progress of a source sync: rows read (`processed`), rows written (`succeeded`), counts when done."""
+    job = get_job(job_id)
+    if not job or job.kind != "sql_sync":
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @router.get("", response_model=CampaignListResponse)
-async def list_campaigns(db: Session = Depends(get_db)):
-    """List all campaigns."""
-    campaigns = db.query(Campaign).order_by(Campaign.created_at.desc()).all()
-    return {"campaigns": campaigns}
+async def list_campaigns(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """List all campaigns. Cached until any campaign changes; honours If-None-Match."""
+    async def build() -> bytes:
+        campaigns = (await db.scalars(select(Campaign).order_by(Campaign.created_at.desc()))).all()
+        return CampaignListResponse.model_validate({"campaigns": campaigns}, from_attributes=True).model_dump_json().encode()
+
+    return await cached_json(request, ("campaigns",), LIST_SCOPE, build)
 
 
 @router.get("/{campaign_id}", response_model=CampaignDetailResponse)
-async def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
-    """Get campaign details with all data rows and stats."""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
+async def get_campaign(
+    campaign_id: int,
+    request: Request,
+    segment: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get campaign details with all data rows and stats (only rows in `segment`, if given).
+    Cached until the campaign or one of its rows changes; honours If-None-Match.
+    """
+    async def build() -> bytes:
+        detail = await _campaign_detail(db, campaign_id, segment)
+        # Serializing thousands of rows is CPU-bound — keep it off the event loop
+        return await run_in_threadpool(
+            lambda: CampaignDetailResponse.model_validate(detail, from_attributes=True).model_dump_json().encode()
+        )
+
+    return await cached_json(request, ("campaign", campaign_id, segment or ""), campaign_id, build)
+
 
-    rows = db.query(DataRow).filter(DataRow.campaign_id == campaign_id).order_by(DataRow.row_index).all()
-    status_counts = Counter(r.message_status for r in rows)
+async def _campaign_detail(db: AsyncSession, campaign_id: int, segment: str | None) -> dict:
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    segment_filter = _segment_or_400(segment) if segment else None
+
+    if campaign.archived_at:
+        rows = [row async for chunk in iter_archived_rows(db, campaign_id) for row in chunk]
+        if segment:
+            matches = segment_matcher(segment)
+            rows = [r for r in rows if matches(r["row_data"])]
+        status_counts = Counter(r["message_status"] for r in rows)
+    else:
+        query = (
+            select(DataRow, has_pending_updates())
+            .where(DataRow.campaign_id == campaign_id)
+            .order_by(DataRow.row_index)
+        )
+        if segment_filter is not None:
+            # Rows with logged updates are matched below against their current data
+            query = query.where(or_(segment_filter, has_pending_updates()))
+        result = (await db.execute(query)).all()
+        rows = [row for row, _ in result]
+        stale = [row for row, pending in result if pending]
+        if stale:
+            current = await db.run_sync(current_data_many, stale)
+            for row in stale:
+                set_committed_value(row, "row_data", current[row.id])  # for this response only
+            if segment:
+                matches = segment_matcher(segment)
+                rows = [r for r in rows if r.id not in current or matches(r.row_data)]
+        status_counts = Counter(r.message_status for r in rows)
     stats = {
         "total": len(rows),
         "pending": status_counts.get("pending", 0),
+        "retry": status_counts.get("retry", 0),
         "sent": status_counts.get("sent", 0),
         "replied": status_counts.get("replied", 0),
         "review": status_counts.get("review", 0),
         "failed": status_counts.get("failed", 0),
+        "invalid": status_counts.get("invalid", 0),
+        "duplicate": status_counts.get("duplicate", 0),
     }
 
-    return {"campaign": campaign, "rows": rows, "stats": stats}
+    usage = await campaign_usage(db, campaign)
+    return {"campaign": campaign, "rows": rows, "stats": stats, "usage": usage}
 
 
-# ────────────────────── campaign launch ──────────────────────
+@router.get("/{campaign_id}/usage", response_model=CampaignUsageResponse)
+async def get_campaign_usage(
+    campaign_id: int,
+    limit: int = Query(20, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """LLM tokens and cost of a campaign by model and kind, plus its `limit` most expensive rows."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    return {"usage": await campaign_usage(db, campaign), "top_rows": await top_rows(db, campaign_id, limit)}
 
-def _run_campaign(campaign_id: int):
-    """Background task: draft messages & send emails for all pending rows."""
-    import traceback
-    from app.database import SessionLocal  # local import to avoid circular
 
-    db = SessionLocal()
-    try:
-        campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-        if not campaign:
-            print(f"[CAMPAIGN] Campaign {campaign_id} not found!")
+@router.get("/{campaign_id}/estimate", response_model=CampaignEstimate)
+async def estimate_campaign_cost(
+    campaign_id: int,
+    segment: str | None = None,
+    model: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Estimate the drafting tokens and cost of launching (or re-launching) a campaign.
+    `segment` defaults to the campaign's current segment; `model` to the configured model.
+    """
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    settings = get_settings()
+    model = model or settings.gemini_model
+    if model not in settings.available_models:
+        raise HTTPException(status_code=400, detail=f"Unknown model {model!r}")
+    segment = campaign.segment if segment is None else segment.strip()
+    segment_filter = _segment_or_400(segment) if segment else None
+    return await estimate_campaign(db, campaign, segment_filter, model)
+
+
+# ────────────────────── export ──────────────────────
+
+async def _iter_row_chunks(campaign_id: int, archived: bool, segment: str | None) -> AsyncIterator[list[dict]]:
+    """A campaign's rows (in `segment`) as column dicts, chunk by chunk, from data_rows or the archive."""
+    async with AsyncSessionLocal() as db:
+        if archived:
+            matches = segment_matcher(segment) if segment else None
+            async for rows in iter_archived_rows(db, campaign_id):
+                yield [r for r in rows if matches(r["row_data"])] if matches else rows
             return
 
-        settings = get_settings()
-        model_name = settings.gemini_model
-        print(f"[CAMPAIGN] Starting campaign {campaign_id} with model: {model_name}")
-
-        campaign.status = "running"
-        db.commit()
-
-        rows = db.query(DataRow).filter(
-            DataRow.campaign_id == campaign_id,
-            DataRow.message_status == "pending",
-        ).all()
-
-        print(f"[CAMPAIGN] Found {len(rows)} pending rows")
-
-        for row in rows:
-            try:
-                # 1. Draft the message using Gemini
-                print(f"[CAMPAIGN] Row {row.id}: Drafting message with {model_name}...")
-                message = draft_message(campaign.master_prompt, row.row_data, model_name=model_name)
-                row.outbound_message = message
-                print(f"[CAMPAIGN] Row {row.id}: Drafted OK: {message[:80]}...")
-
-                # 2. Send via the appropriate channel
-                contact = row.contact_phone if row.channel == "whatsapp" else row.contact_email
-                print(f"[CAMPAIGN] Row {row.id}: Sending via {row.channel} to {contact}...")
-                if contact:
-                    success = send_message(
-                        to=contact,
-                        body=message,
-                        channel=row.channel,
-                        subject=f"Message from {campaign.name}",
-                    )
-                    row.message_status = "sent" if success else "failed"
-                    print(f"[CAMPAIGN] Row {row.id}: Send result: {'sent' if success else 'failed'}")
-                else:
-                    row.message_status = "sent"  # Mark as sent even without contact (for demo)
-                    print(f"[CAMPAIGN] Row {row.id}: No contact, marked as sent (demo)")
-
-                db.commit()
-
-                # 3. Basic rate limiting
-                time.sleep(1)
-
-            except Exception as e:
-                print(f"[CAMPAIGN ERROR] Row {row.id}: {e}")
-                traceback.print_exc()
-                row.message_status = "failed"
-                db.commit()
-
-        # Update campaign status
-        failed_count = db.query(DataRow).filter(
-            DataRow.campaign_id == campaign_id,
-            DataRow.message_status == "failed",
-        ).count()
-
-        campaign.status = "completed"
-        db.commit()
-        print(f"[CAMPAIGN] Campaign {campaign_id} completed. Failed: {failed_count}/{len(rows)}")
-
-    finally:
-        db.close()
+        table = DataRow.__table__
+        chunk_size = get_settings().campaign_chunk_size
+        query = select(table, has_pending_updates().label("pending_updates")).where(table.c.campaign_id == campaign_id)
+        matches = None
+        if segment:
+            # Rows with logged updates are matched below against their current data
+            query = query.where(or_(compile_segment(segment), has_pending_updates()))
+            matches = segment_matcher(segment)
+        last_id = 0
+        while True:
+            rows = [dict(r) for r in (await db.execute(
+                query.where(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+            )).mappings()]
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            stale = {r["id"]: r["row_data"] for r in rows if r.pop("pending_updates")}
+            if stale:
+                current = await db.run_sync(overlay_pending, stale)
+                for r in rows:
+                    r["row_data"] = current.get(r["id"], r["row_data"])
+                if matches:
+                    rows = [r for r in rows if r["id"] not in current or matches(r["row_data"])]
+            yield rows
+
+
+async def _export_jsonl(campaign_id: int, archived: bool, segment: str | None) -> AsyncIterator[str]:
+    async for rows in _iter_row_chunks(campaign_id, archived, segment):
+        yield "".join(
+            json.dumps({
+                "row_id": r["id"],
+                "row_index": r["row_index"],
+                "row_data": r["row_data"],
+                **{c: r[c] for c in EXPORT_COLUMNS},
+            }, default=str) + "\n"
+            for r in rows
+        )
+
 
+async def _export_csv(campaign_id: int, archived: bool, segment: str | None) -> AsyncIterator[str]:
+    # First pass collects the row_data columns (replies can add keys to some rows only)
+    data_columns: dict[str, None] = {}
+    async for rows in _iter_row_chunks(campaign_id, archived, segment):
+        for r in rows:
+            data_columns.update(dict.fromkeys(r["row_data"]))
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["row_index", *data_columns, *EXPORT_COLUMNS])
+    async for rows in _iter_row_chunks(campaign_id, archived, segment):
+        for r in rows:
+            writer.writerow([
+                r["row_index"],
+                *(r["row_data"].get(c) for c in data_columns),
+                *(r[c] for c in EXPORT_COLUMNS),
+            ])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+
+@router.get("/{campaign_id}/export")
+async def export_campaign(
+    campaign_id: int,
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    segment: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stream every row (live or archived; only `segment` if given) with its messaging state as CSV / JSONL."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if segment:
+        _segment_or_400(segment)
+    archived = campaign.archived_at is not None
+    if format == "jsonl":
+        body, media_type = _export_jsonl(campaign_id, archived, segment), "application/x-ndjson"
+    else:
+        body, media_type = _export_csv(campaign_id, archived, segment), "text/csv"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="campaign_{campaign_id}.{format}"'},
+    )
+
+
+def _history_jsonl(campaign_id: int, at: datetime) -> Iterator[str]:
+    for rows in campaign_state_at(campaign_id, at):
+        yield "".join(json.dumps(r, default=str) + "\n" for r in rows)
+
+
+@router.get("/{campaign_id}/history")
+async def campaign_history(campaign_id: int, at: datetime, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream the campaign's rows as they were at `at` (ISO 8601; UTC if no offset), rebuilt
+    from the row update log, as JSONL: {"row_id", "row_index", "row_data"}.
+    """
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if campaign.archived_at:
+        raise HTTPException(status_code=409, detail="Campaign is archived")
+    return StreamingResponse(
+        _history_jsonl(campaign_id, at),  # sync generator: iterated in the threadpool
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="campaign_{campaign_id}_{at:%Y%m%dT%H%M%S}.jsonl"'},
+    )
+
+
+@router.get("/{campaign_id}/rows/{row_id}/updates", response_model=list[RowUpdateResponse])
+async def row_updates(campaign_id: int, row_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Every logged change to a row's data, oldest first (`previous` is filled in once compacted)."""
+    return (await db.scalars(
+        select(RowUpdate).where(RowUpdate.campaign_id == campaign_id, RowUpdate.row_id == row_id).order_by(RowUpdate.id)
+    )).all()
+
+
+# ────────────────────── campaign launch ──────────────────────
 
 @router.post("/{campaign_id}/launch")
 async def launch_campaign(
     campaign_id: int,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    weight: float | None = Query(None, gt=0),
+    mode: str | None = Query(None, pattern="^(interactive|batch)$"),
+    segment: str | None = None,
+    budget_usd: float | None = Query(None, gt=0),
+    retry_failed: bool = False,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Launch a campaign — drafts messages and sends them in the background."""
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
+    """
+    Launch a campaign — drafts messages and sends them in the background.
+    Rows are interleaved with other running campaigns by the fair scheduler;
+    `weight` sets this campaign's share relative to the owner's other campaigns.
+    `mode=batch` drafts every message with one offline batch job before sending.
+    `segment` (e.g. `City == "Pune"`) only messages matching rows; an empty value clears it.
+    `budget_usd` caps the campaign's LLM spend: it pauses once the limit is reached.
+    `retry_failed` also re-sends rows that failed permanently or ran out of retry attempts.
+    """
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if campaign.archived_at:
+        raise HTTPException(status_code=409, detail="Campaign is archived")
+    if is_syncing(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign source is being synced; launch once it finishes")
+
+    # A "running" campaign with no live run was interrupted (e.g. server restart) — allow relaunch
+    live = is_campaign_active(campaign_id)
+    if campaign.status in (CampaignStatus.RUNNING, CampaignStatus.PAUSED) and live:
+        raise HTTPException(status_code=400, detail=f"Campaign is already {campaign.status.value}")
+
+    if campaign.status != CampaignStatus.RUNNING:
+        _transition_or_409(campaign, CampaignStatus.RUNNING)
+    if weight is not None:
+        campaign.weight = weight
+    if mode is not None:
+        campaign.drafting_mode = mode
+    if segment is not None:
+        if segment.strip():
+            _segment_or_400(segment)
+        campaign.segment = segment.strip() or None
+    if budget_usd is not None:
+        campaign.budget_usd = budget_usd
+    _budget_or_409(campaign)
+    if retry_failed:
+        await db.run_sync(requeue_due, campaign_id, include_failed=True)
+    await db.commit()
+
+    background_tasks.add_task(start_campaign, campaign_id)
+    return {"message": "Campaign launch started", "campaign_id": campaign_id}
 
-    if campaign.status == "running":
-        raise HTTPException(status_code=400, detail="Campaign is already running")
 
-    background_tasks.add_task(_run_campaign, campaign_id)
-    return {"message": "Campaign launch started", "campaign_id": campaign_id}
+# ────────────────────── live controls ──────────────────────
+
+@router.post("/{campaign_id}/pause", response_model=CampaignResponse)
+async def pause_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Stop dispatching new rows. Rows already in flight finish normally (in any worker process)."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    _transition_or_409(campaign, CampaignStatus.PAUSED)
+    await db.commit()
+    await db.refresh(campaign)
+    get_scheduler().control(campaign_id, "pause")
+    return campaign
+
+
+@router.post("/{campaign_id}/resume", response_model=CampaignResponse)
+async def resume_campaign(
+    campaign_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Resume a paused campaign (re-queues its pending rows if the run was lost on restart)."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if campaign.status != CampaignStatus.PAUSED:
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign.status.value}, not paused")
+    _budget_or_409(campaign)
+    _transition_or_409(campaign, CampaignStatus.RUNNING)
+    await db.commit()
+    await db.refresh(campaign)
+    # The run may live in another worker process; it picks the resume up at its next status sync
+    if (
+        not get_scheduler().control(campaign_id, "resume")
+        and not is_campaign_active(campaign_id)
+        and not await db.run_sync(run_held_elsewhere, campaign_id)
+    ):
+        background_tasks.add_task(start_campaign, campaign_id)
+    return campaign
+
+
+@router.post("/{campaign_id}/cancel", response_model=CampaignResponse)
+async def cancel_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Cancel a campaign: queued rows are dropped (left pending), in-flight rows finish."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    _transition_or_409(campaign, CampaignStatus.CANCELLED)
+    await db.commit()
+    await db.refresh(campaign)
+    get_scheduler().control(campaign_id, "cancel")
+    return campaign
+
+
+@router.patch("/{campaign_id}/throttle", response_model=CampaignResponse)
+async def throttle_campaign(campaign_id: int, payload: CampaignThrottle, db: AsyncSession = Depends(get_async_db)):
+    """Change the send rate (rows/sec) and/or max concurrent rows, live if the campaign is running."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    if payload.send_rate is not None:
+        campaign.send_rate = payload.send_rate
+    if payload.max_concurrency is not None:
+        campaign.max_concurrency = payload.max_concurrency
+    await db.commit()
+    await db.refresh(campaign)
+    get_scheduler().control(
+        campaign_id, "throttle",
+        send_rate=payload.send_rate, max_concurrency=payload.max_concurrency,
+    )
+    return campaign
+
+
+@router.patch("/{campaign_id}/budget", response_model=CampaignResponse)
+async def set_campaign_budget(campaign_id: int, payload: CampaignBudget, db: AsyncSession = Depends(get_async_db)):
+    """Set (or with null, remove) the campaign's LLM spend limit in USD. Resume a budget-paused campaign after raising it."""
+    campaign = await _get_campaign_or_404(db, campaign_id)
+    campaign.budget_usd = payload.budget_usd
+    await db.commit()
+    await db.refresh(campaign)
+    return campaign
 
 
 # ────────────────── review queue ──────────────────────
 
 @router.get("/{campaign_id}/reviews", response_model=list[DataRowResponse])
-async def get_review_queue(campaign_id: int, db: Session = Depends(get_db)):
-    """Get all rows that need human review."""
-    rows = db.query(DataRow).filter(
+async def get_review_queue(
+    campaign_id: int,
+    segment: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get all rows that need human review (only rows in `segment`, if given)."""
+    query = select(DataRow).where(
         DataRow.campaign_id == campaign_id,
         DataRow.needs_review == True,
-    ).all()
-    return rows
+    ).order_by(DataRow.confidence)
+    if segment:
+        query = query.where(_segment_or_400(segment))
+    rows = await db.scalars(query)
+    return rows.all()
 
 
 @router.post("/{campaign_id}/rows/{row_id}/review")
@@ -297,27 +674,17 @@ async def review_row(
     campaign_id: int,
     row_id: int,
     action: ReviewAction,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Approve or reject an agent's suggested update."""
-    row = db.query(DataRow).filter(DataRow.id == row_id, DataRow.campaign_id == campaign_id).first()
-    if not row:
+    row = await db.get(DataRow, row_id)
+    if not row or row.campaign_id != campaign_id:
         raise HTTPException(status_code=404, detail="Row not found")
 
-    if action.action == "approve" and row.suggested_update:
-        # Merge the suggested update into row_data
-        updated = {**row.row_data, **row.suggested_update}
-        row.row_data = updated
-        row.message_status = "replied"
-        row.needs_review = False
-    elif action.action == "reject":
-        if action.manual_update:
-            updated = {**row.row_data, **action.manual_update}
-            row.row_data = updated
-        row.message_status = "replied"
-        row.needs_review = False
-    else:
-        raise HTTPException(status_code=400, detail="Invalid action")
+    try:
+        apply_review(row, action.action, action.manual_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    db.commit()
+    await db.commit()
     return {"message": "Review completed", "row_id": row_id}
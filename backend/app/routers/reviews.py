@@ -0,0 +1,135 @@
+"""
+Cross-campaign review queue + bulk approve/reject.
+"""
+
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+
+from app.database import get_async_db
+from app.models import DataRow
+from app.rowlog import record_update
+from app.schemas import (
+    ReviewQueueResponse, BulkReviewRequest, BulkReviewResponse, BulkReviewResult,
+)
+
+router = APIRouter(prefix="/reviews", tags=["reviews"])
+
+# Columns needed by ReviewQueueItem — keeps the large JSON/text columns out of the query
+_QUEUE_COLUMNS = (
+    DataRow.id, DataRow.campaign_id, DataRow.row_index, DataRow.contact_email,
+    DataRow.contact_phone, DataRow.channel, DataRow.reply_text, DataRow.confidence,
+    DataRow.suggested_update, DataRow.updated_at,
+)
+
+
+# ────────────────────────── helpers ──────────────────────────
+
+def apply_review(row: DataRow, action: str, manual_update: dict | None = None):
+    """
+    Apply a reviewer's decision to a row (no commit); data changes go to the row update log.
+    Raises ValueError if the action can't be applied to this row.
+    """
+    if action == "approve" and row.suggested_update:
+        record_update(row, row.suggested_update, "review", row.confidence)
+    elif action == "reject":
+        if manual_update:
+            record_update(row, manual_update, "correction")
+    else:
+        raise ValueError("Invalid action")
+
+    row.message_status = "replied"
+    row.needs_review = False
+
+
+_NULL = "null"  # cursor key of a row without a confidence (those are listed first)
+
+
+def _encode_cursor(row: DataRow, order: str) -> str:
+    if order == "confidence":
+        key = _NULL if row.confidence is None else repr(row.confidence)
+    else:
+        key = row.updated_at.isoformat()
+    return f"{key}|{row.id}"
+
+
+def _decode_cursor(cursor: str, order: str):
+    try:
+        key, row_id = cursor.rsplit("|", 1)
+        if order == "confidence":
+            key = None if key == _NULL else float(key)
+        else:
+            key = datetime.fromisoformat(key)
+        return key, int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after(sort_col, key, last_id: int):
+    """Keyset condition: rows after (key, last_id) in `sort_col NULLS FIRST, id` order."""
+    if key is None:
+        return or_(sort_col.is_not(None), and_(sort_col.is_(None), DataRow.id > last_id))
+    return or_(sort_col > key, and_(sort_col == key, DataRow.id > last_id))
+
+
+# ────────────────────────── routes ──────────────────────────
+
+@router.get("", response_model=ReviewQueueResponse)
+async def get_review_queue(
+    order: str = Query("confidence", pattern="^(confidence|age)$"),
+    campaign_id: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Paginated review queue across all campaigns.
+    Ordered by lowest confidence first (`order=confidence`; rows without one come first)
+    or oldest first (`order=age`).
+    Uses keyset pagination, so deep pages cost the same as the first one.
+    """
+    sort_col = DataRow.confidence if order == "confidence" else DataRow.updated_at
+
+    query = select(DataRow).options(load_only(*_QUEUE_COLUMNS)).where(DataRow.needs_review == True)
+    if campaign_id is not None:
+        query = query.where(DataRow.campaign_id == campaign_id)
+    if cursor:
+        key, last_id = _decode_cursor(cursor, order)
+        query = query.where(_after(sort_col, key, last_id))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = (await db.scalars(query.order_by(sort_col.nulls_first(), DataRow.id).limit(limit + 1))).all()
+    next_cursor = _encode_cursor(rows[limit - 1], order) if len(rows) > limit else None
+
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+@router.post("/bulk", response_model=BulkReviewResponse)
+async def bulk_review(payload: BulkReviewRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Approve / reject many rows in a single transaction.
+    Each item is applied independently; the response reports the outcome per row.
+    """
+    row_ids = {item.row_id for item in payload.items}
+    rows = {r.id: r for r in (await db.scalars(select(DataRow).where(DataRow.id.in_(row_ids)))).all()}
+
+    results = []
+    applied = 0
+    for item in payload.items:
+        row = rows.get(item.row_id)
+        if not row:
+            results.append(BulkReviewResult(row_id=item.row_id, status="not_found"))
+            continue
+        try:
+            apply_review(row, item.action, item.manual_update)
+        except ValueError as e:
+            results.append(BulkReviewResult(row_id=item.row_id, status="invalid_action", detail=str(e)))
+            continue
+        results.append(BulkReviewResult(row_id=item.row_id, status="ok"))
+        applied += 1
+
+    await db.commit()
+    return {"applied": applied, "results": results}
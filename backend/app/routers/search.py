@@ -0,0 +1,44 @@
+"""
+Full-text search across campaign rows (replies, drafts and row data).
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+from app.schemas import SearchResponse
+from app.search import search_rows, to_match_query
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1),
+    campaign_id: int | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Ranked search, e.g. `?q=parking` or `?q="call me back"&campaign_id=3`.
+    All words must match; `resched*` matches by prefix. Archived campaigns are not indexed.
+    Terms matching a very large share of rows come back newest-first (`ranked: false`).
+    """
+    if db.bind.dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Full-text search needs the SQLite FTS5 index")
+    if not to_match_query(q):
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    try:
+        # One extra row tells us whether there is a next page
+        hits, ranked = await search_rows(db, q, campaign_id, limit + 1, offset)
+    except OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e.orig}")
+
+    return {
+        "items": hits[:limit],
+        "ranked": ranked,
+        "next_offset": offset + limit if len(hits) > limit else None,
+    }
@@ -3,8 +3,10 @@ Settings API — model selection and configuration.
 """
 
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from app.config import get_settings
+from app.coordination import refresh_settings, update_settings
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
@@ -12,6 +14,7 @@ router = APIRouter(prefix="/settings", tags=["settings"])
 class ModelListResponse(BaseModel):
     current_model: str
     available_models: list[str]
+    settings_version: int
 
 
 class ModelUpdateRequest(BaseModel):
@@ -21,25 +24,26 @@ class ModelUpdateRequest(BaseModel):
 @router.get("/models", response_model=ModelListResponse)
 async def get_models():
     """Get the current model and list of available Gemini models."""
+    version = await run_in_threadpool(refresh_settings)
     settings = get_settings()
     return {
         "current_model": settings.gemini_model,
         "available_models": settings.available_models,
+        "settings_version": version,
     }
 
 
 @router.post("/models")
 async def set_model(req: ModelUpdateRequest):
     """
-    Update the active Gemini model for this session.
-    Note: In a production app, this would be per-user in the DB.
-    For the prototype, we update the cached settings object.
+    Update the active Gemini model for every worker process.
+    The change is published through the coordination store; other processes pick it up
+    within SETTINGS_REFRESH_INTERVAL.
     """
     settings = get_settings()
 
     if req.model not in settings.available_models:
         return {"error": f"Model '{req.model}' is not available", "available": settings.available_models}
 
-    # Update the cached settings (prototype approach — not persistent across restarts)
-    settings.gemini_model = req.model
-    return {"message": f"Model updated to {req.model}", "current_model": req.model}
+    version = await run_in_threadpool(update_settings, {"gemini_model": req.model})
+    return {"message": f"Model updated to {req.model}", "current_model": req.model, "settings_version": version}
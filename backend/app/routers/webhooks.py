@@ -1,63 +1,96 @@
 """
 Webhook endpoints for receiving replies.
 - Manual reply input (prototype workaround)
+- Bulk reply import (CSV / JSONL)
 - WAHA WhatsApp inbound webhook
-- Email inbound parse (stretch goal)
+- Email inbound (raw MIME or provider payloads, threaded by Message-ID)
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import DataRow
-from app.schemas import ManualReplyInput
+from app.coalesce import ReplyCoalescer
+from app.database import AsyncSessionLocal, get_async_db
+from app.models import DataRow, ReplyFragment
+from app.schemas import ManualReplyInput, JobResponse
 from app.agent import process_reply
 from app.config import get_settings
+from app.ingest import normalize_phones
+from app.jobs import create_job, get_job
+from app.ratelimit import BULK
+from app.rowlog import current_data, current_data_many, record_update
+from app.inbound_email import InboundEmail, parse_mime, parse_provider_payload
 from app.messaging import send_whatsapp
+from app.usage import record_usage
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
 
+def _apply_reply(row: DataRow, reply_text: str, result: dict, source: str):
+    """
+    Store an extracted reply on a row: auto-apply if confident (logged as a row update
+    from `source`), otherwise queue for review.
+    """
+    settings = get_settings()
+    confidence = float(result.get("confidence") or 0)
+
+    row.reply_text = reply_text
+    row.confidence = confidence
+    row.suggested_update = result.get("updates", {})
+
+    if confidence >= settings.confidence_threshold:
+        # Auto-update the row data
+        record_update(row, result.get("updates", {}), source, confidence)
+        row.message_status = "replied"
+        row.needs_review = False
+    else:
+        # Flag for human review
+        row.message_status = "review"
+        row.needs_review = True
+
+
+def _reply_usage(row: DataRow, result: dict) -> list[dict]:
+    """Token usage of the process_reply call behind `result`, as records for record_usage()."""
+    usage = result.get("usage")
+    if not usage:
+        return []
+    return [{"campaign_id": row.campaign_id, "row_id": row.id, "model": result.get("model"), "kind": "reply", **usage}]
+
+
 @router.post("/manual-reply")
 async def manual_reply(
     payload: ManualReplyInput,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Process a manually entered reply (prototype workaround).
     In production this would be triggered by a WhatsApp/Email webhook.
     """
-    row = db.query(DataRow).filter(DataRow.id == payload.data_row_id).first()
+    row = await db.get(DataRow, payload.data_row_id)
     if not row:
         raise HTTPException(status_code=404, detail="Data row not found")
 
     if not row.outbound_message:
         raise HTTPException(status_code=400, detail="No outbound message was sent for this row")
 
-    # Use the agent to process the reply
-    result = process_reply(
-        original_row_data=row.row_data,
+    # Use the agent to process the reply (blocking LLM call — run it off the event loop)
+    result = await run_in_threadpool(
+        process_reply,
+        original_row_data=await db.run_sync(current_data, row),
         outbound_message=row.outbound_message,
         reply_text=payload.reply_text,
     )
 
-    settings = get_settings()
-    row.reply_text = payload.reply_text
-    row.confidence = result.get("confidence", 0)
-    row.suggested_update = result.get("updates", {})
-
-    if result.get("confidence", 0) >= settings.confidence_threshold:
-        # Auto-update the row data
-        updated = {**row.row_data, **result.get("updates", {})}
-        row.row_data = updated
-        row.message_status = "replied"
-        row.needs_review = False
-    else:
-        # Flag for human review
-        row.message_status = "review"
-        row.needs_review = True
-
-    db.commit()
+    _apply_reply(row, payload.reply_text, result, "manual_reply")
+    await db.run_sync(record_usage, _reply_usage(row, result))
+    await db.commit()
 
     return {
         "message": "Reply processed",
@@ -68,19 +101,234 @@ async def manual_reply(
     }
 
 
+# ════════════════════════════════════════════════
+# Bulk reply import (CSV / JSONL)
+# ════════════════════════════════════════════════
+
+def _parse_reply_file(file: UploadFile) -> list[dict]:
+    """
+    Parse an uploaded CSV / JSONL of replies into a list of
+    {"data_row_id": int | None, "contact": str | None, "reply_text": str} items.
+    """
+    contents = file.file.read()
+    filename = file.filename or ""
+
+    if filename.endswith(".csv"):
+        df = pd.read_csv(io.BytesIO(contents), dtype=str)
+    elif filename.endswith((".jsonl", ".ndjson")):
+        df = pd.read_json(io.BytesIO(contents), lines=True, dtype=False)
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Use CSV or JSONL.")
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    for alias, col in (("row_id", "data_row_id"), ("reply", "reply_text"), ("message", "reply_text")):
+        if alias in df.columns and col not in df.columns:
+            df = df.rename(columns={alias: col})
+    if "reply_text" not in df.columns:
+        raise HTTPException(status_code=400, detail="File must have a 'reply_text' column")
+
+    contact_cols = [c for c in ("contact", "contact_email", "contact_phone", "email", "phone") if c in df.columns]
+    if "data_row_id" not in df.columns and not contact_cols:
+        raise HTTPException(status_code=400, detail="File must have a 'data_row_id' or 'contact' column")
+
+    items = []
+    for rec in df.to_dict(orient="records"):
+        row_id = rec.get("data_row_id")
+        contact = next((rec[c] for c in contact_cols if pd.notna(rec.get(c)) and str(rec[c]).strip()), None)
+        items.append({
+            "data_row_id": int(float(row_id)) if pd.notna(row_id) and str(row_id).strip() else None,
+            "contact": str(contact).strip() if contact is not None else None,
+            "reply_text": str(rec["reply_text"]) if pd.notna(rec.get("reply_text")) else "",
+        })
+    return items
+
+
+def _resolve_rows(db: Session, items: list[dict], campaign_id: int | None) -> dict:
+    """
+    Resolve a chunk of import items to DataRows with set-based (indexed) lookups.
+    Returns {item_index: DataRow}. Contacts matching several rows resolve to the latest sent row.
+    """
+    settings = get_settings()
+    ids = {it["data_row_id"] for it in items if it["data_row_id"] is not None}
+    emails = {it["contact"].lower() for it in items if it["data_row_id"] is None and it["contact"] and "@" in it["contact"]}
+
+    # Phones are stored in E.164, so normalize the import the same way
+    phone_items = [i for i, it in enumerate(items) if it["data_row_id"] is None and it["contact"] and "@" not in it["contact"]]
+    normalized, _ = normalize_phones(
+        pd.Series([items[i]["contact"] for i in phone_items], dtype="string"),
+        settings.default_country_code, settings.phone_national_length,
+    )
+    item_phone = {i: p for i, p in zip(phone_items, normalized) if pd.notna(p)}
+    phones = set(item_phone.values())
+
+    by_id, by_email, by_phone = {}, {}, {}
+    if ids:
+        query = db.query(DataRow).filter(DataRow.id.in_(ids))
+        if campaign_id is not None:
+            query = query.filter(DataRow.campaign_id == campaign_id)
+        by_id = {r.id: r for r in query.all()}
+
+    if emails or phones:
+        query = db.query(DataRow).filter(DataRow.outbound_message.isnot(None))
+        if campaign_id is not None:
+            query = query.filter(DataRow.campaign_id == campaign_id)
+        conditions = []
+        if emails:
+            conditions.append(func.lower(DataRow.contact_email).in_(emails))
+        if phones:
+            conditions.append(DataRow.contact_phone.in_(phones))
+        # Ascending id, so later (newer) rows overwrite older ones for the same contact
+        for r in query.filter(or_(*conditions)).order_by(DataRow.id).all():
+            if r.contact_email:
+                by_email[r.contact_email.lower()] = r
+            if r.contact_phone:
+                by_phone[r.contact_phone] = r
+
+    resolved = {}
+    for i, it in enumerate(items):
+        if it["data_row_id"] is not None:
+            row = by_id.get(it["data_row_id"])
+        elif it["contact"] and "@" in it["contact"]:
+            row = by_email.get(it["contact"].lower())
+        elif i in item_phone:
+            row = by_phone.get(item_phone[i])
+        else:
+            row = None
+        if row is not None:
+            resolved[i] = row
+    return resolved
+
+
+def _run_bulk_reply_import(job_id: str, items: list[dict], campaign_id: int | None):
+    """Background task: resolve rows, extract replies concurrently, commit in batches."""
+    import traceback
+    from app.database import SessionLocal  # local import to avoid circular
+
+    job = get_job(job_id)
+    settings = get_settings()
+    chunk_size = max(1, settings.bulk_commit_size)
+    job.status = "running"
+
+    db = SessionLocal()
+    try:
+        with ThreadPoolExecutor(max_workers=settings.llm_max_concurrency) as pool:
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                resolved = _resolve_rows(db, chunk, campaign_id)
+                row_data = current_data_many(db, list({row.id: row for row in resolved.values()}.values()))
+
+                futures = {}
+                for i, item in enumerate(chunk):
+                    row = resolved.get(i)
+                    if row is None:
+                        job.record(False, {"item": start + i, "error": "No matching row"})
+                    elif not row.outbound_message:
+                        job.record(False, {"item": start + i, "row_id": row.id, "error": "No outbound message"})
+                    elif not item["reply_text"].strip():
+                        job.record(False, {"item": start + i, "row_id": row.id, "error": "Empty reply"})
+                    else:
+                        future = pool.submit(
+                            process_reply,
+                            original_row_data=row_data[row.id],
+                            outbound_message=row.outbound_message,
+                            reply_text=item["reply_text"],
+                            lane=BULK,
+                        )
+                        futures[future] = (i, row)
+
+                # Apply in file order so repeated replies to one row end with the last one
+                usage = []
+                for future in sorted(futures, key=lambda f: futures[f][0]):
+                    i, row = futures[future]
+                    try:
+                        result = future.result()
+                        _apply_reply(row, chunk[i]["reply_text"], result, "import")
+                        usage += _reply_usage(row, result)
+                        job.record(True)
+                    except Exception as e:
+                        job.record(False, {"item": start + i, "row_id": row.id, "error": str(e)})
+
+                record_usage(db, usage)
+                db.commit()
+                db.expunge_all()
+
+        job.finish("completed")
+        print(f"[IMPORT] Job {job_id}: {job.succeeded}/{job.total} replies processed")
+    except Exception as e:
+        print(f"[IMPORT ERROR] Job {job_id}: {e}")
+        traceback.print_exc()
+        db.rollback()
+        job.finish("failed")
+    finally:
+        db.close()
+
+
+@router.post("/bulk-reply", response_model=JobResponse)
+async def bulk_reply_import(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    campaign_id: int | None = Form(None),
+):
+    """
+    Import many replies at once from a CSV or JSONL file.
+    Each record needs `reply_text` and either `data_row_id` or `contact` (email / phone).
+    Returns a job handle — poll GET /webhooks/bulk-reply/{job_id} for progress.
+    """
+    items = await run_in_threadpool(_parse_reply_file, file)
+    job = create_job("bulk_reply", total=len(items))
+    background_tasks.add_task(_run_bulk_reply_import, job.id, items, campaign_id)
+    return job
+
+
+@router.get("/bulk-reply/{job_id}", response_model=JobResponse)
+async def bulk_reply_status(job_id: str):
+    """Progress of a bulk reply import."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 # ════════════════════════════════════════════════
 # WAHA WhatsApp Inbound Webhook
 # ════════════════════════════════════════════════
 
+async def _process_whatsapp_burst(row_id: int, text: str, fragment_ids: list[int]):
+    """Coalescer flush: one process_reply for a whole burst of WhatsApp fragments, which it consumes."""
+    async with AsyncSessionLocal() as db:
+        consume = delete(ReplyFragment).where(ReplyFragment.id.in_(fragment_ids))
+        row = await db.get(DataRow, row_id)
+        if row is None:
+            await db.execute(consume)
+            await db.commit()
+            return
+        result = await run_in_threadpool(
+            process_reply,
+            original_row_data=await db.run_sync(current_data, row),
+            outbound_message=row.outbound_message or "",
+            reply_text=text,
+        )
+        _apply_reply(row, text, result, "whatsapp")
+        await db.run_sync(record_usage, _reply_usage(row, result))
+        await db.execute(consume)
+        await db.commit()
+    print(f"[WHATSAPP] Row {row_id}: {len(fragment_ids)} fragment(s) processed as one reply ({result.get('intent')})")
+
+
+reply_coalescer = ReplyCoalescer(_process_whatsapp_burst)
+
+
 @router.post("/whatsapp")
 async def whatsapp_webhook(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Receive inbound WhatsApp messages from WAHA.
     WAHA sends POST requests when messages arrive.
     Configure WAHA webhook URL: http://localhost:8000/webhooks/whatsapp
+    Messages are buffered per row and processed as one reply once the sender pauses
+    (REPLY_DEBOUNCE_SECONDS; 0 processes every message on arrival).
     """
     try:
         body = await request.json()
@@ -104,43 +352,36 @@ async def whatsapp_webhook(
     # Clean the phone number (remove @c.us suffix from WAHA)
     phone = from_number.replace("@c.us", "").replace("@s.whatsapp.net", "")
 
-    # Find matching data rows by phone number
-    rows = db.query(DataRow).filter(
-        DataRow.contact_phone.isnot(None),
-        DataRow.message_status == "sent",
-    ).all()
-
-    matched_row = None
-    for row in rows:
-        if row.contact_phone and phone.endswith(row.contact_phone[-10:]):
-            matched_row = row
-            break
+    # WAHA ids are international numbers without the "+"; rows store E.164 (indexed equality lookup)
+    settings = get_settings()
+    normalized, valid = normalize_phones(
+        pd.Series(["+" + phone], dtype="string"), settings.default_country_code, settings.phone_national_length,
+    )
+    # The sender's latest sent row (their newest campaign), as for email replies
+    matched_row = await db.scalar(
+        select(DataRow).where(
+            DataRow.contact_phone == normalized[0],
+            DataRow.message_status == "sent",
+        ).order_by(DataRow.id.desc()).limit(1)
+    ) if valid[0] else None
 
     if not matched_row:
         return {"status": "no_match", "phone": phone, "message": "No matching sent row found"}
 
+    if settings.reply_debounce_seconds > 0:
+        return {"status": "buffered", "row_id": matched_row.id, **(await reply_coalescer.add(matched_row.id, message_body))}
+
     # Process the reply with AI
-    result = process_reply(
-        original_row_data=matched_row.row_data,
+    result = await run_in_threadpool(
+        process_reply,
+        original_row_data=await db.run_sync(current_data, matched_row),
         outbound_message=matched_row.outbound_message or "",
         reply_text=message_body,
     )
 
-    settings = get_settings()
-    matched_row.reply_text = message_body
-    matched_row.confidence = result.get("confidence", 0)
-    matched_row.suggested_update = result.get("updates", {})
-
-    if result.get("confidence", 0) >= settings.confidence_threshold:
-        updated = {**matched_row.row_data, **result.get("updates", {})}
-        matched_row.row_data = updated
-        matched_row.message_status = "replied"
-        matched_row.needs_review = False
-    else:
-        matched_row.message_status = "review"
-        matched_row.needs_review = True
-
-    db.commit()
+    _apply_reply(matched_row, message_body, result, "whatsapp")
+    await db.run_sync(record_usage, _reply_usage(matched_row, result))
+    await db.commit()
 
     return {
         "status": "processed",
@@ -164,7 +405,7 @@ async def quick_send_whatsapp(request: Request):
     if not phone or not message:
         raise HTTPException(status_code=400, detail="phone and message are required")
 
-    success = send_whatsapp(to=phone, body=message)
+    success = await run_in_threadpool(send_whatsapp, to=phone, body=message)
     return {
         "success": success,
         "phone": phone,
@@ -235,12 +476,83 @@ async def whatsapp_qr():
         return {"error": True, "detail": str(e)}
 
 
+# ════════════════════════════════════════════════
+# Email Inbound
+# ════════════════════════════════════════════════
+
+async def ingest_email(db: AsyncSession, inbound: InboundEmail) -> dict:
+    """
+    Match an inbound email to the row it answers and process the reply.
+    Rows are found by In-Reply-To / References against the Message-IDs we sent (one
+    indexed lookup), falling back to the latest sent row for the sender's address.
+    """
+    if not inbound.text.strip():
+        return {"status": "ignored", "reason": "Empty reply"}
+
+    row, matched_by = None, "thread"
+    thread_ids = inbound.thread_ids
+    if thread_ids:
+        rows = {
+            r.email_message_id: r
+            for r in await db.scalars(select(DataRow).where(DataRow.email_message_id.in_(thread_ids)))
+        }
+        row = next((rows[i] for i in thread_ids if i in rows), None)
+    if row is None and inbound.sender:
+        matched_by = "sender"
+        row = await db.scalar(
+            select(DataRow).where(
+                DataRow.contact_email == inbound.sender,
+                DataRow.message_status == "sent",
+            ).order_by(DataRow.id.desc()).limit(1)
+        )
+
+    if row is None or not row.outbound_message:
+        return {"status": "no_match", "sender": inbound.sender, "message": "No matching sent row found"}
+    if inbound.message_id and row.reply_message_id == inbound.message_id:
+        return {"status": "duplicate", "row_id": row.id}  # provider redelivery
+
+    result = await run_in_threadpool(
+        process_reply,
+        original_row_data=await db.run_sync(current_data, row),
+        outbound_message=row.outbound_message,
+        reply_text=inbound.text,
+    )
+
+    _apply_reply(row, inbound.text, result, "email")
+    row.reply_message_id = inbound.message_id
+    await db.run_sync(record_usage, _reply_usage(row, result))
+    await db.commit()
+
+    return {
+        "status": "processed",
+        "row_id": row.id,
+        "matched_by": matched_by,
+        "intent": result.get("intent"),
+        "confidence": result.get("confidence"),
+    }
+
+
 @router.post("/email")
 async def email_webhook(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Placeholder for email inbound parse webhook (SendGrid / Mailgun).
-    TODO: Implement when deploying with a real domain.
+    Receive inbound email replies. Accepts the raw message (`message/rfc822` or any
+    non-form body), a provider's JSON payload (e.g. Postmark) or a provider form post
+    (SendGrid Inbound Parse, Mailgun routes).
     """
-    return {"message": "Email webhook endpoint ready — not yet configured"}
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if content_type == "application/json":
+            inbound = await run_in_threadpool(parse_provider_payload, await request.json())
+        elif content_type in ("multipart/form-data", "application/x-www-form-urlencoded"):
+            form = await request.form()
+            fields = {k: v for k, v in form.items() if isinstance(v, str)}  # attachments are ignored
+            inbound = await run_in_threadpool(parse_provider_payload, fields)
+        else:
+            inbound = await run_in_threadpool(parse_mime, await request.body())
+    except Exception as e:
+        return {"status": "ignored", "reason": f"Unparseable email: {e}"}
+
+    return await ingest_email(db, inbound)
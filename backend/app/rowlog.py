@@ -0,0 +1,358 @@
+"""
+Append-only log of changes to row data.
+
+Replies (auto-applied or approved in review), reviewer corrections and re-uploads don't
+rewrite a row's row_data document: they insert a RowUpdate with just the fields that
+changed, where the change came from and how confident the extraction was. row_data is
+the state as of the row's `applied_update_id`. The compactor folds newer updates into it
+every ROW_COMPACTION_INTERVAL seconds (one write per row however many updates arrived)
+and stores on each update the values it replaced.
+
+Until then readers overlay a row's pending updates (`current_data()`, `overlay_pending()`):
+reply extraction, the campaign detail and the exports do, and their segment filters
+re-check rows that have pending updates against the overlaid data. Search, review
+queue filters and cost estimates see the updates after the next compaction. With
+ROW_COMPACTION_INTERVAL=0 there is no compactor, so updates are folded when the
+transaction that logged them commits. The replaced values let `campaign_state_at()`
+rebuild a campaign as it was at any earlier time.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Iterator
+
+from sqlalchemy import and_, bindparam, event, exists, func, insert, or_, select, update
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.cache import mark_changed
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import DataRow, RowUpdate
+
+COMPACT_BATCH_ROWS = 500  # rows folded per transaction
+IN_CHUNK = 500  # ids per IN (...) lookup
+
+_last_run: dict | None = None
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _applied():
+    return func.coalesce(DataRow.applied_update_id, 0)
+
+
+def apply_update(data: dict, updates: dict, replaces: bool) -> tuple[dict, dict]:
+    """(data with the update applied, previous values of the fields it set)."""
+    if replaces:
+        return dict(updates), dict(data)
+    return {**data, **updates}, {k: data[k] for k in updates if k in data}
+
+
+def undo_update(data: dict, updates: dict, replaces: bool, previous: dict) -> dict:
+    if replaces:
+        return dict(previous)
+    data = dict(data)
+    for k in updates:
+        if k in previous:
+            data[k] = previous[k]
+        else:
+            data.pop(k, None)  # the update added the field
+    return data
+
+
+# ────────────────────── writing ──────────────────────
+
+def record_update(row: DataRow, updates: dict, source: str, confidence: float | None = None):
+    """
+    Append an update of `row`'s data to its session; it is committed with the caller's
+    transaction (and folded into row_data at that commit when compaction is disabled).
+    """
+    if updates:
+        session = object_session(row)
+        session.add(RowUpdate(
+            row_id=row.id, campaign_id=row.campaign_id, source=source, updates=updates, confidence=confidence,
+        ))
+        if get_settings().row_compaction_interval <= 0:
+            session.info.setdefault("rowlog_fold", set()).add(row.id)
+
+
+@event.listens_for(Session, "before_commit")
+def _fold_on_commit(session):
+    row_ids = session.info.pop("rowlog_fold", None)
+    if not row_ids:
+        return
+    session.flush()
+    folded = _fold(session, sorted(row_ids))
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, DataRow) and obj.id in folded:
+            data, applied = folded[obj.id]
+            set_committed_value(obj, "row_data", data)
+            set_committed_value(obj, "applied_update_id", applied)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_fold(session):
+    session.info.pop("rowlog_fold", None)
+
+
+def _pending(db: Session, row_ids: list[int]) -> dict[int, list[tuple[int, dict, bool]]]:
+    """row_id -> its updates newer than applied_update_id, oldest first: [(id, updates, replaces)]."""
+    pending = defaultdict(list)
+    for start in range(0, len(row_ids), IN_CHUNK):
+        for row_id, update_id, updates, replaces in db.execute(
+            select(RowUpdate.row_id, RowUpdate.id, RowUpdate.updates, RowUpdate.replaces)
+            .join(DataRow, DataRow.id == RowUpdate.row_id)
+            .where(RowUpdate.row_id.in_(row_ids[start:start + IN_CHUNK]), RowUpdate.id > _applied())
+            .order_by(RowUpdate.row_id, RowUpdate.id)
+        ):
+            pending[row_id].append((update_id, updates, replaces))
+    return pending
+
+
+def has_pending_updates():
+    """SQL condition (correlated to data_rows): the row has updates not yet folded into row_data."""
+    return exists().where(RowUpdate.row_id == DataRow.id, RowUpdate.id > _applied())
+
+
+def overlay_pending(db: Session, stored: dict[int, dict]) -> dict[int, dict]:
+    """row id -> its stored row_data with the row's not yet compacted updates applied."""
+    pending = _pending(db, list(stored))
+    result = {}
+    for row_id, data in stored.items():
+        for _, updates, replaces in pending.get(row_id, ()):
+            data, _ = apply_update(data, updates, replaces)
+        result[row_id] = data
+    return result
+
+
+def current_data_many(db: Session, rows: list[DataRow]) -> dict[int, dict]:
+    """row id -> row_data with the row's not yet compacted updates applied."""
+    return overlay_pending(db, {row.id: row.row_data for row in rows})
+
+
+def current_data(db: Session, row: DataRow) -> dict:
+    return current_data_many(db, [row])[row.id]
+
+
+_set_previous = (
+    update(RowUpdate.__table__)
+    .where(
+        RowUpdate.__table__.c.id == bindparam("update_id"),
+        # only if the row still holds the fold this was computed for (a re-upload may have superseded it)
+        exists().where(
+            DataRow.__table__.c.id == RowUpdate.__table__.c.row_id,
+            DataRow.__table__.c.applied_update_id == bindparam("folded_through"),
+        ),
+    )
+    .values(previous=bindparam("new_previous"))
+)
+
+
+def replace_rows(db: Session, campaign_id: int, replacements: dict[int, dict]) -> dict[int, int]:
+    """
+    Log re-uploaded rows (row id -> new row_data) as `replaces` updates that supersede their
+    pending ones. Returns row id -> update id, the rows' new applied_update_id; the caller
+    writes row_data and commits.
+    """
+    if not replacements:
+        return {}
+    row_ids = list(replacements)
+    stored = {}
+    for start in range(0, len(row_ids), IN_CHUNK):
+        stored.update(db.execute(
+            select(DataRow.id, DataRow.row_data).where(DataRow.id.in_(row_ids[start:start + IN_CHUNK]))
+        ).all())
+    pending = _pending(db, row_ids)
+
+    records, superseded = [], {}
+    for row_id, new_data in replacements.items():
+        data = stored[row_id]
+        for update_id, updates, replaces in pending.get(row_id, ()):
+            data, previous = apply_update(data, updates, replaces)
+            superseded[update_id] = previous
+        records.append({
+            "row_id": row_id, "campaign_id": campaign_id, "source": "upload",
+            "updates": new_data, "replaces": True, "previous": data,
+        })
+    update_ids = dict(zip(row_ids, db.scalars(
+        insert(RowUpdate).returning(RowUpdate.id, sort_by_parameter_order=True), records
+    ).all()))
+    if superseded:
+        table = RowUpdate.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("update_id")).values(previous=bindparam("new_previous")),
+            [{"update_id": update_id, "new_previous": previous} for update_id, previous in superseded.items()],
+        )
+    return update_ids
+
+
+# ────────────────────── compaction ──────────────────────
+
+def _fold(db: Session, row_ids: list[int]) -> dict[int, tuple[dict, int]]:
+    """Fold the rows' pending updates into row_data. Returns row id -> (row_data, applied_update_id)."""
+    table = DataRow.__table__
+    stored = {
+        row_id: (campaign_id, data, applied)
+        for row_id, campaign_id, data, applied in db.execute(
+            select(table.c.id, table.c.campaign_id, table.c.row_data, table.c.applied_update_id)
+            .where(table.c.id.in_(row_ids))
+        )
+    }
+    rows, annotations, campaigns = [], [], set()
+    for row_id, updates_list in _pending(db, row_ids).items():
+        campaign_id, data, applied = stored[row_id]
+        folded_through = updates_list[-1][0]
+        for update_id, updates, replaces in updates_list:
+            data, previous = apply_update(data, updates, replaces)
+            annotations.append({"update_id": update_id, "new_previous": previous, "folded_through": folded_through})
+        rows.append({"row_id": row_id, "expected": applied or 0, "new_data": data, "new_applied": folded_through})
+        campaigns.add(campaign_id)
+    if not rows:
+        return {}
+
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("row_id"), func.coalesce(table.c.applied_update_id, 0) == bindparam("expected"))
+        # not a change anyone made: keep updated_at (review queue age order)
+        .values(row_data=bindparam("new_data"), applied_update_id=bindparam("new_applied"), updated_at=table.c.updated_at),
+        rows,
+    )
+    db.execute(_set_previous, annotations)
+    mark_changed(db, campaigns)
+    return {r["row_id"]: (r["new_data"], r["new_applied"]) for r in rows}
+
+
+def compact_rows(db: Session, campaign_id: int | None = None) -> int:
+    """Fold pending updates into row_data, COMPACT_BATCH_ROWS rows per transaction. Returns rows folded."""
+    query = (
+        select(RowUpdate.row_id)
+        .distinct()
+        .join(DataRow, DataRow.id == RowUpdate.row_id)
+        .where(RowUpdate.id > _applied())
+    )
+    if campaign_id is not None:
+        query = query.where(RowUpdate.campaign_id == campaign_id)
+    row_ids = db.scalars(query).all()
+    folded = 0
+    for start in range(0, len(row_ids), COMPACT_BATCH_ROWS):
+        try:
+            folded += len(_fold(db, row_ids[start:start + COMPACT_BATCH_ROWS]))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return folded
+
+
+def compact() -> dict:
+    global _last_run
+    start = time.monotonic()
+    db = SessionLocal()
+    try:
+        rows = compact_rows(db)
+    finally:
+        db.close()
+    _last_run = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "rows": rows,
+        "seconds": round(time.monotonic() - start, 3),
+    }
+    return _last_run
+
+
+def _compaction_loop():
+    while not _stop.wait(get_settings().row_compaction_interval):
+        try:
+            compact()
+        except Exception as e:
+            print(f"[ROWLOG ERROR] Compaction pass failed: {e}")
+
+
+def start_row_compactor():
+    """Start the background row log compactor (no-op when ROW_COMPACTION_INTERVAL=0)."""
+    global _thread
+    if get_settings().row_compaction_interval <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_compaction_loop, name="row-compactor", daemon=True)
+    _thread.start()
+
+
+def stop_row_compactor():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+def rowlog_stats(db: Session) -> dict:
+    pending = db.scalar(
+        select(func.count()).select_from(RowUpdate).join(DataRow, DataRow.id == RowUpdate.row_id)
+        .where(RowUpdate.id > _applied())
+    )
+    return {
+        "updates": db.scalar(select(func.count()).select_from(RowUpdate)),
+        "pending": pending,
+        "interval": get_settings().row_compaction_interval,
+        "last_compaction": _last_run,
+    }
+
+
+# ────────────────────── history ──────────────────────
+
+def campaign_state_at(campaign_id: int, at: datetime, chunk_size: int = 1000) -> Iterator[list[dict]]:
+    """
+    Yield a live campaign's rows as they were at `at`, in row order, a chunk at a time:
+    [{"row_id", "row_index", "row_data"}]. Rows created later are left out.
+    """
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(DataRow.id, DataRow.row_index, DataRow.row_data)
+                .where(DataRow.campaign_id == campaign_id, DataRow.id > last_id, DataRow.created_at <= at)
+                .order_by(DataRow.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+
+            # Folded updates made after `at` are undone, pending ones made before are applied
+            undo, redo = defaultdict(list), defaultdict(list)
+            for row_id, update_id, updates, replaces, previous, folded in db.execute(
+                select(
+                    RowUpdate.row_id, RowUpdate.id, RowUpdate.updates, RowUpdate.replaces, RowUpdate.previous,
+                    RowUpdate.id <= _applied(),
+                )
+                .join(DataRow, DataRow.id == RowUpdate.row_id)
+                .where(
+                    RowUpdate.row_id.in_([r.id for r in rows]),
+                    or_(
+                        and_(RowUpdate.id <= _applied(), RowUpdate.created_at > at),
+                        and_(RowUpdate.id > _applied(), RowUpdate.created_at <= at),
+                    ),
+                )
+                .order_by(RowUpdate.row_id, RowUpdate.id)
+            ):
+                if folded:
+                    undo[row_id].append((updates, replaces, previous or {}))
+                else:
+                    redo[row_id].append((updates, replaces))
+
+            chunk = []
+            for row_id, row_index, data in rows:
+                for updates, replaces, previous in reversed(undo.get(row_id, ())):
+                    data = undo_update(data, updates, replaces, previous)
+                for updates, replaces in redo.get(row_id, ()):
+                    data, _ = apply_update(data, updates, replaces)
+                chunk.append({"row_id": row_id, "row_index": row_index, "row_data": data})
+            yield chunk
+    finally:
+        db.close()
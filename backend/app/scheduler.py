@@ -0,0 +1,434 @@
+"""
+Weighted fair scheduler for campaign row work.
+
+All running campaigns share one worker pool (and therefore one Gemini quota).
+Row work is interleaved with two-level deficit round-robin: first across tenants
+(`Campaign.user_email`), then across each tenant's campaigns. Tenant weights come
+from settings, campaign weights from `Campaign.weight`, and each tenant is capped
+at `tenant_max_concurrency` in-flight rows so one big blast can't take every worker.
+
+A run's work items are prefetched on a separate thread (PREFETCH_SIZE at a time): the
+item iterator may query the database, and the dispatch loop holds the scheduler lock,
+so a slow or failing query never stalls other tenants or kills the loop.
+
+Controls usually reach a run through `control()`, but a pause, resume, cancel or
+throttle handled by another worker process only changes the database. So every
+STATUS_SYNC_INTERVAL seconds each run's `poll_status` callable is called (on the
+prefetch threads) and its result applied. A work item whose processing finds the
+campaign no longer running returns DEFERRED: it goes back to the front of the queue
+and the run pauses until a status sync says otherwise.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterator
+
+from app.config import get_settings
+from app.ratelimit import TokenBucket
+
+THROUGHPUT_WINDOW = 60.0  # seconds used for the rows/sec figure in stats()
+IDLE_WAIT = 0.05  # seconds to sleep when nothing could be dispatched
+PREFETCH_SIZE = 200  # work items pulled from a run's iterator per refill
+PREFETCH_LOW = 50  # refill once a run's buffer drops below this
+STATUS_SYNC_INTERVAL = 2.0  # seconds between a run's status syncs
+DEFERRED = "deferred"  # returned by a run's `process` to hand its item back (see module docstring)
+
+_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="run-prefetch")
+
+
+class CampaignRun:
+    """One running campaign as seen by the scheduler: a stream of row work items."""
+
+    def __init__(
+        self,
+        campaign_id: int,
+        tenant: str,
+        items: Iterator,
+        process: Callable,
+        on_finish: Callable[["CampaignRun"], None],
+        weight: float = 1.0,
+        send_rate: float = 1.0,
+        max_concurrency: int | None = None,
+        poll_status: Callable[[], dict] | None = None,
+    ):
+        self.campaign_id = campaign_id
+        self.tenant = tenant
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate=send_rate, capacity=1)
+        self.in_flight = 0
+        self.processed = 0
+        self.deficit = 0.0
+        self.paused = False
+        self.cancelled = False
+        self.error: Exception | None = None  # the item iterator failed; the run ends early
+        self._items = items
+        self._buffer: deque = deque()
+        self._refilling = False
+        self._exhausted = False
+        self._buffer_lock = threading.Lock()
+        self._notify: Callable[[], None] = lambda: None  # wakes the scheduler after a refill
+        self._process = process
+        self._on_finish = on_finish
+        # -> {"state": "running" | "paused" | "stopped", "send_rate", "max_concurrency"}
+        self._poll_status = poll_status
+        self._synced_at = 0.0  # monotonic; 0 = sync on the next pass
+        self._syncing = False
+
+    # ── live controls (picked up on the scheduler's next pass) ──
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def cancel(self):
+        """Drop all queued items; rows already in flight still finish."""
+        with self._buffer_lock:
+            self.cancelled = True
+            self._buffer.clear()
+            self._exhausted = True
+
+    def throttle(self, send_rate: float | None = None, max_concurrency: int | None = None):
+        if send_rate is not None:
+            self.bucket.set_rate(send_rate)
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+    def defer(self, item):
+        """Put back an item whose campaign turned out not to be running, and pause."""
+        with self._buffer_lock:
+            if not self.cancelled:
+                self._buffer.appendleft(item)
+        self.paused = True
+        self._synced_at = 0.0
+
+    # ── status sync (prefetch threads) ──
+
+    def sync_due(self, now: float) -> bool:
+        return (
+            self._poll_status is not None and not self.cancelled and not self._syncing
+            and now - self._synced_at >= STATUS_SYNC_INTERVAL
+        )
+
+    def sync_status(self):
+        """Apply the campaign's state as stored, whichever process changed it."""
+        try:
+            status = self._poll_status()
+        except Exception as e:
+            status = None
+            print(f"[SCHEDULER ERROR] Campaign {self.campaign_id}: status sync failed: {e}")
+        if status is not None:
+            if status["state"] == "stopped":
+                self.cancel()
+            else:
+                self.paused = status["state"] == "paused"
+                if status["send_rate"] != self.bucket.rate or status["max_concurrency"] != self.max_concurrency:
+                    self.bucket.set_rate(status["send_rate"])
+                    self.max_concurrency = status["max_concurrency"]
+        self._synced_at = time.monotonic()
+        self._syncing = False
+        self._notify()
+
+    def _refill(self):
+        """Prefetch thread: pull the next items from the iterator (which may query the DB)."""
+        items, error = [], None
+        try:
+            items.extend(islice(self._items, PREFETCH_SIZE))
+        except Exception as e:  # keep what was read; the run ends after it
+            error = e
+            print(f"[SCHEDULER ERROR] Campaign {self.campaign_id}: reading work items failed: {e}")
+        with self._buffer_lock:
+            self._refilling = False
+            if not self.cancelled:
+                self._buffer.extend(items)
+                self.error = self.error or error
+                self._exhausted = self._exhausted or error is not None or len(items) < PREFETCH_SIZE
+        self._notify()
+
+    def has_work(self) -> bool:
+        """An item is buffered; starts a background refill when the buffer runs low. Never blocks."""
+        with self._buffer_lock:
+            if len(self._buffer) < PREFETCH_LOW and not self._exhausted and not self._refilling:
+                self._refilling = True
+                _prefetcher.submit(self._refill)
+            return bool(self._buffer)
+
+    def ready(self) -> bool:
+        """Not paused, has a work item and room for another concurrent row."""
+        if self.paused:
+            return False
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return False
+        return self.has_work()
+
+    def take(self):
+        with self._buffer_lock:
+            return self._buffer.popleft()
+
+    @property
+    def done(self) -> bool:
+        if self.in_flight:
+            return False
+        with self._buffer_lock:
+            if self._buffer or self._refilling:
+                return False
+            if self._exhausted:
+                return True
+        self.has_work()  # nothing fetched yet: start the first refill
+        return False
+
+
+class _Tenant:
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.deficit = 0.0
+        self.runs: deque[CampaignRun] = deque()
+        self.in_flight = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.finished_at: deque[float] = deque()  # completion timestamps within THROUGHPUT_WINDOW
+
+    def pick_run(self) -> CampaignRun | None:
+        """Campaign-level deficit round-robin within this tenant."""
+        for _ in range(2 * len(self.runs)):  # two passes so fractional weights can accumulate
+            run = self.runs[0]
+            if run.ready():
+                if run.deficit < 1:
+                    run.deficit = min(run.deficit + run.weight, max(run.weight, 1.0))
+                if run.deficit >= 1 and run.bucket.try_acquire():
+                    run.deficit -= 1
+                    if run.deficit < 1:
+                        self.runs.rotate(-1)
+                    return run
+            else:
+                run.deficit = 0.0
+            self.runs.rotate(-1)
+        return None
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_workers: int,
+        tenant_max_concurrency: int,
+        tenant_weights: dict[str, float],
+        default_tenant_weight: float = 1.0,
+    ):
+        self.max_workers = max_workers
+        self.tenant_max_concurrency = tenant_max_concurrency
+        self.tenant_weights = tenant_weights
+        self.default_tenant_weight = default_tenant_weight
+        self._tenants: OrderedDict[str, _Tenant] = OrderedDict()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="campaign")
+        self._thread = threading.Thread(target=self._loop, name="fair-scheduler", daemon=True)
+        self._thread.start()
+
+    # ── public API ──
+
+    def submit(self, run: CampaignRun):
+        with self._lock:
+            tenant = self._tenants.get(run.tenant)
+            if tenant is None:
+                weight = self.tenant_weights.get(run.tenant, self.default_tenant_weight)
+                tenant = self._tenants[run.tenant] = _Tenant(run.tenant, weight)
+            run._notify = self._wakeup.set
+            tenant.runs.append(run)
+        self._wakeup.set()
+
+    def get_run(self, campaign_id: int) -> CampaignRun | None:
+        with self._lock:
+            return self._find_run(campaign_id)
+
+    def control(self, campaign_id: int, action: str, **kwargs) -> bool:
+        """
+        Apply a live control ("pause" | "resume" | "cancel" | "throttle") to a running campaign.
+        Returns False if the campaign has no live run in this process.
+        """
+        with self._lock:
+            run = self._find_run(campaign_id)
+            if run is None:
+                return False
+            getattr(run, action)(**kwargs)
+        self._wakeup.set()  # re-evaluate immediately instead of on the next idle tick
+        return True
+
+    def stats(self) -> dict:
+        """Per-tenant throughput and queue state."""
+        now = time.monotonic()
+        with self._lock:
+            tenants = {}
+            for t in self._tenants.values():
+                while t.finished_at and now - t.finished_at[0] > THROUGHPUT_WINDOW:
+                    t.finished_at.popleft()
+                tenants[t.name] = {
+                    "weight": t.weight,
+                    "active_campaigns": [
+                        {
+                            "campaign_id": r.campaign_id,
+                            "weight": r.weight,
+                            "paused": r.paused,
+                            "in_flight": r.in_flight,
+                            "processed": r.processed,
+                            "send_rate": r.bucket.rate,
+                            "max_concurrency": r.max_concurrency,
+                        }
+                        for r in t.runs
+                    ],
+                    "in_flight": t.in_flight,
+                    "dispatched": t.dispatched,
+                    "completed": t.completed,
+                    "failed": t.failed,
+                    "rows_per_sec": round(len(t.finished_at) / THROUGHPUT_WINDOW, 3),
+                }
+            return {"workers": self.max_workers, "in_flight": self._in_flight, "tenants": tenants}
+
+    def shutdown(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ── dispatch loop ──
+
+    def _find_run(self, campaign_id: int) -> CampaignRun | None:
+        """The campaign's live run. A cancelled run may still be draining its in-flight rows
+        next to a relaunched one; controls and lookups must never land on it."""
+        for tenant in self._tenants.values():
+            for run in tenant.runs:
+                if run.campaign_id == campaign_id and not run.cancelled:
+                    return run
+        return None
+
+    def _loop(self):
+        while not self._stopped:
+            finished, dispatched = [], 0
+            try:
+                with self._lock:
+                    self._start_syncs()
+                    dispatched = self._dispatch_round()
+                    for tenant in self._tenants.values():
+                        for run in [r for r in tenant.runs if r.done]:
+                            tenant.runs.remove(run)
+                            finished.append(run)
+            except Exception as e:  # keep scheduling every other campaign
+                print(f"[SCHEDULER ERROR] Dispatch pass failed: {e}")
+
+            for run in finished:
+                try:
+                    run._on_finish(run)
+                except Exception as e:
+                    print(f"[SCHEDULER ERROR] Finishing campaign {run.campaign_id}: {e}")
+
+            if not dispatched and not finished:
+                self._wakeup.wait(IDLE_WAIT)
+                self._wakeup.clear()
+
+    def _start_syncs(self):
+        """Queue the status syncs that are due. Caller holds the lock."""
+        now = time.monotonic()
+        for tenant in self._tenants.values():
+            for run in tenant.runs:
+                if run.sync_due(now):
+                    run._syncing = True
+                    _prefetcher.submit(run.sync_status)
+
+    def _dispatch_round(self) -> int:
+        """
+        One tenant-level deficit round-robin pass. Caller holds the lock.
+
+        A tenant that used up its credit goes to the back, so when the pool is full the
+        next freed worker goes to the next tenant in turn, not back to the first one.
+        """
+        dispatched = 0
+        for tenant in list(self._tenants.values()):
+            if self._in_flight >= self.max_workers:
+                break
+            if not tenant.runs:
+                tenant.deficit = 0.0
+                continue
+
+            if tenant.deficit < 1:
+                tenant.deficit = min(tenant.deficit + tenant.weight, max(tenant.weight, 1.0))
+            while (
+                tenant.deficit >= 1
+                and self._in_flight < self.max_workers
+                and tenant.in_flight < self.tenant_max_concurrency
+            ):
+                run = tenant.pick_run()
+                if run is None:
+                    tenant.deficit = 0.0  # nothing runnable: don't bank credit while idle
+                    break
+                self._dispatch(tenant, run, run.take())
+                tenant.deficit -= 1
+                dispatched += 1
+            if tenant.deficit < 1:
+                self._tenants.move_to_end(tenant.name)
+        return dispatched
+
+    def _dispatch(self, tenant: _Tenant, run: CampaignRun, item):
+        run.in_flight += 1
+        tenant.in_flight += 1
+        tenant.dispatched += 1
+        self._in_flight += 1
+        self._pool.submit(self._execute, tenant, run, item)
+
+    def _execute(self, tenant: _Tenant, run: CampaignRun, item):
+        ok, deferred = True, False
+        try:
+            deferred = run._process(item) == DEFERRED
+        except Exception as e:
+            ok = False
+            print(f"[SCHEDULER ERROR] Campaign {run.campaign_id}, item {item}: {e}")
+        finally:
+            with self._lock:
+                run.in_flight -= 1
+                tenant.in_flight -= 1
+                self._in_flight -= 1
+                if deferred:
+                    run.defer(item)
+                else:
+                    run.processed += 1
+                    if ok:
+                        tenant.completed += 1
+                    else:
+                        tenant.failed += 1
+                    tenant.finished_at.append(time.monotonic())
+            self._wakeup.set()
+
+
+_scheduler: FairScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FairScheduler:
+    """Process-wide scheduler, started on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            settings = get_settings()
+            _scheduler = FairScheduler(
+                max_workers=settings.scheduler_workers,
+                tenant_max_concurrency=settings.tenant_max_concurrency,
+                tenant_weights=settings.tenant_weights,
+                default_tenant_weight=settings.default_tenant_weight,
+            )
+        return _scheduler
+
+
+def shutdown_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown()
+            _scheduler = None
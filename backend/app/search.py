@@ -0,0 +1,133 @@
+"""
+Full-text search over replies, drafts and row data (SQLite FTS5).
+
+`data_rows_fts` holds one document per DataRow (rowid = data_rows.id) with the
+reply, the outbound message and the flattened row_data values. Triggers on
+data_rows keep it in sync on insert, on updates of those columns and on delete,
+so every write path (ORM, bulk inserts, batch results, archiving) is covered.
+"""
+
+import html
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+FTS_TABLE = "data_rows_fts"
+SNIPPET_TOKENS = 12
+# FTS5 wraps matches in these; they are swapped for <mark> after the text is HTML-escaped
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+# bm25 has to score every match before it can sort, so terms matching more rows than this
+# are returned newest-first instead (their ranking carries almost no signal anyway)
+RANK_MAX_MATCHES = 20_000
+# bm25 column weights: reply_text, outbound_message, row_text (campaign_id is unindexed)
+RANK_WEIGHTS = "bm25(2.0, 1.0, 1.0)"
+
+_ROW_TEXT = "(SELECT group_concat(value, ' ') FROM json_each({row}.row_data))"
+
+FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        reply_text, outbound_message, row_text, campaign_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS data_rows_fts_insert AFTER INSERT ON data_rows BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, reply_text, outbound_message, row_text, campaign_id)
+        VALUES (new.id, new.reply_text, new.outbound_message, {_ROW_TEXT.format(row="new")}, new.campaign_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS data_rows_fts_update
+    AFTER UPDATE OF reply_text, outbound_message, row_data ON data_rows BEGIN
+        UPDATE {FTS_TABLE}
+        SET reply_text = new.reply_text,
+            outbound_message = new.outbound_message,
+            row_text = {_ROW_TEXT.format(row="new")}
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS data_rows_fts_delete AFTER DELETE ON data_rows BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+
+def ensure_fts(conn: Connection):
+    """Create the FTS table and sync triggers if missing; backfill existing rows on first creation."""
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    for statement in FTS_DDL:
+        conn.execute(text(statement))
+    if not exists:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', :rank)"),
+                     {"rank": RANK_WEIGHTS})
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, reply_text, outbound_message, row_text, campaign_id) "
+            f"SELECT id, reply_text, outbound_message, {_ROW_TEXT.format(row='data_rows')}, campaign_id "
+            f"FROM data_rows"
+        ))
+
+
+def drop_fts(conn: Connection):
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def to_match_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word must match (implicit AND),
+    `"quoted phrases"` stay phrases and a trailing `*` makes a prefix search.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query):
+        prefix = word.endswith("*")
+        token = (phrase or word.rstrip("*")).replace('"', '""').strip()
+        if token:
+            terms.append(f'"{token}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+async def search_rows(
+    db: AsyncSession, query: str, campaign_id: int | None, limit: int, offset: int
+) -> tuple[list[dict], bool]:
+    """
+    Matching rows with a highlighted snippet from the best-matching column.
+    Returns (hits, ranked): best matches first (bm25), or newest first for very common terms.
+    """
+    match = to_match_query(query)
+    campaign_filter = "AND f.campaign_id = :campaign_id" if campaign_id is not None else ""
+    params = {"match": match, "campaign_id": campaign_id, "limit": limit, "offset": offset}
+
+    too_common = await db.scalar(
+        text(f"SELECT 1 FROM {FTS_TABLE} f WHERE {FTS_TABLE} MATCH :match {campaign_filter} LIMIT 1 OFFSET :cap"),
+        {**params, "cap": RANK_MAX_MATCHES},
+    )
+    order = "f.rowid DESC" if too_common else "f.rank"
+
+    result = await db.execute(
+        text(f"""
+            SELECT d.id AS row_id, d.campaign_id, d.row_index, d.message_status,
+                   snippet({FTS_TABLE}, -1, char(2), char(3), '…', {SNIPPET_TOKENS}) AS snippet,
+                   f.rank AS score
+            FROM {FTS_TABLE} f
+            JOIN data_rows d ON d.id = f.rowid
+            WHERE {FTS_TABLE} MATCH :match {campaign_filter}
+            ORDER BY {order}
+            LIMIT :limit OFFSET :offset
+        """),
+        params,
+    )
+    return [{**r, "snippet": _highlight(r["snippet"])} for r in result.mappings()], not too_common
+
+
+def _highlight(snippet: str | None) -> str:
+    """HTML-escape a snippet (reply text is attacker-controlled), then mark the matches."""
+    return html.escape(snippet or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
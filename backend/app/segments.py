@@ -0,0 +1,337 @@
+"""
+Segment filters over `row_data`.
+
+A segment is a small boolean expression over the uploaded columns, e.g.
+
+    City == "Pune" and Status != "confirmed"
+    (Age >= 30 or VIP == true) and not Email contains "@test."
+    "Lead Source" in ["web", "referral"]
+
+Operators: == (or =), !=, <, <=, >, >=, in [...], contains; combined with
+and / or / not and parentheses. Keys are bare names or quoted strings; values are
+quoted strings, numbers, true / false / null.
+
+Segments compile to `json_extract(row_data, '$."Key"')` comparisons so the database
+does the filtering (and can use the expression indexes created for hot keys).
+Archived rows are filtered in Python with the same semantics as SQLite: a missing
+key is unknown (never matches, even under `not`) and numbers sort before text.
+
+On PostgreSQL they compile to JSONB operators instead: equality becomes containment
+(`row_data @> '{"Key": value}'`), which the GIN index on row_data serves for any key,
+and other comparisons compare `row_data -> 'Key'` with a JSONB value. The semantics
+match except where JSONB orders across types (text sorts before numbers there) and
+JSON booleans are not equal to 1 / 0.
+"""
+
+import hashlib
+import json
+import operator
+import re
+
+from sqlalchemy import Text, and_, cast, func, literal, literal_column, not_, or_, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Connection
+
+from app.database import engine
+from app.models import DataRow
+
+SEGMENT_INDEX_PREFIX = "ix_data_rows_seg_"
+COMPARISONS = {
+    "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|=|<|>|\(|\)|\[|\]|,)
+      | (?P<word>[A-Za-z_][\w.\-]*)
+    )""", re.VERBOSE)
+
+
+class SegmentError(ValueError):
+    """Raised for a segment expression that can't be parsed."""
+
+
+# ════════════════════════════════════════════════
+# Parsing
+# ════════════════════════════════════════════════
+
+def _tokenize(expression: str) -> list[tuple[str, object]]:
+    tokens, pos = [], 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        m = _TOKEN_RE.match(expression, pos)
+        if not m or m.end() == pos:
+            raise SegmentError(f"Unexpected character at position {pos}: {expression[pos:pos + 10]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        raw = m.group(kind)
+        if kind == "number":
+            tokens.append(("value", float(raw) if "." in raw else int(raw)))
+        elif kind == "string":
+            tokens.append(("string", re.sub(r"\\(.)", r"\1", raw[1:-1])))
+        elif kind == "word" and raw.lower() in ("and", "or", "not", "in", "contains"):
+            tokens.append(("keyword", raw.lower()))
+        elif kind == "word" and raw.lower() in ("true", "false", "null"):
+            tokens.append(("value", {"true": True, "false": False, "null": None}[raw.lower()]))
+        else:
+            tokens.append((kind, raw))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent: or_expr > and_expr > not_expr > comparison | ( expr )."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value is not None and token[1] != value):
+            expected = value or kind or "more input"
+            raise SegmentError(f"Expected {expected} but found {token[1] if token[0] else 'end of expression'}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.or_expr()
+        if self.peek()[0] is not None:
+            raise SegmentError(f"Unexpected {self.peek()[1]!r}")
+        return node
+
+    def or_expr(self):
+        nodes = [self.and_expr()]
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            nodes.append(self.and_expr())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def and_expr(self):
+        nodes = [self.not_expr()]
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            nodes.append(self.not_expr())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def not_expr(self):
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return ("not", self.not_expr())
+        if self.peek() == ("op", "("):
+            self.take()
+            node = self.or_expr()
+            self.take("op", ")")
+            return node
+        return self.comparison()
+
+    def value(self):
+        kind, value = self.peek()
+        if kind not in ("value", "string"):
+            raise SegmentError(f"Expected a value but found {value if kind else 'end of expression'}")
+        self.pos += 1
+        return value
+
+    def comparison(self):
+        kind, key = self.peek()
+        if kind not in ("word", "string"):
+            raise SegmentError(f"Expected a column name but found {key if kind else 'end of expression'}")
+        self.pos += 1
+        if '"' in key:
+            raise SegmentError(f'Column names containing " are not supported: {key!r}')
+
+        kind, op = self.peek()
+        if kind == "keyword" and op == "in":
+            self.take()
+            self.take("op", "[")
+            values = [self.value()]
+            while self.peek() == ("op", ","):
+                self.take()
+                values.append(self.value())
+            self.take("op", "]")
+            return ("in", key, values)
+        if kind == "keyword" and op == "contains":
+            self.take()
+            return ("contains", key, str(self.value()))
+        if kind == "op" and (op in COMPARISONS or op == "="):
+            self.take()
+            op, value = "==" if op == "=" else op, self.value()
+            if value is None and op not in ("==", "!="):
+                raise SegmentError("null can only be compared with == or !=")
+            return ("cmp", key, op, value)
+        raise SegmentError(f"Expected an operator after {key!r}")
+
+
+def parse_segment(expression: str):
+    """Parse a segment expression into a small AST (tuples). Raises SegmentError."""
+    if not expression or not expression.strip():
+        raise SegmentError("Empty segment")
+    return _Parser(_tokenize(expression)).parse()
+
+
+# ════════════════════════════════════════════════
+# SQL compilation
+# ════════════════════════════════════════════════
+
+def json_path(key: str) -> str:
+    return f'$."{key}"'
+
+
+def field(key: str):
+    """json_extract(row_data, '$."key"') with the path inlined, so expression indexes match."""
+    path = json_path(key).replace("'", "''")
+    return func.json_extract(DataRow.row_data, literal_column(f"'{path}'"))
+
+
+def _to_json_extract(node):
+    kind = node[0]
+    if kind == "and":
+        return and_(*(_to_json_extract(n) for n in node[1]))
+    if kind == "or":
+        return or_(*(_to_json_extract(n) for n in node[1]))
+    if kind == "not":
+        return not_(_to_json_extract(node[1]))
+    if kind == "in":
+        return field(node[1]).in_(node[2])
+    if kind == "contains":
+        return field(node[1]).contains(node[2], autoescape=True)
+
+    _, key, op, value = node
+    column = field(key)
+    if value is None:
+        return column.is_(None) if op == "==" else column.isnot(None)
+    if isinstance(value, bool):
+        value = int(value)  # json_extract returns JSON true / false as 1 / 0
+    return COMPARISONS[op](column, value)
+
+
+def _jsonb(value):
+    return cast(literal(json.dumps(value), Text), JSONB)
+
+
+def _jsonb_field(key: str):
+    """row_data -> 'key', with JSON null as SQL NULL (as json_extract returns it)."""
+    return func.nullif(DataRow.row_data.op("->", return_type=JSONB)(literal(key, Text)), _jsonb(None))
+
+
+def _to_jsonb(node, negated: bool = False):
+    """
+    PostgreSQL compilation. Outside `not`, an equality that is false and one that is unknown
+    (missing key) both exclude the row, so it can be the GIN-indexable containment test;
+    under `not` it has to stay unknown for missing keys, so it compares the field instead.
+    """
+    kind = node[0]
+    if kind == "and":
+        return and_(*(_to_jsonb(n, negated) for n in node[1]))
+    if kind == "or":
+        return or_(*(_to_jsonb(n, negated) for n in node[1]))
+    if kind == "not":
+        return not_(_to_jsonb(node[1], not negated))
+    if kind == "in":
+        if not negated:
+            return or_(*(_to_jsonb(("cmp", node[1], "==", v)) for v in node[2]))
+        return _jsonb_field(node[1]).in_([_jsonb(v) for v in node[2]])
+    if kind == "contains":
+        text_value = DataRow.row_data.op("->>", return_type=Text)(literal(node[1], Text))
+        return text_value.icontains(node[2], autoescape=True)
+
+    _, key, op, value = node
+    column = _jsonb_field(key)
+    if value is None:
+        return column.is_(None) if op == "==" else column.isnot(None)
+    if op == "==" and not negated:
+        return DataRow.row_data.op("@>", is_comparison=True)(_jsonb({key: value}))
+    return COMPARISONS[op](column, _jsonb(value))
+
+
+def compile_segment(expression: str):
+    """Parse a segment and return a SQLAlchemy filter over DataRow.row_data."""
+    node = parse_segment(expression)
+    return _to_jsonb(node) if engine.dialect.name == "postgresql" else _to_json_extract(node)
+
+
+# ════════════════════════════════════════════════
+# Python evaluation (archived rows)
+# ════════════════════════════════════════════════
+
+def _sql_value(value) -> tuple:
+    """Sort key mirroring SQLite: numbers (and JSON booleans, as 1 / 0) sort before text."""
+    if isinstance(value, (bool, int, float)):
+        return (1, int(value) if isinstance(value, bool) else value)
+    if isinstance(value, str):
+        return (2, value)
+    return (2, json.dumps(value, separators=(",", ":")))  # arrays / objects come back as JSON text
+
+
+def _evaluate(node, row_data: dict) -> bool | None:
+    """Three-valued like SQL: a missing key is unknown (None), and unknown never matches."""
+    kind = node[0]
+    if kind in ("and", "or"):
+        results = [_evaluate(n, row_data) for n in node[1]]
+        decisive = kind == "or"  # True decides an or, False decides an and
+        if decisive in results:
+            return decisive
+        return None if None in results else not decisive
+    if kind == "not":
+        result = _evaluate(node[1], row_data)
+        return None if result is None else not result
+
+    actual = row_data.get(node[1])
+    if kind == "cmp" and node[3] is None:
+        return (actual is None) == (node[2] == "==")
+    if actual is None:
+        return None
+    if kind == "in":
+        return any(_sql_value(actual) == _sql_value(v) for v in node[2])
+    if kind == "contains":
+        return node[2].lower() in str(_sql_value(actual)[1]).lower()
+
+    _, _, op, value = node
+    return COMPARISONS[op](_sql_value(actual), _sql_value(value))
+
+
+def segment_matcher(expression: str):
+    """Parse a segment and return a predicate over row_data dicts."""
+    node = parse_segment(expression)
+    return lambda row_data: _evaluate(node, row_data) is True
+
+
+# ════════════════════════════════════════════════
+# Expression indexes for hot keys
+# ════════════════════════════════════════════════
+
+def segment_index_name(key: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", key.lower()).strip("_")[:40]
+    return f"{SEGMENT_INDEX_PREFIX}{slug}_{hashlib.sha1(key.encode()).hexdigest()[:6]}"
+
+
+def create_segment_index(conn: Connection, key: str) -> str:
+    """Index (campaign_id, json_extract(row_data, '$."key"')) so segments on `key` are index scans."""
+    if '"' in key:
+        raise SegmentError(f'Column names containing " are not supported: {key!r}')
+    name = segment_index_name(key)
+    path = json_path(key).replace("'", "''")
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {name} ON data_rows (campaign_id, json_extract(row_data, '{path}'))"
+    ))
+    return name
+
+
+def list_segment_indexes(conn: Connection) -> list[dict]:
+    rows = conn.execute(
+        text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE :prefix"),
+        {"prefix": f"{SEGMENT_INDEX_PREFIX}%"},
+    )
+    return [{"name": name, "sql": sql} for name, sql in rows]
+
+
+def drop_segment_index(conn: Connection, key: str) -> str:
+    name = segment_index_name(key)
+    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return name
@@ -0,0 +1,324 @@
+"""
+External SQL databases as campaign sources.
+
+A source is a SQLAlchemy URL and a SELECT query. A sync streams the query's result
+through a server-side cursor in chunks of SOURCE_CHUNK_SIZE rows; each chunk is
+validated by build_row_records, merged by RowMerger and committed, so only one chunk
+of source rows is held at a time. RowMerger itself keeps the campaign's row keys,
+content hashes and claimed recipients in memory, which grows with the campaign.
+An interrupted sync keeps the chunks it committed, and repeating it is harmless:
+unchanged rows are skipped.
+
+With a `watermark_column` (a value that only grows, e.g. updated_at or an
+auto-increment id) a sync only reads rows at or above the highest value the last
+successful sync saw. Rows sharing that value are read again (and skipped if
+unchanged), so a row committed with the same timestamp after the last sync is not
+missed. With a `sync_interval` the background syncer repeats it. Like rows merged
+from a file, new and changed rows wait for the next launch.
+"""
+
+import json
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator
+
+import pandas as pd
+from sqlalchemy import create_engine, or_, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from app.cache import mark_changed
+from app.config import get_settings
+from app.database import SessionLocal
+from app.ingest import RowMerger, build_row_records
+from app.jobs import Job
+from app.models import Campaign
+
+_syncing: set[int] = set()
+_syncing_lock = threading.Lock()
+_last_run: dict | None = None
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+class SourceError(Exception):
+    """The source database can't be reached or the query doesn't fit the campaign."""
+
+
+# ────────────────────── reading ──────────────────────
+
+def _plain(value):
+    """A source value as something JSON (row_data) can hold."""
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", "replace")
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)  # UUID, enums, ...
+
+
+def encode_watermark(value) -> str:
+    if isinstance(value, (datetime, date)):
+        return json.dumps({type(value).__name__: value.isoformat()})
+    if isinstance(value, Decimal):
+        value = _plain(value)
+    return json.dumps(value)
+
+
+def decode_watermark(raw: str | None):
+    """Back to the type the source returned, so it compares correctly in the source's SQL."""
+    if raw is None:
+        return None
+    value = json.loads(raw)
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return date.fromisoformat(value["date"])
+    return value
+
+
+def _source_engine(url: str) -> Engine:
+    try:
+        return create_engine(url, poolclass=NullPool)
+    except Exception as e:  # malformed URL, driver not installed
+        raise SourceError(f"Cannot use source URL: {e}") from e
+
+
+def _statement(engine: Engine, query: str, watermark_column: str | None, watermark, empty: bool = False):
+    """The campaign query, wrapped to filter and order by the watermark column."""
+    query = query.strip().rstrip(";")
+    if not watermark_column and not empty:
+        return text(query), {}
+    column = engine.dialect.identifier_preparer.quote(watermark_column) if watermark_column else None
+    if empty:
+        where, params = " WHERE 1 = 0", {}
+    elif watermark is not None:
+        # >=: rows written later with the same value as the last high mark are still read
+        where, params = f" WHERE {column} >= :watermark", {"watermark": watermark}
+    else:
+        where, params = "", {}
+    order = f" ORDER BY {column}" if column and not empty else ""
+    return text(f"SELECT * FROM ({query}) AS source{where}{order}"), params
+
+
+def source_columns(url: str, query: str) -> list[str]:
+    """Run the query for its columns only (checks connection, credentials and SQL)."""
+    engine = _source_engine(url)
+    try:
+        with engine.connect() as conn:
+            return list(conn.execute(*_statement(engine, query, None, None, empty=True)).keys())
+    except SourceError:
+        raise
+    except Exception as e:
+        raise SourceError(f"Source query failed: {e}") from e
+    finally:
+        engine.dispose()
+
+
+def read_source(
+    url: str, query: str, chunk_size: int, watermark_column: str | None = None, watermark=None,
+) -> Iterator[tuple[pd.DataFrame, object]]:
+    """
+    Yield the query's rows (at or above `watermark`, if given) as DataFrames of up to `chunk_size`
+    rows, each with the chunk's highest watermark value as the source returned it.
+    """
+    engine = _source_engine(url)
+    try:
+        with engine.connect() as conn:
+            # stream_results: a server-side cursor where the driver has one (psycopg, mysqlclient, ...),
+            # so the source never sends more than a chunk ahead of us
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                *_statement(engine, query, watermark_column, watermark)
+            )
+            columns = list(result.keys())
+            position = columns.index(watermark_column) if watermark_column else None
+            for rows in result.partitions(chunk_size):
+                values = [row[position] for row in rows if row[position] is not None] if watermark_column else []
+                # dtype=object keeps ints as ints when a column has NULLs
+                df = pd.DataFrame([[_plain(v) for v in row] for row in rows], columns=columns, dtype=object)
+                yield df, max(values, default=None)
+    except SourceError:
+        raise
+    except Exception as e:
+        raise SourceError(f"Reading the source failed: {e}") from e
+    finally:
+        engine.dispose()
+
+
+# ────────────────────── syncing ──────────────────────
+
+def is_syncing(campaign_id: int) -> bool:
+    with _syncing_lock:
+        return campaign_id in _syncing
+
+
+def sync_source(campaign_id: int, job: Job | None = None) -> dict:
+    """
+    Read the campaign's source (incrementally with a watermark column) into its rows.
+    One transaction per chunk; the watermark only moves once the whole sync succeeded.
+    Returns RowMerger counts (+ "watermark").
+    """
+    with _syncing_lock:
+        busy = campaign_id in _syncing
+        _syncing.add(campaign_id)
+    if busy:
+        error = SourceError("A sync of this campaign is already running")
+        if job:
+            job.errors.append({"error": str(error)})
+            job.finish("failed")
+        raise error
+    if job:
+        job.status = "running"
+    settings = get_settings()
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        url, query = campaign.source_url, campaign.source_query
+        key_column, watermark_column = campaign.key_column, campaign.watermark_column
+        high = since = decode_watermark(campaign.watermark) if watermark_column else None
+        merger = RowMerger(db, campaign_id)
+        db.commit()
+
+        for df, chunk_high in read_source(url, query, settings.source_chunk_size, watermark_column, since):
+            records, _ = build_row_records(
+                df, campaign_id,
+                default_country_code=settings.default_country_code,
+                national_length=settings.phone_national_length,
+                key_column=key_column,
+            )
+            merger.merge(records)
+            db.commit()
+            if chunk_high is not None:
+                high = chunk_high if high is None else max(high, chunk_high)
+            if job:
+                job.processed += len(df)
+                job.succeeded = merger.counts["inserted"] + merger.counts["updated"]
+
+        result = merger.result()
+        if watermark_column:
+            result.pop("missing")  # an incremental read only sees rows that changed
+        campaign = db.get(Campaign, campaign_id)
+        if high is not None:
+            campaign.watermark = encode_watermark(high)
+        campaign.synced_at = datetime.now(timezone.utc)
+        db.commit()
+        result["watermark"] = campaign.watermark
+        print(
+            f"[SOURCE] Campaign {campaign_id}: {result['total']} rows read, "
+            f"{result['inserted']} new, {result['updated']} changed"
+        )
+        if job:
+            job.result = result
+            job.finish("completed")
+        return result
+    except Exception as e:
+        db.rollback()
+        print(f"[SOURCE ERROR] Campaign {campaign_id}: {e}")
+        if job:
+            job.errors.append({"error": str(e)})
+            job.finish("failed")
+        raise
+    finally:
+        db.close()
+        with _syncing_lock:
+            _syncing.discard(campaign_id)
+
+
+def run_sync_job(campaign_id: int, job: Job):
+    """Background-task wrapper: failures are reported on the job."""
+    try:
+        sync_source(campaign_id, job)
+    except Exception:
+        pass  # logged, and recorded on the job
+
+
+# ════════════════════════════════════════════════
+# Scheduled syncs
+# ════════════════════════════════════════════════
+
+def _claim(campaign_id: int, interval: float) -> bool:
+    """Push the campaign's next sync forward; False if another process already did."""
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        claimed = db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, or_(Campaign.next_sync_at.is_(None), Campaign.next_sync_at <= now))
+            .values(next_sync_at=now + timedelta(seconds=interval))
+        ).rowcount == 1
+        if claimed:
+            mark_changed(db, {campaign_id}, campaign_level=True)
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+
+def sync_due() -> dict:
+    """Sync every campaign whose scheduled sync is due, skipping campaigns that are sending."""
+    from app.worker import is_campaign_active  # local import to avoid circular
+
+    global _last_run
+    start = time.monotonic()
+    db = SessionLocal()
+    try:
+        due = db.execute(
+            select(Campaign.id, Campaign.sync_interval).where(
+                Campaign.sync_interval.is_not(None),
+                Campaign.source_url.is_not(None),
+                Campaign.archived_at.is_(None),
+                or_(Campaign.next_sync_at.is_(None), Campaign.next_sync_at <= datetime.now(timezone.utc)),
+            ).order_by(Campaign.next_sync_at)
+        ).all()
+    finally:
+        db.close()
+
+    synced, failed = [], []
+    for campaign_id, interval in due:
+        if is_campaign_active(campaign_id) or is_syncing(campaign_id) or not _claim(campaign_id, interval):
+            continue
+        try:
+            sync_source(campaign_id)
+            synced.append(campaign_id)
+        except Exception:
+            failed.append(campaign_id)
+
+    _last_run = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "synced": synced,
+        "failed": failed,
+        "seconds": round(time.monotonic() - start, 2),
+    }
+    return _last_run
+
+
+def _sync_loop():
+    while not _stop.wait(get_settings().source_sync_poll_interval):
+        try:
+            sync_due()
+        except Exception as e:
+            print(f"[SOURCE ERROR] Scheduled sync pass failed: {e}")
+
+
+def start_source_syncer():
+    """Start the scheduled source syncer (no-op when SOURCE_SYNC_POLL_INTERVAL=0)."""
+    global _thread
+    if get_settings().source_sync_poll_interval <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_sync_loop, name="source-syncer", daemon=True)
+    _thread.start()
+
+
+def stop_source_syncer():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
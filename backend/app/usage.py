@@ -0,0 +1,193 @@
+"""
+LLM token and cost accounting.
+
+Every LLM call's token counts are folded into `llm_usage` (one row per campaign, row,
+model and kind) and its cost is added to `Campaign.spent_usd`, so a budget check is a
+single primary-key read. Costs use `settings.llm_prices` (USD per 1M tokens) at the
+time the call is recorded.
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.agent import draft_batch_request
+from app.cache import mark_changed
+from app.config import get_settings
+from app.models import Campaign, DataRow, LlmUsage
+
+USAGE_KEY = ("campaign_id", "row_id", "model", "kind")
+COUNTERS = ("calls", "input_tokens", "output_tokens", "cost_usd")
+CHARS_PER_TOKEN = 4  # prompt-size heuristic for estimates (no tokenizer call per row)
+ESTIMATE_SAMPLE = 200  # pending rows whose prompts are measured for an estimate
+
+
+def cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Price of one call; models missing from settings.llm_prices cost 0 (tokens are still counted)."""
+    input_price, output_price = get_settings().llm_prices.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def _insert(db: Session):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def record_usage(db: Session, records: list[dict]) -> float:
+    """
+    Fold LLM calls into the usage table and add their cost to each campaign's spend. Caller commits.
+    Each record: {"campaign_id", "row_id", "model", "kind", "input_tokens", "output_tokens"}.
+    Returns the total cost recorded.
+    """
+    # Merge calls sharing a key first: one upsert may not touch the same row twice
+    merged: dict[tuple, dict] = {}
+    for r in records:
+        key = tuple(r[k] for k in USAGE_KEY)
+        entry = merged.setdefault(key, {**dict(zip(USAGE_KEY, key)), **dict.fromkeys(COUNTERS, 0)})
+        entry["calls"] += 1
+        entry["input_tokens"] += r.get("input_tokens") or 0
+        entry["output_tokens"] += r.get("output_tokens") or 0
+        entry["cost_usd"] += cost_usd(r["model"], r.get("input_tokens") or 0, r.get("output_tokens") or 0)
+    if not merged:
+        return 0.0
+
+    table = LlmUsage.__table__
+    stmt = _insert(db)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(USAGE_KEY),
+        set_={
+            **{c: table.c[c] + stmt.excluded[c] for c in COUNTERS},
+            "updated_at": datetime.now(timezone.utc),
+        },
+    )
+    db.execute(stmt, list(merged.values()))
+
+    spent: dict[int, float] = {}
+    for entry in merged.values():
+        spent[entry["campaign_id"]] = spent.get(entry["campaign_id"], 0.0) + entry["cost_usd"]
+    campaigns = Campaign.__table__
+    for campaign_id, cost in spent.items():
+        db.execute(
+            update(campaigns)
+            .where(campaigns.c.id == campaign_id)
+            .values(spent_usd=func.coalesce(campaigns.c.spent_usd, 0) + cost)
+        )
+    mark_changed(db, spent.keys(), campaign_level=True)
+    return sum(spent.values())
+
+
+def budget_exhausted(db: Session, campaign_id: int) -> bool:
+    """True once a campaign's spend has reached its budget (always False without a budget)."""
+    row = db.execute(
+        select(Campaign.budget_usd, Campaign.spent_usd).where(Campaign.id == campaign_id)
+    ).one_or_none()
+    if row is None or row.budget_usd is None:
+        return False
+    return (row.spent_usd or 0) >= row.budget_usd
+
+
+# ════════════════════════════════════════════════
+# Reporting
+# ════════════════════════════════════════════════
+
+def _sums():
+    return (
+        func.sum(LlmUsage.calls), func.sum(LlmUsage.input_tokens),
+        func.sum(LlmUsage.output_tokens), func.sum(LlmUsage.cost_usd),
+    )
+
+
+def _totals(calls, input_tokens, output_tokens, cost) -> dict:
+    return {
+        "calls": int(calls or 0),
+        "input_tokens": int(input_tokens or 0),
+        "output_tokens": int(output_tokens or 0),
+        "cost_usd": round(cost or 0.0, 6),
+    }
+
+
+async def campaign_usage(db: AsyncSession, campaign: Campaign) -> dict:
+    """Token and cost totals for a campaign, overall and broken down by model and by kind."""
+    result = await db.execute(
+        select(LlmUsage.model, LlmUsage.kind, *_sums())
+        .where(LlmUsage.campaign_id == campaign.id)
+        .group_by(LlmUsage.model, LlmUsage.kind)
+    )
+    by_model: dict[str, list] = {}
+    by_kind: dict[str, list] = {}
+    for model, kind, *sums in result:
+        for bucket in (by_model.setdefault(model, [0, 0, 0, 0.0]), by_kind.setdefault(kind, [0, 0, 0, 0.0])):
+            for i, value in enumerate(sums):
+                bucket[i] += value or 0
+    overall = [sum(b[i] for b in by_model.values()) for i in range(4)]
+    return {
+        **_totals(*overall),
+        "budget_usd": campaign.budget_usd,
+        "by_model": {m: _totals(*b) for m, b in sorted(by_model.items())},
+        "by_kind": {k: _totals(*b) for k, b in sorted(by_kind.items())},
+    }
+
+
+async def top_rows(db: AsyncSession, campaign_id: int, limit: int) -> list[dict]:
+    """The campaign's most expensive rows (all models and kinds summed)."""
+    result = await db.execute(
+        select(LlmUsage.row_id, *_sums())
+        .where(LlmUsage.campaign_id == campaign_id)
+        .group_by(LlmUsage.row_id)
+        .order_by(func.sum(LlmUsage.cost_usd).desc(), LlmUsage.row_id)
+        .limit(limit)
+    )
+    return [{"row_id": row_id, **_totals(*sums)} for row_id, *sums in result]
+
+
+async def estimate_campaign(db: AsyncSession, campaign: Campaign, segment_filter, model: str) -> dict:
+    """
+    Pre-launch estimate of the drafting cost for the rows a launch would draft (pending,
+    not yet drafted, in the segment). Input tokens come from the size of the real prompts
+    of a sample of those rows; output tokens from this model's past drafts, or
+    settings.estimate_output_tokens without history. Reply processing is not included.
+    """
+    settings = get_settings()
+    query = select(DataRow.row_data).where(
+        DataRow.campaign_id == campaign.id,
+        DataRow.message_status == "pending",
+        DataRow.outbound_message.is_(None),
+    )
+    if segment_filter is not None:
+        query = query.where(segment_filter)
+
+    rows = await db.scalar(select(func.count()).select_from(query.subquery()))
+    sample = (await db.scalars(query.order_by(DataRow.id).limit(ESTIMATE_SAMPLE))).all()
+    prompt_chars = [
+        sum(len(m["content"]) for m in draft_batch_request("", campaign.master_prompt, row_data, model)["messages"])
+        for row_data in sample
+    ]
+    input_per_row = sum(prompt_chars) / len(prompt_chars) / CHARS_PER_TOKEN if prompt_chars else 0.0
+
+    output_tokens, calls = (await db.execute(
+        select(func.sum(LlmUsage.output_tokens), func.sum(LlmUsage.calls))
+        .where(LlmUsage.model == model, LlmUsage.kind == "draft")
+    )).one()
+    if calls:
+        output_per_row, output_source = output_tokens / calls, "history"
+    else:
+        output_per_row, output_source = float(settings.estimate_output_tokens), "default"
+
+    input_total, output_total = round(rows * input_per_row), round(rows * output_per_row)
+    cost = cost_usd(model, input_total, output_total)
+    spent = campaign.spent_usd or 0.0
+    return {
+        "model": model,
+        "rows": rows,
+        "sampled_rows": len(sample),
+        "input_tokens": input_total,
+        "output_tokens": output_total,
+        "cost_usd": round(cost, 6),
+        "output_tokens_per_row": round(output_per_row, 1),
+        "output_tokens_source": output_source,
+        "spent_usd": round(spent, 6),
+        "budget_usd": campaign.budget_usd,
+        "within_budget": None if campaign.budget_usd is None else spent + cost <= campaign.budget_usd,
+    }
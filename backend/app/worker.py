@@ -0,0 +1,484 @@
+"""
+Campaign execution — drafts and sends the pending rows of a campaign.
+Rows are processed one at a time per work item on the shared fair scheduler,
+each with its own short-lived DB session. In batch drafting mode every draft is
+produced up front by one asynchronous batch job, and the scheduler only sends.
+Token usage of every draft is recorded, and a campaign that reaches its budget
+is paused before its next draft (see app/usage.py). Transiently failed rows are
+retried with backoff (see app/retry.py); a campaign stays running until none are left.
+
+A row is claimed before it is drafted, so several worker processes can run the same
+campaign without drafting or sending a row twice (see `_claim_row`). A row is only
+claimed while its campaign is RUNNING, so a pause or cancel handled by another process
+takes effect at the next row; the run itself picks the change up at its next status
+sync. The process holding a campaign's run keeps a heartbeat on the campaign, so a
+resume handled elsewhere leaves the run to it instead of starting a second one.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from sqlalchemy import bindparam, func, or_, select, update
+
+from app.agent import draft_message, draft_batch_request
+from app.batch import get_batch_backend
+from app.cache import mark_changed
+from app.config import get_settings
+from app.database import SessionLocal
+from app.messaging import deliver_message, new_message_id
+from app.models import Campaign, CampaignStatus, DataRow
+from app.profiling import profile_scope
+from app.retry import record_failure, requeue_due
+from app.scheduler import DEFERRED, STATUS_SYNC_INTERVAL, CampaignRun, get_scheduler
+from app.segments import compile_segment
+from app.usage import budget_exhausted, record_usage
+
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+RUN_HEARTBEAT_TIMEOUT = 3 * STATUS_SYNC_INTERVAL  # a run not heard from for this long is gone
+
+
+def _pending_rows(db, campaign_id: int, segment: str | None, *columns):
+    query = db.query(*columns).filter(
+        DataRow.campaign_id == campaign_id,
+        DataRow.message_status == "pending",
+    )
+    if segment:
+        query = query.filter(compile_segment(segment))
+    return query
+
+
+def iter_pending_row_ids(campaign_id: int, chunk_size: int, segment: str | None = None):
+    """
+    Yield the ids of a campaign's pending rows (optionally only those in `segment`) in id
+    order, fetched in keyset chunks. Each chunk uses its own short session, so memory
+    stays flat however big the campaign is.
+    """
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            chunk = [
+                row_id for (row_id,) in _pending_rows(db, campaign_id, segment, DataRow.id)
+                .filter(DataRow.id > last_id)
+                .order_by(DataRow.id).limit(chunk_size)
+            ]
+        finally:
+            db.close()
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1]
+
+
+def _process_row(row_id: int, campaign_id: int, master_prompt: str, campaign_name: str, model_name: str):
+    """Scheduler work item for one row (profiled when a capture targets this campaign)."""
+    db = SessionLocal()
+    try:
+        with profile_scope(campaign_id=campaign_id):
+            return _draft_and_send(db, row_id, master_prompt, campaign_name, model_name)
+    finally:
+        db.close()
+
+
+# ────────────────────── run ownership ──────────────────────
+
+def _heartbeat(db, campaign_id: int, at: datetime | None):
+    """Mark (or with None, release) this process as the holder of the campaign's run."""
+    table = Campaign.__table__
+    query = update(table).where(table.c.id == campaign_id)
+    if at is None:
+        query = query.where(table.c.run_owner == PROCESS_ID)
+    db.execute(query.values(run_owner=PROCESS_ID if at else None, run_heartbeat_at=at))
+
+
+def _poll_run_status(campaign_id: int) -> dict:
+    """Status sync of a live run: refresh the heartbeat and return the campaign's stored controls."""
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        if campaign is None:
+            return {"state": "stopped"}
+        _heartbeat(db, campaign_id, datetime.now(timezone.utc))
+        db.commit()
+        states = {CampaignStatus.RUNNING: "running", CampaignStatus.PAUSED: "paused"}
+        return {
+            "state": states.get(campaign.status, "stopped"),
+            "send_rate": campaign.send_rate or get_settings().campaign_send_rate,
+            "max_concurrency": campaign.max_concurrency,
+        }
+    finally:
+        db.close()
+
+
+def run_held_elsewhere(db, campaign_id: int) -> bool:
+    """True if another process holds a live run of the campaign (its heartbeat is recent)."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=RUN_HEARTBEAT_TIMEOUT)
+    return db.scalar(
+        select(Campaign.id).where(
+            Campaign.id == campaign_id,
+            Campaign.run_owner != PROCESS_ID,
+            Campaign.run_heartbeat_at > cutoff,
+        )
+    ) is not None
+
+
+def _stop_for_budget(db, campaign_id: int):
+    """
+    Pause a campaign that has reached its budget. Its run is dropped rather than paused,
+    so resuming (after raising the budget) re-queues every row still pending.
+    """
+    campaign = db.get(Campaign, campaign_id)
+    if campaign.status == CampaignStatus.RUNNING:
+        campaign.transition(CampaignStatus.PAUSED)
+        db.commit()
+        print(f"[CAMPAIGN] Campaign {campaign_id}: budget of ${campaign.budget_usd:.4f} reached, paused")
+    get_scheduler().control(campaign_id, "cancel")
+
+
+def _claim_row(db, row_id: int) -> bool:
+    """
+    Stamp a pending row's claimed_at for this worker and commit; False if another worker
+    holds a live claim on it (claims older than ROW_CLAIM_TIMEOUT are from dead workers)
+    or its campaign is not RUNNING (paused or cancelled, possibly by another process).
+    On PostgreSQL the row is locked FOR UPDATE SKIP LOCKED, so a worker never waits on a
+    row another one is claiming (SQLite serializes writers anyway and ignores the clause).
+    """
+    table = DataRow.__table__
+    now = datetime.now(timezone.utc)
+    candidate = (
+        select(table.c.id)
+        .where(
+            table.c.id == row_id,
+            table.c.message_status == "pending",
+            table.c.campaign_id.in_(
+                select(Campaign.id).where(Campaign.status == CampaignStatus.RUNNING)
+            ),
+            or_(
+                table.c.claimed_at.is_(None),
+                table.c.claimed_at < now - timedelta(seconds=get_settings().row_claim_timeout),
+            ),
+        )
+        .with_for_update(skip_locked=True)
+    )
+    claimed = db.execute(
+        update(table).where(table.c.id.in_(candidate)).values(claimed_at=now)
+    ).rowcount == 1
+    db.commit()
+    return claimed
+
+
+def _draft_and_send(db, row_id: int, master_prompt: str, campaign_name: str, model_name: str):
+    """
+    Draft + send one row. Errors schedule a retry or mark the row failed, and never escape.
+    Returns DEFERRED, leaving the row pending, if the campaign is no longer running.
+    """
+    row = db.get(DataRow, row_id)
+    if row is None or row.message_status != "pending":
+        return  # deleted or already handled since the run was queued
+    if not row.outbound_message and budget_exhausted(db, row.campaign_id):
+        _stop_for_budget(db, row.campaign_id)
+        return  # stays pending for when the campaign is resumed
+    if not _claim_row(db, row_id):
+        if db.scalar(select(Campaign.status).where(Campaign.id == row.campaign_id)) != CampaignStatus.RUNNING:
+            return DEFERRED  # paused or cancelled elsewhere: the run re-syncs before going on
+        return  # another worker is on it, or it was handled in the meantime
+
+    try:
+        # Rows without a contact never reach the LLM (normally caught at ingest)
+        contact = row.contact_phone if row.channel == "whatsapp" else row.contact_email
+        if not contact:
+            row.message_status = "invalid"
+            row.claimed_at = None
+            db.commit()
+            print(f"[CAMPAIGN] Row {row.id}: No contact, marked invalid")
+            return
+
+        # 1. Draft the message using Gemini (unless a batch job already did)
+        if row.outbound_message:
+            message = row.outbound_message
+        else:
+            print(f"[CAMPAIGN] Row {row.id}: Drafting message with {model_name}...")
+            draft = draft_message(master_prompt, row.row_data, model_name=model_name)
+            message = draft.text
+            row.outbound_message = message
+            row.draft_model = draft.model
+            record_usage(db, [{
+                "campaign_id": row.campaign_id, "row_id": row.id, "model": draft.model, "kind": "draft",
+                "input_tokens": draft.input_tokens, "output_tokens": draft.output_tokens,
+            }])
+            db.commit()  # keep the paid-for draft (and its usage) even if sending fails
+            print(f"[CAMPAIGN] Row {row.id}: Drafted OK: {message[:80]}...")
+
+        # 2. Send via the appropriate channel (emails get a Message-ID that replies thread back to)
+        print(f"[CAMPAIGN] Row {row.id}: Sending via {row.channel} to {contact}...")
+        message_id = new_message_id() if row.channel == "email" else None
+        if message_id:
+            row.email_message_id = message_id.strip("<>")
+        deliver_message(
+            to=contact,
+            body=message,
+            channel=row.channel,
+            subject=f"Message from {campaign_name}",
+            message_id=message_id,
+        )
+        row.message_status = "sent"
+        row.claimed_at = None
+        print(f"[CAMPAIGN] Row {row.id}: Send result: sent")
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        status = record_failure(row, e)
+        row.claimed_at = None
+        db.commit()
+        if status == "retry":
+            print(f"[CAMPAIGN ERROR] Row {row.id}: {e} (attempt {row.attempt_count}, retry at {row.next_attempt_at:%H:%M:%S})")
+        else:
+            print(f"[CAMPAIGN ERROR] Row {row.id}: {e} (attempt {row.attempt_count}, failed)")
+            traceback.print_exc()
+
+    # Stop dispatching as soon as this row's draft used up the budget
+    if budget_exhausted(db, row.campaign_id):
+        _stop_for_budget(db, row.campaign_id)
+
+
+def _finish_campaign(run: CampaignRun):
+    """Called by the scheduler once the run has no queued or in-flight rows left."""
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, run.campaign_id)
+        if campaign is None:
+            return
+
+        status_counts = dict(
+            db.query(DataRow.message_status, func.count())
+            .filter(DataRow.campaign_id == run.campaign_id, DataRow.message_status.in_(("failed", "retry")))
+            .group_by(DataRow.message_status)
+        )
+
+        # A cancelled run (campaign cancelled, or paused at its budget) keeps its status;
+        # the remaining rows stay pending. So does a campaign with rows awaiting a retry:
+        # the retry sweeper queues them when they are due.
+        waiting = status_counts.get("retry", 0)
+        if not is_campaign_active(run.campaign_id):
+            _heartbeat(db, run.campaign_id, None)
+            db.commit()
+        if run.cancelled and campaign.status == CampaignStatus.RUNNING and not is_campaign_active(run.campaign_id) \
+                and not run_held_elsewhere(db, run.campaign_id):
+            # Stopped here (e.g. at its budget) and resumed by another process while draining
+            print(f"[CAMPAIGN] Campaign {run.campaign_id} was resumed while its run stopped, re-queuing")
+            queue_run(run.campaign_id)
+            return
+        if run.error is not None and campaign.status == CampaignStatus.RUNNING:
+            # Its pending rows couldn't be read: fail it, so it can be relaunched
+            campaign.transition(CampaignStatus.FAILED)
+            db.commit()
+        elif not run.cancelled and not waiting and campaign.status in (CampaignStatus.RUNNING, CampaignStatus.PAUSED):
+            campaign.transition(CampaignStatus.COMPLETED)
+            db.commit()
+        print(
+            f"[CAMPAIGN] Campaign {run.campaign_id} {campaign.status.value}. "
+            f"Processed: {run.processed}, failed: {status_counts.get('failed', 0)}, awaiting retry: {waiting}"
+        )
+    finally:
+        db.close()
+
+
+# ────────────────────── batch drafting ──────────────────────
+
+BATCH_UPDATE_CHUNK = 500
+
+_drafting: set[int] = set()  # campaigns currently in the batch drafting stage
+_drafting_lock = threading.Lock()
+
+
+def is_campaign_active(campaign_id: int) -> bool:
+    """True if the campaign has a live scheduler run or a batch drafting job in this process."""
+    with _drafting_lock:
+        if campaign_id in _drafting:
+            return True
+    return get_scheduler().get_run(campaign_id) is not None
+
+
+def _write_batch_input(db, campaign: Campaign, model_name: str, path: str) -> int:
+    """Stream undrafted pending rows into a JSONL request file. Returns the request count."""
+    rows = _pending_rows(db, campaign.id, campaign.segment, DataRow.id, DataRow.row_data).filter(
+        DataRow.outbound_message.is_(None),
+    ).order_by(DataRow.id).yield_per(1000)
+
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row_id, row_data in rows:
+            request = draft_batch_request(str(row_id), campaign.master_prompt, row_data, model_name)
+            f.write(json.dumps(request, default=str) + "\n")
+            count += 1
+    return count
+
+
+def _ingest_batch_results(db, campaign_id: int, results) -> tuple[int, int]:
+    """
+    Write batch drafts into DataRow.outbound_message in bulk and record their token usage.
+    Returns (drafted, errors).
+    """
+    stmt = (
+        update(DataRow.__table__)
+        .where(
+            DataRow.__table__.c.id == bindparam("row_id"),
+            DataRow.__table__.c.message_status == "pending",  # skip rows changed meanwhile
+        )
+        .values(outbound_message=bindparam("message"), draft_model=bindparam("model"))
+    )
+
+    def flush(chunk):
+        db.execute(stmt, chunk)
+        mark_changed(db, {campaign_id})
+        record_usage(db, [
+            {"campaign_id": campaign_id, "row_id": c["row_id"], "model": c["model"], "kind": "draft",
+             "input_tokens": c["input_tokens"], "output_tokens": c["output_tokens"]}
+            for c in chunk
+        ])
+        db.commit()
+
+    drafted = errors = 0
+    chunk = []
+    for record in results:
+        if record.get("error") or not record.get("content"):
+            errors += 1
+            continue
+        chunk.append({
+            "row_id": int(record["custom_id"]),
+            "message": record["content"],
+            "model": record.get("model"),
+            "input_tokens": record.get("input_tokens") or 0,
+            "output_tokens": record.get("output_tokens") or 0,
+        })
+        if len(chunk) >= BATCH_UPDATE_CHUNK:
+            flush(chunk)
+            drafted += len(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+        drafted += len(chunk)
+    return drafted, errors
+
+
+def _run_batch_drafting(campaign_id: int):
+    """Draft all pending rows with one batch job, then queue the send stage."""
+    settings = get_settings()
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        model_name = settings.gemini_model
+        os.makedirs(settings.batch_dir, exist_ok=True)
+        input_path = os.path.join(settings.batch_dir, f"campaign_{campaign_id}_{int(time.time())}.jsonl")
+
+        count = _write_batch_input(db, campaign, model_name, input_path)
+        print(f"[BATCH] Campaign {campaign_id}: {count} drafting requests written to {input_path}")
+
+        if count:
+            backend = get_batch_backend()
+            campaign.batch_id = backend.submit(input_path)
+            db.commit()
+            print(f"[BATCH] Campaign {campaign_id}: submitted batch {campaign.batch_id}")
+
+            while (status := backend.poll(campaign.batch_id)) == "running":
+                time.sleep(settings.batch_poll_interval)
+                db.refresh(campaign)
+                if campaign.status == CampaignStatus.CANCELLED:
+                    print(f"[BATCH] Campaign {campaign_id} cancelled while drafting")
+                    return
+
+            if status == "completed":
+                drafted, errors = _ingest_batch_results(db, campaign_id, backend.results(campaign.batch_id))
+                print(f"[BATCH] Campaign {campaign_id}: {drafted} drafts ingested, {errors} errors")
+            else:
+                # Undrafted rows are drafted interactively by the send stage
+                print(f"[BATCH] Campaign {campaign_id}: batch {campaign.batch_id} {status}")
+    except Exception as e:
+        print(f"[BATCH ERROR] Campaign {campaign_id}: {e}")
+        traceback.print_exc()
+    finally:
+        db.close()
+        with _drafting_lock:
+            _drafting.discard(campaign_id)
+
+    queue_run(campaign_id)
+
+
+# ────────────────────── launch ──────────────────────
+
+def start_campaign(campaign_id: int):
+    """
+    Start a campaign the caller has already moved to RUNNING (see launch_campaign).
+    Batch-mode campaigns draft everything first on a background thread.
+    """
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        batch_mode = campaign is not None and campaign.drafting_mode == "batch"
+    finally:
+        db.close()
+
+    if batch_mode:
+        with _drafting_lock:
+            _drafting.add(campaign_id)
+        threading.Thread(target=_run_batch_drafting, args=(campaign_id,), daemon=True).start()
+    else:
+        queue_run(campaign_id)
+
+
+def queue_run(campaign_id: int):
+    """Queue the pending rows of a campaign, and its retry rows that are due, on the fair scheduler."""
+    db = SessionLocal()
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        if not campaign:
+            print(f"[CAMPAIGN] Campaign {campaign_id} not found!")
+            return
+        if campaign.status not in (CampaignStatus.RUNNING, CampaignStatus.PAUSED):
+            print(f"[CAMPAIGN] Campaign {campaign_id} is {campaign.status.value}, not queuing")
+            return
+
+        retries = requeue_due(db, campaign_id)
+        db.commit()
+        if retries:
+            print(f"[CAMPAIGN] Campaign {campaign_id}: {retries} rows due for retry")
+
+        settings = get_settings()
+        pending = _pending_rows(db, campaign_id, campaign.segment, DataRow.id).count()
+        print(f"[CAMPAIGN] Starting campaign {campaign_id} with model: {settings.gemini_model}")
+        scope = f" in segment {campaign.segment!r}" if campaign.segment else ""
+        print(f"[CAMPAIGN] Found {pending} pending rows{scope}")
+
+        run = CampaignRun(
+            campaign_id=campaign_id,
+            tenant=campaign.user_email,
+            items=iter_pending_row_ids(campaign_id, settings.campaign_chunk_size, campaign.segment),
+            # Prompt and model are captured at launch so a running campaign stays consistent
+            process=partial(
+                _process_row,
+                campaign_id=campaign_id,
+                master_prompt=campaign.master_prompt,
+                campaign_name=campaign.name,
+                model_name=settings.gemini_model,
+            ),
+            on_finish=_finish_campaign,
+            weight=campaign.weight or 1.0,
+            send_rate=campaign.send_rate or settings.campaign_send_rate,
+            max_concurrency=campaign.max_concurrency,
+            poll_status=partial(_poll_run_status, campaign_id),
+        )
+        _heartbeat(db, campaign_id, datetime.now(timezone.utc))
+        db.commit()
+        # Paused between launch and now (e.g. paused right after launching)
+        if campaign.status == CampaignStatus.PAUSED:
+            run.pause()
+        get_scheduler().submit(run)
+    finally:
+        db.close()
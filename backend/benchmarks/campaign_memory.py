@@ -0,0 +1,134 @@
+"""
+Memory benchmark for campaign row iteration.
+
+Seeds a throwaway SQLite database with N pending rows, then walks them the way a
+campaign worker does (keyset-chunked id stream + one short session per row) and
+reports peak RSS growth over the pre-iteration baseline. Each size runs in a fresh
+process so peaks don't carry over. `--strategy all` loads every row up front
+(the old behaviour) for comparison.
+
+    cd backend
+    python -m benchmarks.campaign_memory --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SEED_CHUNK = 10_000
+
+
+def _rss_kb() -> int:
+    """Current resident set size in KiB."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _seed(rows: int):
+    from sqlalchemy import insert
+    from app.database import SessionLocal, create_tables
+    from app.models import Campaign, CampaignStatus, DataRow
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        campaign = Campaign(user_email="bench@example.com", name="bench", master_prompt="Say hi to {name}",
+                            status=CampaignStatus.RUNNING)
+        db.add(campaign)
+        db.commit()
+        for start in range(0, rows, SEED_CHUNK):
+            db.execute(insert(DataRow), [
+                {
+                    "campaign_id": campaign.id,
+                    "row_index": i,
+                    "row_data": {"name": f"Contact {i}", "email": f"c{i}@example.com", "notes": "x" * 200},
+                    "contact_email": f"c{i}@example.com",
+                    "channel": "email",
+                    "message_status": "pending",
+                }
+                for i in range(start, min(start + SEED_CHUNK, rows))
+            ])
+            db.commit()
+        return campaign.id
+    finally:
+        db.close()
+
+
+def _iterate(campaign_id: int, strategy: str) -> dict:
+    from app.config import get_settings
+    from app.database import SessionLocal
+    from app.models import DataRow
+    from app.worker import iter_pending_row_ids
+
+    baseline = _rss_kb()
+    start = time.perf_counter()
+    seen = 0
+    if strategy == "all":
+        db = SessionLocal()
+        rows = db.query(DataRow).filter(DataRow.campaign_id == campaign_id,
+                                        DataRow.message_status == "pending").all()
+        for row in rows:
+            seen += len(row.row_data)
+        db.close()
+    else:
+        for row_id in iter_pending_row_ids(campaign_id, get_settings().campaign_chunk_size):
+            db = SessionLocal()
+            try:
+                seen += len(db.get(DataRow, row_id).row_data)
+            finally:
+                db.close()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    return {
+        "baseline_mb": round(baseline / 1024, 1),
+        "peak_mb": round(peak / 1024, 1),
+        "growth_mb": round((peak - baseline) / 1024, 1),
+        "seconds": round(time.perf_counter() - start, 1),
+        "fields": seen,
+    }
+
+
+def _child(args):
+    if args.seed:
+        print(json.dumps({"campaign_id": _seed(args.rows)}))
+    else:
+        print(json.dumps(_iterate(args.campaign_id, args.strategy)))
+
+
+def _run_child(db_url: str, *extra) -> dict:
+    env = {**os.environ, "DATABASE_URL": db_url}
+    out = subprocess.run([sys.executable, "-m", "benchmarks.campaign_memory", "--child", *extra],
+                         env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--strategy", choices=["stream", "all"], default="stream")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--seed", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--campaign-id", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    print(f"{'rows':>10}  {'baseline MB':>11}  {'peak MB':>8}  {'growth MB':>9}  {'seconds':>8}")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            campaign_id = _run_child(db_url, "--seed", "--rows", str(rows))["campaign_id"]
+            result = _run_child(db_url, "--campaign-id", str(campaign_id), "--strategy", args.strategy)
+        print(f"{rows:>10}  {result['baseline_mb']:>11}  {result['peak_mb']:>8}  "
+              f"{result['growth_mb']:>9}  {result['seconds']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Webhook latency under mixed dashboard + webhook load.
+
+Seeds a throwaway SQLite database with one campaign of N sent rows, then drives the
+app in-process (httpx ASGI transport, one event loop) with concurrent dashboard
+clients polling GET /campaigns and GET /campaigns/{id} while webhook clients post
+WhatsApp replies. Anything that blocks the event loop shows up directly in the
+webhook percentiles. Reply extraction is replaced by a fixed delay (`--llm-ms`)
+so no API key is needed.
+
+    cd backend
+    python -m benchmarks.webhook_latency --rows 5000 --webhooks 500
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def _percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "no samples"
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+    return (f"n={len(ordered)}  p50={pick(50):.1f}ms  p95={pick(95):.1f}ms  "
+            f"p99={pick(99):.1f}ms  max={ordered[-1]:.1f}ms  mean={statistics.mean(ordered):.1f}ms")
+
+
+def _seed(rows: int) -> int:
+    from sqlalchemy import insert
+    from app.database import SessionLocal, create_tables
+    from app.models import Campaign, CampaignStatus, DataRow
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        campaign = Campaign(user_email="bench@example.com", name="bench", master_prompt="hi",
+                            status=CampaignStatus.COMPLETED)
+        db.add(campaign)
+        db.commit()
+        db.execute(insert(DataRow), [
+            {
+                "campaign_id": campaign.id,
+                "row_index": i,
+                "row_data": {"name": f"Contact {i}", "phone": f"+91{9000000000 + i}"},
+                "contact_phone": f"+91{9000000000 + i}",
+                "channel": "whatsapp",
+                "outbound_message": f"Hi Contact {i}, can you confirm your details?",
+                "message_status": "sent",
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+        return campaign.id
+    finally:
+        db.close()
+
+
+async def _run(args, campaign_id: int):
+    import httpx
+    import app.routers.webhooks as webhooks
+    from app.main import app
+
+    def fake_process_reply(**_kwargs):
+        time.sleep(args.llm_ms / 1000)
+        return {"intent": "confirm", "confidence": 0.95, "updates": {}}
+
+    webhooks.process_reply = fake_process_reply
+
+    webhook_ms: list[float] = []
+    dashboard_ms: list[float] = []
+    next_row = iter(range(args.webhooks))
+    stop = asyncio.Event()
+
+    async def webhook_client(client):
+        for i in next_row:
+            body = {"event": "message", "payload": {"body": "yes that's right", "from": f"91{9000000000 + i}@c.us"}}
+            start = time.perf_counter()
+            resp = await client.post("/webhooks/whatsapp", json=body)
+            webhook_ms.append((time.perf_counter() - start) * 1000)
+            resp.raise_for_status()
+
+    async def dashboard_client(client):
+        while not stop.is_set():
+            for path in ("/campaigns", f"/campaigns/{campaign_id}"):
+                start = time.perf_counter()
+                resp = await client.get(path)
+                dashboard_ms.append((time.perf_counter() - start) * 1000)
+                resp.raise_for_status()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        dashboards = [asyncio.create_task(dashboard_client(client)) for _ in range(args.dashboard_clients)]
+        await asyncio.gather(*(webhook_client(client) for _ in range(args.webhook_clients)))
+        stop.set()
+        await asyncio.gather(*dashboards)
+        elapsed = time.perf_counter() - started
+
+    print(f"rows={args.rows}  dashboard_clients={args.dashboard_clients}  "
+          f"webhook_clients={args.webhook_clients}  elapsed={elapsed:.1f}s")
+    print(f"webhook    {_percentiles(webhook_ms)}")
+    print(f"dashboard  {_percentiles(dashboard_ms)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=5000, help="rows in the dashboard campaign")
+    parser.add_argument("--webhooks", type=int, default=500, help="total webhook deliveries")
+    parser.add_argument("--webhook-clients", type=int, default=8)
+    parser.add_argument("--dashboard-clients", type=int, default=2)
+    parser.add_argument("--llm-ms", type=float, default=50, help="simulated reply extraction latency")
+    args = parser.parse_args()
+    args.webhooks = min(args.webhooks, args.rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Must be set before app modules create their engines
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # Measure the per-message processing path, not the debounce buffer
+        os.environ.setdefault("REPLY_DEBOUNCE_SECONDS", "0")
+        campaign_id = _seed(args.rows)
+        asyncio.run(_run(args, campaign_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Test setup: a throwaway SQLite database (or the PostgreSQL database in TEST_POSTGRES_URL,
+which the tests wipe) and in-process coordination. Set before `app` is imported, since the
+engines are created at import time.
+"""
+
+import os
+import tempfile
+import time
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="sentinalgrid-tests-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_POSTGRES_URL") or f"sqlite:///{_tmp}/test.db"
+os.environ["COORDINATION_URL"] = "memory://"
+os.environ["REPLY_DEBOUNCE_SECONDS"] = "0"
+os.environ["ROW_COMPACTION_INTERVAL"] = "3600"  # tests compact (or disable compaction) explicitly
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.database import Base, engine
+    from app.main import app
+    from app.search import drop_fts
+
+    with engine.begin() as conn:
+        drop_fts(conn)
+    Base.metadata.drop_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+
+
+def wait_for(predicate, timeout: float = 15.0, interval: float = 0.05):
+    """Poll until `predicate()` is truthy; returns its last value."""
+    deadline = time.monotonic() + timeout
+    while not (value := predicate()) and time.monotonic() < deadline:
+        time.sleep(interval)
+    return value
@@ -0,0 +1,37 @@
+import time
+
+import app.worker as worker
+from app.agent import Draft
+
+from conftest import wait_for
+
+
+def _csv(rows: int) -> bytes:
+    return ("Name,Email\n" + "".join(f"n{i},u{i}@example.com\n" for i in range(rows))).encode()
+
+
+def test_budget_stop_raise_and_resume_finishes_campaign(client, monkeypatch):
+    # 1000 input + 200 output tokens on gemini-2.5-flash: $0.0008 per draft
+    monkeypatch.setattr(
+        worker, "draft_message",
+        lambda prompt, data, model_name=None: (time.sleep(0.3), Draft("hi", "gemini-2.5-flash", 1000, 200))[1],
+    )
+    monkeypatch.setattr(worker, "deliver_message", lambda **kwargs: None)
+
+    campaign_id = client.post(
+        "/campaigns", data={"name": "budget", "master_prompt": "p"}, files={"file": ("a.csv", _csv(10))},
+    ).json()["id"]
+    client.patch(f"/campaigns/{campaign_id}/throttle", json={"send_rate": 100, "max_concurrency": 3})
+    assert client.post(f"/campaigns/{campaign_id}/launch?budget_usd=0.0025").status_code == 200
+
+    status = lambda: client.get(f"/campaigns/{campaign_id}").json()["campaign"]["status"]
+    assert wait_for(lambda: status() == "paused")
+
+    # Resume while the stopped run may still be draining its in-flight rows
+    assert client.patch(f"/campaigns/{campaign_id}/budget", json={"budget_usd": None}).status_code == 200
+    assert client.post(f"/campaigns/{campaign_id}/resume").json()["status"] == "running"
+
+    assert wait_for(lambda: status() == "completed")
+    stats = client.get(f"/campaigns/{campaign_id}").json()["stats"]
+    assert stats.get("sent") == 10 and not stats.get("pending")
+    assert not worker.is_campaign_active(campaign_id)
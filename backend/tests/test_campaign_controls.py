@@ -0,0 +1,54 @@
+import time
+
+import app.worker as worker
+from app.agent import Draft
+from app.database import SessionLocal
+from app.models import Campaign, CampaignStatus
+from app.scheduler import get_scheduler
+
+from conftest import wait_for
+
+
+def _csv(rows: int) -> bytes:
+    return ("Name,Email\n" + "".join(f"n{i},ctl{i}@example.com\n" for i in range(rows))).encode()
+
+
+def _set_status(campaign_id: int, status: CampaignStatus):
+    """Change the status the way a control handled by another worker process does: in the DB only."""
+    with SessionLocal() as db:
+        db.get(Campaign, campaign_id).transition(status)
+        db.commit()
+
+
+def test_pause_and_resume_from_another_process(client, monkeypatch):
+    monkeypatch.setattr(
+        worker, "draft_message",
+        lambda prompt, data, model_name=None: (time.sleep(0.1), Draft("hi", "gemini-2.5-flash", 10, 5))[1],
+    )
+    sent = []
+    monkeypatch.setattr(worker, "deliver_message", lambda **kwargs: sent.append(kwargs["to"]))
+
+    campaign_id = client.post(
+        "/campaigns", data={"name": "controls", "master_prompt": "p"}, files={"file": ("a.csv", _csv(30))},
+    ).json()["id"]
+    client.patch(f"/campaigns/{campaign_id}/throttle", json={"send_rate": 20, "max_concurrency": 2})
+    assert client.post(f"/campaigns/{campaign_id}/launch").status_code == 200
+    assert wait_for(lambda: len(sent) >= 3)
+
+    _set_status(campaign_id, CampaignStatus.PAUSED)
+    run = get_scheduler().get_run(campaign_id)
+    assert wait_for(lambda: run.paused and run.in_flight == 0)
+    paused_at = len(sent)
+    time.sleep(0.5)
+    assert len(sent) == paused_at < 30
+
+    # The run is held here: a resume handled by another process must not start a second one
+    with SessionLocal() as db, monkeypatch.context() as other_process:
+        other_process.setattr(worker, "PROCESS_ID", "other-host:1")
+        assert worker.run_held_elsewhere(db, campaign_id)
+    _set_status(campaign_id, CampaignStatus.RUNNING)
+
+    status = lambda: client.get(f"/campaigns/{campaign_id}").json()["campaign"]["status"]
+    assert wait_for(lambda: status() == "completed")
+    assert sorted(sent) == sorted(f"ctl{i}@example.com" for i in range(30))
+    assert get_scheduler().get_run(campaign_id) is None
@@ -0,0 +1,40 @@
+import time
+
+from app import coordination
+from app.config import get_settings
+from app.coordination import MemoryStore
+
+
+class DownStore(MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.down = True
+        self.reads = 0
+
+    def settings_version(self):
+        self.reads += 1
+        if self.down:
+            raise ConnectionError("store down")
+        return super().settings_version()
+
+
+def test_requests_survive_a_store_outage(client, monkeypatch):
+    store = DownStore()
+    monkeypatch.setattr(coordination, "_store", store)
+    monkeypatch.setattr(coordination, "STORE_RETRY", 0.3)
+    monkeypatch.setattr(coordination, "_checked_at", 0.0)
+    monkeypatch.setattr(coordination, "_retry_at", 0.0)
+    monkeypatch.setattr(get_settings(), "settings_refresh_interval", 0.0)
+    model = get_settings().gemini_model
+
+    for _ in range(5):
+        assert client.get("/health").status_code == 200
+    assert store.reads == 1  # backed off instead of retrying on every request
+    assert get_settings().gemini_model == model
+
+    store.down = False
+    store.save_settings({"gemini_model": "gemini-2.5-pro"})
+    time.sleep(0.35)
+    monkeypatch.setattr(get_settings(), "gemini_model", model)  # restored after the test
+    assert client.get("/health").status_code == 200
+    assert get_settings().gemini_model == "gemini-2.5-pro"
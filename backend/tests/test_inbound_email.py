@@ -0,0 +1,100 @@
+import json
+
+from sqlalchemy import select, update
+
+import app.routers.webhooks as webhooks
+from app.database import SessionLocal
+from app.inbound_email import parse_mime, parse_provider_payload
+from app.models import DataRow
+
+
+def _mime(body: str, **headers: str) -> bytes:
+    lines = [f"{name.replace('_', '-')}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines + ["Content-Type: text/plain; charset=utf-8", "", body])).encode()
+
+
+def test_thread_ids_put_in_reply_to_before_references_newest_first():
+    inbound = parse_mime(_mime(
+        "Yes, still in Pune.\n\nOn Mon, 3 Mar 2025, Team <team@example.com> wrote:\n> Are you still in Pune?\n",
+        From="Asha <Asha@Example.com>", Subject="Re: hello", Message_ID="<reply-1@mail.example>",
+        In_Reply_To="<sent-2@us>", References="<sent-1@us> <sent-2@us>",
+    ))
+    assert inbound.message_id == "reply-1@mail.example"
+    assert inbound.thread_ids == ["sent-2@us", "sent-1@us"]
+    assert inbound.sender == "asha@example.com"
+    assert inbound.text == "Yes, still in Pune."
+
+
+def test_provider_payloads_carry_thread_headers():
+    postmark = parse_provider_payload({
+        "FromFull": {"Email": "ravi@example.com"}, "From": "", "Subject": "Re: hi",
+        "StrippedTextReply": "Moved to Goa",
+        "Headers": [{"Name": "Message-ID", "Value": "<pm-1@mail>"}, {"Name": "In-Reply-To", "Value": "sent-9@us"}],
+    })
+    assert (postmark.message_id, postmark.thread_ids, postmark.text) == ("pm-1@mail", ["sent-9@us"], "Moved to Goa")
+
+    mailgun = parse_provider_payload({
+        "sender": "meera@example.com", "stripped-text": "ok",
+        "message-headers": json.dumps([["Message-Id", "<mg-1@mail>"], ["References", "<a@us> <b@us>"]]),
+    })
+    assert (mailgun.sender, mailgun.message_id, mailgun.thread_ids) == ("meera@example.com", "mg-1@mail", ["b@us", "a@us"])
+
+
+def _sent_campaign(client, monkeypatch, name: str) -> list[int]:
+    """Rows <name>-a@ / <name>-b@example.com, emailed as <name>-a@us / <name>-b@us; replies aren't extracted."""
+    monkeypatch.setattr(webhooks, "process_reply", lambda **kwargs: {
+        "intent": "confirmed", "updates": {}, "confidence": 0.9,
+        "model": "gemini-2.5-flash", "usage": {"input_tokens": 1, "output_tokens": 1},
+    })
+    campaign_id = client.post(
+        "/campaigns", data={"name": name, "master_prompt": "p"},
+        files={"file": ("a.csv", f"Name,Email\na,{name}-a@example.com\nb,{name}-b@example.com\n".encode())},
+    ).json()["id"]
+    with SessionLocal() as db:
+        row_ids = db.scalars(select(DataRow.id).where(DataRow.campaign_id == campaign_id).order_by(DataRow.id)).all()
+        for row_id, message_id in zip(row_ids, (f"{name}-a@us", f"{name}-b@us")):
+            db.execute(update(DataRow).where(DataRow.id == row_id).values(
+                outbound_message="hi", message_status="sent", email_message_id=message_id,
+            ))
+        db.commit()
+    return row_ids
+
+
+def _post(client, raw: bytes) -> dict:
+    return client.post("/webhooks/email", content=raw, headers={"Content-Type": "message/rfc822"}).json()
+
+
+def test_replies_are_matched_by_thread_before_sender(client, monkeypatch):
+    row_a, row_b = _sent_campaign(client, monkeypatch, "thread")
+
+    # No thread headers at all: falls back to the sender's latest sent row
+    bare = _mime("Yes", From="thread-a@example.com", Message_ID="<in-1@mail>")
+    result = _post(client, bare)
+    assert (result["status"], result["row_id"], result["matched_by"]) == ("processed", row_a, "sender")
+
+    # Forwarded from another address, answering row b's email: the thread decides
+    forwarded = _mime("Yes", From="assistant@example.com", Message_ID="<in-2@mail>", References="<thread-b@us>")
+    result = _post(client, forwarded)
+    assert (result["row_id"], result["matched_by"]) == (row_b, "thread")
+
+    # In-Reply-To names an unknown id; References still leads to row a, though it has replied already
+    reply = _mime("Sure", From="thread-b@example.com", Message_ID="<in-3@mail>",
+                  In_Reply_To="<elsewhere@mail>", References="<thread-a@us> <elsewhere@mail>")
+    result = _post(client, reply)
+    assert (result["row_id"], result["matched_by"]) == (row_a, "thread")
+
+
+def test_redelivered_reply_is_processed_once(client, monkeypatch):
+    row_a, _ = _sent_campaign(client, monkeypatch, "redeliver")
+    reply = _mime("Yes", From="redeliver-a@example.com", Message_ID="<redelivered@mail>", In_Reply_To="<redeliver-a@us>")
+
+    assert _post(client, reply)["status"] == "processed"
+    assert _post(client, reply) == {"status": "duplicate", "row_id": row_a}
+    with SessionLocal() as db:
+        assert db.get(DataRow, row_a).reply_message_id == "redelivered@mail"
+
+
+def test_unknown_thread_and_sender_is_not_matched(client, monkeypatch):
+    _sent_campaign(client, monkeypatch, "stranger")
+    stranger = _mime("Hello?", From="stranger@example.com", Message_ID="<in-4@mail>", In_Reply_To="<nobody@us>")
+    assert _post(client, stranger)["status"] == "no_match"
@@ -0,0 +1,69 @@
+from sqlalchemy import select, update
+
+from app.database import SessionLocal
+from app.models import DataRow
+
+
+def _csv(*rows: str) -> bytes:
+    return ("Id,Name,Email,City\n" + "".join(f"{r}\n" for r in rows)).encode()
+
+
+def _rows(campaign_id: int) -> dict[int, DataRow]:
+    with SessionLocal() as db:
+        rows = db.scalars(select(DataRow).where(DataRow.campaign_id == campaign_id)).all()
+        return {row.row_data["Id"]: row for row in rows}
+
+
+def _create(client, name: str, *rows: str) -> int:
+    return client.post(
+        "/campaigns", data={"name": name, "master_prompt": "p", "key_column": "Id"},
+        files={"file": ("a.csv", _csv(*rows))},
+    ).json()["id"]
+
+
+def _sync(client, campaign_id: int, *rows: str) -> dict:
+    response = client.post(f"/campaigns/{campaign_id}/rows", files={"file": ("a.csv", _csv(*rows))})
+    assert response.status_code == 200, response.text
+    return response.json()["sync"]
+
+
+def test_changed_row_loses_its_send_and_reply_state(client):
+    campaign_id = _create(client, "merge-reset", "1,Asha,asha@merge.example,Pune", "2,Ravi,ravi@merge.example,Pune")
+    with SessionLocal() as db:
+        db.execute(
+            update(DataRow).where(DataRow.campaign_id == campaign_id).values(
+                message_status="replied", outbound_message="hi",
+                reply_text="I moved", confidence=0.4, reply_message_id="r@mail",
+                needs_review=True, suggested_update={"City": "Goa"},
+            )
+        )
+        db.execute(update(DataRow).where(DataRow.id == _rows(campaign_id)[1].id).values(
+            email_message_id="merge-reset-1@mail",
+        ))
+        db.commit()
+
+    counts = _sync(client, campaign_id, "1,Asha,asha@merge.example,Goa", "2,Ravi,ravi@merge.example,Pune")
+    assert (counts["updated"], counts["unchanged"]) == (1, 1)
+
+    rows = _rows(campaign_id)
+    changed, kept = rows[1], rows[2]
+    assert changed.row_data["City"] == "Goa" and changed.message_status == "pending"
+    assert (changed.outbound_message, changed.email_message_id, changed.reply_text) == (None, None, None)
+    assert (changed.confidence, changed.reply_message_id) == (None, None)
+    assert (changed.needs_review, changed.suggested_update) == (False, None)
+    assert (kept.message_status, kept.reply_text, kept.needs_review) == ("replied", "I moved", True)
+
+
+def test_changed_row_taking_another_rows_recipient_is_a_duplicate(client):
+    campaign_id = _create(client, "merge-dup", "1,Asha,asha@dup.example,Pune", "2,Ravi,ravi@dup.example,Pune")
+
+    # Row 2 is missing from the upload but still holds ravi@; row 1 now points at it
+    counts = _sync(client, campaign_id, "1,Asha,ravi@dup.example,Pune")
+    assert (counts["updated"], counts["duplicate"], counts["missing"]) == (1, 1, 1)
+    rows = _rows(campaign_id)
+    assert (rows[1].message_status, rows[2].message_status) == ("duplicate", "pending")
+
+    # Once row 2 is in the upload with its own recipient, row 1 may be pending again
+    counts = _sync(client, campaign_id, "1,Asha,asha@dup.example,Pune", "2,Ravi,ravi@dup.example,Pune")
+    assert (counts["updated"], counts["unchanged"], counts["pending"]) == (1, 1, 1)
+    assert _rows(campaign_id)[1].message_status == "pending"
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.agent as agent
+import app.llm_router as llm_router
+from app.config import get_settings
+from app.llm_router import LLMRouter
+from app.ratelimit import INTERACTIVE
+
+
+class FakeLLM:
+    """Answers with its model name after `delay` seconds, or raises `error`."""
+
+    def __init__(self, model: str, delay: float = 0.0, error: Exception | None = None):
+        self.model, self.delay, self.error = model, delay, error
+        self.calls = self.cancelled = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=self.model, usage_metadata={"input_tokens": 3, "output_tokens": 2})
+
+
+class FakeLimiter:
+    """Admits calls at once, or holds the first `held` of them for `hold` seconds (queued for a slot)."""
+
+    def __init__(self, held: int = 0, hold: float = 0.0):
+        self.held, self.hold = held, hold
+        self.lanes: list[str] = []
+
+    async def acquire(self, lane: str) -> float:
+        self.lanes.append(lane)
+        if len(self.lanes) <= self.held:
+            await asyncio.sleep(self.hold)
+        return 0.0
+
+    def release(self, lane: str):
+        pass
+
+
+@pytest.fixture
+def llms(monkeypatch):
+    """model -> FakeLLM; fast by default. Hedges after 0.1s (no latency samples yet)."""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "available_models", ["gemini-2.5-pro", "gemini-2.5-flash", "gemini-2.0-flash"])
+    monkeypatch.setattr(settings, "llm_hedging_enabled", True)
+    monkeypatch.setattr(settings, "llm_hedge_default_delay", 0.1)
+    monkeypatch.setattr(settings, "llm_hedge_min_delay", 0.05)
+    models = {m: FakeLLM(m) for m in settings.available_models}
+    monkeypatch.setattr(agent, "_get_llm", lambda model: models[model])
+    monkeypatch.setattr(llm_router, "get_llm_limiter", lambda: FakeLimiter())
+    return models
+
+
+def _route(router: LLMRouter, model: str):
+    return asyncio.run(router.ainvoke([], model=model, lane=INTERACTIVE))
+
+
+def test_fast_primary_is_not_hedged(llms):
+    router = LLMRouter()
+    response = _route(router, "gemini-2.5-pro")
+    assert (response.model, response.hedged, response.input_tokens, response.output_tokens) == (
+        "gemini-2.5-pro", False, 3, 2,
+    )
+    assert [m.calls for m in llms.values()] == [1, 0, 0]
+
+
+def test_slow_primary_is_hedged_on_the_fastest_other_model(llms):
+    router = LLMRouter()
+    for _ in range(llm_router.MIN_SAMPLES):  # 2.0-flash has the lower p50, so it is tried first
+        router.tracker.record("gemini-2.5-flash", 1.0)
+        router.tracker.record("gemini-2.0-flash", 0.2)
+    llms["gemini-2.5-pro"].delay = 1.0
+
+    response = _route(router, "gemini-2.5-pro")
+    assert (response.model, response.hedged) == ("gemini-2.0-flash", True)
+    assert llms["gemini-2.5-pro"].cancelled == 1  # the loser is cancelled
+    assert llms["gemini-2.5-flash"].calls == 0
+    stats = router.tracker.stats()["gemini-2.0-flash"]
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_primary_answering_first_wins_over_its_hedge(llms):
+    router = LLMRouter()
+    llms["gemini-2.5-pro"].delay = 0.2
+    llms["gemini-2.5-flash"].delay = 1.0
+
+    response = _route(router, "gemini-2.5-pro")
+    assert (response.model, response.hedged) == ("gemini-2.5-pro", True)
+    assert llms["gemini-2.5-flash"].cancelled == 1
+    assert router.tracker.stats()["gemini-2.5-pro"]["hedge_wins"] == 0
+
+
+def test_time_queued_in_the_limiter_does_not_trigger_a_hedge(llms, monkeypatch):
+    limiter = FakeLimiter(held=1, hold=0.3)  # 3x the hedge delay
+    monkeypatch.setattr(llm_router, "get_llm_limiter", lambda: limiter)
+    router = LLMRouter()
+
+    response = _route(router, "gemini-2.5-pro")
+    assert (response.model, response.hedged) == ("gemini-2.5-pro", False)
+    assert limiter.lanes == [INTERACTIVE]
+
+
+def test_errors_fail_over_to_the_next_model(llms):
+    router = LLMRouter()
+    llms["gemini-2.5-pro"].error = RuntimeError("quota")
+
+    response = _route(router, "gemini-2.5-pro")
+    assert response.model in ("gemini-2.5-flash", "gemini-2.0-flash")
+    assert response.hedged is False
+    assert router.tracker.stats()["gemini-2.5-pro"]["errors"] == 1
+
+
+def test_all_models_failing_raises_the_last_error(llms):
+    router = LLMRouter()
+    for model in llms.values():
+        model.error = RuntimeError(f"{model.model} down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        _route(router, "gemini-2.5-pro")
+    assert [m.calls for m in llms.values()] == [1, 1, 1]
@@ -0,0 +1,36 @@
+import time
+
+from app import coordination, ratelimit
+from app.coordination import MemoryStore
+from app.ratelimit import SharedTokenBucket
+
+
+class FlakyStore(MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.calls = 0
+
+    def take(self, bucket, rate, capacity, tokens=1.0):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("store down")
+        return super().take(bucket, rate, capacity, tokens)
+
+
+def test_shared_bucket_returns_to_the_store_after_an_outage(monkeypatch):
+    store = FlakyStore()
+    monkeypatch.setattr(coordination, "_store", store)
+    monkeypatch.setattr(ratelimit, "STORE_RETRY", 0.2)
+    bucket = SharedTokenBucket("test-flaky", rate=100, capacity=100)
+
+    store.down = True
+    assert bucket.try_acquire()  # limited by the local bucket
+    assert bucket.try_acquire()
+    assert store.calls == 1  # no store call per acquire while backing off
+
+    store.down = False
+    time.sleep(0.25)
+    assert bucket.try_acquire()
+    assert store.calls == 2
+    assert store.buckets()["test-flaky"]["tokens"] == 99
@@ -0,0 +1,70 @@
+import asyncio
+
+from sqlalchemy import delete
+
+from app.coalesce import ReplyCoalescer
+from app.config import get_settings
+from app.database import AsyncSessionLocal, async_engine
+from app.models import ReplyFragment
+
+
+def _recorder():
+    flushed = []
+
+    async def flush(row_id: int, text: str, fragment_ids: list[int]):
+        flushed.append((row_id, text))
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(ReplyFragment).where(ReplyFragment.id.in_(fragment_ids)))
+            await db.commit()
+
+    return flushed, flush
+
+
+def _windows(monkeypatch, seconds: float = 0.3, max_seconds: float = 5.0):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "reply_debounce_seconds", seconds)
+    monkeypatch.setattr(settings, "reply_debounce_max_seconds", max_seconds)
+
+
+def test_burst_split_across_processes_is_flushed_once(client, monkeypatch):
+    _windows(monkeypatch)
+    flushed, flush = _recorder()
+
+    async def scenario():
+        a, b = ReplyCoalescer(flush), ReplyCoalescer(flush)  # two worker processes
+        await a.add(9001, "yes")
+        await asyncio.sleep(0.2)
+        await b.add(9001, "I'll come")
+        await asyncio.sleep(0.2)
+        await a.add(9001, "but 10 mins late")
+        await asyncio.sleep(1.0)
+        await a.drain()
+        await b.drain()
+        await async_engine.dispose()
+
+    asyncio.run(scenario())
+    assert flushed == [(9001, "yes\nI'll come\nbut 10 mins late")]
+
+
+def test_buffered_fragments_survive_a_restart(client, monkeypatch):
+    _windows(monkeypatch)
+    flushed, flush = _recorder()
+
+    async def before_restart():
+        old = ReplyCoalescer(flush)
+        await old.add(9002, "maybe")
+        await old.add(9002, "let me check")
+        await old.drain()  # shut down inside the window
+        await async_engine.dispose()
+
+    async def after_restart():
+        new = ReplyCoalescer(flush)
+        new.start()
+        await asyncio.sleep(1.0)
+        await new.drain()
+        await async_engine.dispose()
+
+    asyncio.run(before_restart())
+    assert flushed == []
+    asyncio.run(after_restart())
+    assert flushed == [(9002, "maybe\nlet me check")]
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from sqlalchemy import select, update
+
+import app.agent as agent
+from app.database import SessionLocal
+from app.models import DataRow
+from app.ratelimit import BULK, INTERACTIVE
+
+from conftest import wait_for
+
+
+class RecordingRouter:
+    def __init__(self):
+        self.lanes = []
+
+    def invoke(self, messages, model_name=None, lane=None):
+        self.lanes.append(lane)
+        return SimpleNamespace(
+            content='{"intent": "confirmed", "updates": {}, "confidence": 0.9}',
+            model="gemini-2.5-flash", input_tokens=10, output_tokens=5,
+        )
+
+
+def test_imported_replies_use_the_bulk_lane(client, monkeypatch):
+    router = RecordingRouter()
+    monkeypatch.setattr(agent, "get_llm_router", lambda: router)
+
+    campaign_id = client.post(
+        "/campaigns", data={"name": "lanes", "master_prompt": "p"},
+        files={"file": ("a.csv", b"Name,Email\na,a@example.com\nb,b@example.com\n")},
+    ).json()["id"]
+    with SessionLocal() as db:
+        db.execute(update(DataRow).where(DataRow.campaign_id == campaign_id).values(outbound_message="hi"))
+        db.commit()
+        row_ids = db.scalars(select(DataRow.id).where(DataRow.campaign_id == campaign_id).order_by(DataRow.id)).all()
+
+    csv = "data_row_id,reply_text\n" + "".join(f"{row_id},yes\n" for row_id in row_ids)
+    job_id = client.post("/webhooks/bulk-reply", files={"file": ("r.csv", csv.encode())}).json()["id"]
+    assert wait_for(lambda: client.get(f"/webhooks/bulk-reply/{job_id}").json()["status"] == "completed")
+    assert router.lanes == [BULK, BULK]
+
+    assert client.post("/webhooks/manual-reply", json={"data_row_id": row_ids[0], "reply_text": "yes"}).status_code == 200
+    assert router.lanes[-1] == INTERACTIVE
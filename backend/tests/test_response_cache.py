@@ -0,0 +1,33 @@
+from app import coordination
+from app.cache import LIST_SCOPE, ResponseCache
+from app.coordination import SqliteStore
+
+
+def test_write_in_another_process_invalidates_cached_response(tmp_path, monkeypatch):
+    path = str(tmp_path / "coordination.db")
+    key = ("campaign", 1, "")
+    here, there = ResponseCache(), ResponseCache()
+
+    monkeypatch.setattr(coordination, "_store", SqliteStore(path))
+    etag = here.etag(key, 1)
+    here.put(key, etag, b'{"id": 1}')
+    assert here.get(key, here.etag(key, 1)) == b'{"id": 1}'
+
+    monkeypatch.setattr(coordination, "_store", SqliteStore(path))  # another worker's connection
+    there.bump({2}, campaign_level=False)
+    assert here.etag(key, 1) == etag  # other campaigns don't invalidate this one
+    there.bump({1}, campaign_level=True)
+
+    monkeypatch.setattr(coordination, "_store", SqliteStore(path))
+    assert here.etag(key, 1) != etag
+    assert here.get(key, here.etag(key, 1)) is None
+    assert here.etag(("campaigns",), LIST_SCOPE).endswith('-1"')
+
+
+def test_unreachable_store_serves_uncached(monkeypatch):
+    class Down(coordination.MemoryStore):
+        def read_counters(self, names):
+            raise ConnectionError("store down")
+
+    monkeypatch.setattr(coordination, "_store", Down())
+    assert ResponseCache().etag(("campaigns",), LIST_SCOPE) is None
@@ -0,0 +1,112 @@
+import pytest
+from sqlalchemy import select
+
+import app.retry as retry
+import app.worker as worker
+from app.agent import Draft
+from app.config import get_settings
+from app.database import SessionLocal
+from app.messaging import SendError
+from app.models import DataRow
+from app.scheduler import get_scheduler
+
+from conftest import wait_for
+
+
+class ResourceExhausted(Exception):  # named like google-api-core's 429
+    pass
+
+
+class QuotaError(ResourceExhausted):
+    pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("exc, transient", [
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (QuotaError("quota"), True),  # matched through its base class
+    (HTTPError(503), True),
+    (HTTPError(429), True),
+    (HTTPError(400), False),
+    (SendError("mailbox busy", transient=True), True),
+    (SendError("no such user", transient=False), False),
+    (ValueError("bad template"), False),
+])
+def test_failures_are_classified(exc, transient):
+    assert retry.is_transient(exc) is transient
+
+
+def test_backoff_doubles_with_jitter_up_to_the_cap(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "retry_base_delay", 10.0)
+    monkeypatch.setattr(settings, "retry_max_delay", 60.0)
+    for attempt, delay in [(1, 10.0), (2, 20.0), (3, 40.0), (4, 60.0), (9, 60.0)]:
+        samples = [retry.backoff(attempt) for _ in range(50)]
+        assert all(delay / 2 <= s <= delay for s in samples)
+        assert len(set(samples)) > 1
+
+
+def test_transient_failures_retry_until_the_last_attempt(monkeypatch):
+    monkeypatch.setattr(get_settings(), "retry_max_attempts", 3)
+    row = DataRow(attempt_count=0)
+
+    assert retry.record_failure(row, TimeoutError("slow")) == "retry"
+    assert row.next_attempt_at is not None and row.last_error == "TimeoutError: slow"
+    assert retry.record_failure(row, TimeoutError("slow")) == "retry"
+    assert retry.record_failure(row, TimeoutError("slow")) == "failed"
+    assert (row.attempt_count, row.next_attempt_at) == (3, None)
+
+    permanent = DataRow(attempt_count=0)
+    assert retry.record_failure(permanent, SendError("no such user", transient=False)) == "failed"
+    assert permanent.attempt_count == 1
+
+
+def test_sweeper_requeues_due_retries(client, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "retry_base_delay", 1.0)
+    monkeypatch.setattr(settings, "retry_max_delay", 1.0)
+    monkeypatch.setattr(worker, "draft_message", lambda prompt, data, model_name=None: Draft("hi", "gemini-2.5-flash", 1, 1))
+    attempts, sent = {}, []
+
+    def deliver(**kwargs):
+        to = kwargs["to"]
+        attempts[to] = attempts.get(to, 0) + 1
+        if to == "busy@retry.example" and attempts[to] == 1:
+            raise SendError("421 try again later", transient=True)
+        if to == "gone@retry.example":
+            raise SendError("550 no such user", transient=False)
+        sent.append(to)
+
+    monkeypatch.setattr(worker, "deliver_message", deliver)
+    csv = b"Name,Email\na,ok@retry.example\nb,busy@retry.example\nc,gone@retry.example\n"
+    campaign_id = client.post(
+        "/campaigns", data={"name": "retry", "master_prompt": "p"}, files={"file": ("a.csv", csv)},
+    ).json()["id"]
+    client.patch(f"/campaigns/{campaign_id}/throttle", json={"send_rate": 50})
+    assert client.post(f"/campaigns/{campaign_id}/launch").status_code == 200
+
+    def statuses() -> dict[str, str]:
+        with SessionLocal() as db:
+            return dict(db.execute(
+                select(DataRow.contact_email, DataRow.message_status).where(DataRow.campaign_id == campaign_id)
+            ).all())
+
+    # The run ends with one row waiting for its retry; the campaign stays running
+    assert wait_for(lambda: get_scheduler().get_run(campaign_id) is None and len(attempts) == 3)
+    assert statuses() == {"ok@retry.example": "sent", "busy@retry.example": "retry", "gone@retry.example": "failed"}
+    campaign = client.get(f"/campaigns/{campaign_id}").json()["campaign"]
+    assert campaign["status"] == "running"
+
+    assert retry.sweep()["campaigns"] == []  # not due yet
+    assert wait_for(lambda: retry.sweep()["campaigns"]) == [campaign_id]
+
+    status = lambda: client.get(f"/campaigns/{campaign_id}").json()["campaign"]["status"]
+    assert wait_for(lambda: status() == "completed")
+    assert statuses()["busy@retry.example"] == "sent"
+    assert (attempts["busy@retry.example"], attempts["gone@retry.example"]) == (2, 1)
@@ -0,0 +1,60 @@
+from sqlalchemy import select, update
+
+from app.database import SessionLocal
+from app.models import DataRow
+
+
+def _review_rows(client, name: str, confidences: list) -> tuple[int, list[int]]:
+    """A campaign whose rows all need review, with the given confidences: (campaign id, row ids in row order)."""
+    csv = "Name,Email\n" + "".join(f"n{i},{name}{i}@example.com\n" for i in range(len(confidences)))
+    campaign_id = client.post(
+        "/campaigns", data={"name": name, "master_prompt": "p"}, files={"file": ("a.csv", csv.encode())},
+    ).json()["id"]
+    with SessionLocal() as db:
+        row_ids = db.scalars(select(DataRow.id).where(DataRow.campaign_id == campaign_id).order_by(DataRow.id)).all()
+        for row_id, confidence in zip(row_ids, confidences):
+            db.execute(update(DataRow).where(DataRow.id == row_id).values(
+                needs_review=True, message_status="review", confidence=confidence, suggested_update={"Status": "ok"},
+            ))
+        db.commit()
+    return campaign_id, row_ids
+
+
+def test_queue_pages_through_rows_without_confidence(client):
+    confidences = [0.4, None, 0.1, None, 0.4, None, 0.7]
+    campaign_id, row_ids = _review_rows(client, "pages", confidences)
+
+    seen, cursor = [], None
+    while True:
+        params = {"campaign_id": campaign_id, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/reviews", params=params)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    expected = sorted(zip(row_ids, confidences), key=lambda rc: (rc[1] is not None, rc[1] or 0, rc[0]))
+    assert seen == [row_id for row_id, _ in expected]
+
+
+def test_bulk_review_reports_each_row(client):
+    campaign_id, row_ids = _review_rows(client, "bulk", [0.3, 0.2])
+    with SessionLocal() as db:
+        db.execute(update(DataRow).where(DataRow.id == row_ids[1]).values(suggested_update=None))
+        db.commit()
+
+    body = client.post("/reviews/bulk", json={"items": [
+        {"row_id": row_ids[0], "action": "approve"},
+        {"row_id": row_ids[1], "action": "approve"},  # nothing suggested to approve
+        {"row_id": 10**9, "action": "reject"},
+    ]}).json()
+    assert body["applied"] == 1
+    assert [(r["row_id"], r["status"]) for r in body["results"]] == [
+        (row_ids[0], "ok"), (row_ids[1], "invalid_action"), (10**9, "not_found"),
+    ]
+    with SessionLocal() as db:
+        assert db.get(DataRow, row_ids[0]).needs_review is False
+        assert db.get(DataRow, row_ids[1]).needs_review is True
+    assert [item["id"] for item in client.get("/reviews", params={"campaign_id": campaign_id}).json()["items"]] == [row_ids[1]]
@@ -0,0 +1,68 @@
+import json
+
+from sqlalchemy import select, update
+
+import app.routers.webhooks as webhooks
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import DataRow, RowUpdate
+from app.rowlog import compact
+
+
+def _campaign_with_reply(client, monkeypatch, name: str) -> tuple[int, int]:
+    """A campaign whose first row has an extracted reply waiting for review: City -> Goa."""
+    monkeypatch.setattr(webhooks, "process_reply", lambda **kwargs: {
+        "intent": "moved", "updates": {"City": "Goa"}, "confidence": 0.2,
+        "model": "gemini-2.5-flash", "usage": {"input_tokens": 1, "output_tokens": 1},
+    })
+    campaign_id = client.post(
+        "/campaigns", data={"name": name, "master_prompt": "p"},
+        files={"file": ("a.csv", f"Name,Email,City\na,{name}a@example.com,Pune\nb,{name}b@example.com,Pune\n".encode())},
+    ).json()["id"]
+    with SessionLocal() as db:
+        db.execute(update(DataRow).where(DataRow.campaign_id == campaign_id).values(outbound_message="hi", message_status="sent"))
+        db.commit()
+        row_id = db.scalar(select(DataRow.id).where(DataRow.campaign_id == campaign_id).order_by(DataRow.id))
+    assert client.post("/webhooks/manual-reply", json={"data_row_id": row_id, "reply_text": "I moved"}).json()["needs_review"]
+    return campaign_id, row_id
+
+
+def _approve(client, campaign_id: int, row_id: int):
+    response = client.post(f"/campaigns/{campaign_id}/rows/{row_id}/review", json={"action": "approve"})
+    assert response.status_code == 200
+
+
+def _cities(client, campaign_id: int, segment: str | None = None) -> dict[int, str]:
+    params = {"segment": segment} if segment else {}
+    rows = client.get(f"/campaigns/{campaign_id}", params=params).json()["rows"]
+    return {r["id"]: r["row_data"]["City"] for r in rows}
+
+
+def test_approved_reply_is_visible_before_compaction(client, monkeypatch):
+    campaign_id, row_id = _campaign_with_reply(client, monkeypatch, "overlay")
+    _approve(client, campaign_id, row_id)
+
+    with SessionLocal() as db:
+        assert db.get(DataRow, row_id).row_data["City"] == "Pune"  # still only logged
+    assert _cities(client, campaign_id)[row_id] == "Goa"
+    assert list(_cities(client, campaign_id, 'City == "Goa"')) == [row_id]
+    assert row_id not in _cities(client, campaign_id, 'City == "Pune"')
+
+    export = client.get(f"/campaigns/{campaign_id}/export", params={"format": "jsonl"}).text
+    assert {r["row_id"]: r["row_data"]["City"] for r in map(json.loads, export.splitlines())}[row_id] == "Goa"
+    csv_lines = client.get(f"/campaigns/{campaign_id}/export", params={"segment": 'City == "Goa"'}).text.splitlines()
+    assert len(csv_lines) == 2 and "Goa" in csv_lines[1]
+
+    compact()
+    assert _cities(client, campaign_id)[row_id] == "Goa"
+
+
+def test_updates_are_folded_at_commit_when_compaction_is_disabled(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "row_compaction_interval", 0)
+    campaign_id, row_id = _campaign_with_reply(client, monkeypatch, "nocompact")
+    _approve(client, campaign_id, row_id)
+
+    with SessionLocal() as db:
+        row = db.get(DataRow, row_id)
+        assert row.row_data["City"] == "Goa"
+        assert row.applied_update_id == db.scalar(select(RowUpdate.id).where(RowUpdate.row_id == row_id))
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import CampaignRun, FairScheduler
+from conftest import wait_for
+
+FAST = 1e6  # send_rate high enough that the token bucket never holds a run back
+
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def make(**kwargs) -> FairScheduler:
+        schedulers.append(FairScheduler(**{"tenant_max_concurrency": 100, "tenant_weights": {}, **kwargs}))
+        return schedulers[-1]
+
+    yield make
+    for s in schedulers:
+        s.shutdown()
+
+
+class Recorder:
+    """Runs' `process`: holds every item until `release()`, then records the order items ran in."""
+
+    def __init__(self):
+        self.order: list[str] = []
+        self.finished: list[int] = []
+        self._gate = threading.Event()
+        self._lock = threading.Lock()
+        self.in_flight: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+
+    def run(self, campaign_id: int, tenant: str, count: int, **kwargs) -> CampaignRun:
+        return CampaignRun(
+            campaign_id, tenant, iter([f"{tenant}/{campaign_id}"] * count),
+            process=self._process, on_finish=lambda run: self.finished.append(run.campaign_id),
+            send_rate=FAST, **kwargs,
+        )
+
+    def release(self):
+        self._gate.set()
+
+    def _process(self, item: str):
+        tenant = item.split("/")[0]
+        with self._lock:
+            self.in_flight[tenant] = self.in_flight.get(tenant, 0) + 1
+            self.peak[tenant] = max(self.peak.get(tenant, 0), self.in_flight[tenant])
+        self._gate.wait()
+        time.sleep(0.002)
+        with self._lock:
+            self.in_flight[tenant] -= 1
+            self.order.append(item)
+
+
+def _submit_all(scheduler: FairScheduler, runs: list[CampaignRun]):
+    """Submit runs with their items already prefetched, so dispatch order depends on weights only."""
+    assert wait_for(lambda: all([run.has_work() for run in runs]))
+    for run in runs:
+        scheduler.submit(run)
+
+
+def test_tenants_share_a_full_pool_by_weight(scheduler):
+    s = scheduler(max_workers=1, tenant_weights={"big": 2.0, "small": 1.0})
+    recorder = Recorder()
+    _submit_all(s, [recorder.run(1, "big", 12), recorder.run(2, "small", 6)])
+    recorder.release()
+
+    assert wait_for(lambda: len(recorder.finished) == 2)
+    tenants = [item.split("/")[0] for item in recorder.order]
+    assert tenants == ["big", "big", "small"] * 6
+
+
+def test_fractional_tenant_weight_gets_a_turn_every_other_round(scheduler):
+    s = scheduler(max_workers=1, tenant_weights={"a": 1.0, "b": 0.5})
+    recorder = Recorder()
+    _submit_all(s, [recorder.run(1, "a", 8), recorder.run(2, "b", 8)])
+    recorder.release()
+
+    assert wait_for(lambda: len(recorder.order) >= 9)
+    assert [item.split("/")[0] for item in recorder.order[:9]].count("b") == 3
+
+
+def test_campaign_weights_order_runs_within_a_tenant(scheduler):
+    s = scheduler(max_workers=1)
+    recorder = Recorder()
+    _submit_all(s, [recorder.run(1, "acme", 8, weight=2.0), recorder.run(2, "acme", 8, weight=1.0)])
+    recorder.release()
+
+    assert wait_for(lambda: len(recorder.finished) == 2)
+    assert [item.split("/")[1] for item in recorder.order[:9]] == ["1", "1", "2"] * 3
+
+
+def test_tenant_concurrency_cap_leaves_workers_for_others(scheduler):
+    s = scheduler(max_workers=4, tenant_max_concurrency=2)
+    recorder = Recorder()
+    _submit_all(s, [recorder.run(1, "big", 20), recorder.run(2, "small", 4)])
+
+    # With "big" held at its cap, "small" gets the other two workers
+    assert wait_for(lambda: recorder.in_flight.get("small") == 2 and recorder.in_flight.get("big") == 2)
+    recorder.release()
+    assert wait_for(lambda: len(recorder.finished) == 2)
+    assert recorder.peak == {"big": 2, "small": 2}
+    stats = s.stats()["tenants"]
+    assert (stats["big"]["completed"], stats["small"]["completed"]) == (20, 4)
+
+
+def test_paused_run_holds_its_items_until_resumed(scheduler):
+    s = scheduler(max_workers=2)
+    recorder = Recorder()
+    recorder.release()
+    run = recorder.run(1, "acme", 5)
+    run.pause()
+    _submit_all(s, [run])
+
+    time.sleep(0.2)
+    assert recorder.order == []
+    assert s.control(1, "resume")
+    assert wait_for(lambda: recorder.finished == [1])
+    assert len(recorder.order) == 5
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.database import SessionLocal, engine
+from app.models import DataRow
+from app.search import to_match_query
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="FTS5 index is SQLite-only")
+
+
+def _campaign(client, name: str, csv: str) -> tuple[int, list[int]]:
+    campaign_id = client.post(
+        "/campaigns", data={"name": name, "master_prompt": "p"}, files={"file": ("a.csv", csv.encode())},
+    ).json()["id"]
+    with SessionLocal() as db:
+        row_ids = db.scalars(select(DataRow.id).where(DataRow.campaign_id == campaign_id).order_by(DataRow.id)).all()
+    return campaign_id, list(row_ids)
+
+
+def _hits(client, q: str, campaign_id: int) -> dict[int, str]:
+    response = client.get("/search", params={"q": q, "campaign_id": campaign_id})
+    assert response.status_code == 200, response.text
+    return {hit["row_id"]: hit["snippet"] for hit in response.json()["items"]}
+
+
+def _update(row_id: int, **values):
+    with SessionLocal() as db:
+        db.execute(update(DataRow).where(DataRow.id == row_id).values(**values))
+        db.commit()
+
+
+def test_index_follows_inserts_updates_and_deletes(client):
+    campaign_id, (asha, ravi) = _campaign(
+        client, "fts-sync", "Name,Email,City\nAsha,asha@fts.example,Kochi\nRavi,ravi@fts.example,Nagpur\n",
+    )
+    assert list(_hits(client, "Kochi", campaign_id)) == [asha]
+
+    _update(ravi, outbound_message="Is Nagpur still home?", reply_text="Moved to Shillong last spring")
+    assert list(_hits(client, "shillong", campaign_id)) == [ravi]
+    assert list(_hits(client, '"still home"', campaign_id)) == [ravi]
+
+    _update(ravi, reply_text="Actually it is Imphal", row_data={"Name": "Ravi", "City": "Imphal"})
+    assert _hits(client, "shillong", campaign_id) == {}
+    assert list(_hits(client, "nagpur", campaign_id)) == [ravi]  # still in the draft
+    assert list(_hits(client, "imphal", campaign_id)) == [ravi]
+
+    with SessionLocal() as db:
+        db.execute(delete(DataRow).where(DataRow.id == asha))
+        db.commit()
+    assert _hits(client, "kochi", campaign_id) == {}
+
+
+def test_snippets_escape_reply_html_and_mark_matches(client):
+    campaign_id, (row_id,) = _campaign(client, "fts-escape", "Name,Email\nMeera,meera@fts.example\n")
+    _update(row_id, reply_text='<img src=x onerror="alert(1)"> the parking lot is <b>full</b>')
+
+    snippet = _hits(client, "parking", campaign_id)[row_id]
+    assert "<mark>parking</mark>" in snippet
+    assert "<img" not in snippet and "<b>" not in snippet
+    assert "&lt;img" in snippet and "&lt;b&gt;full" in snippet
+
+
+def test_prefix_search_and_fts_syntax_in_queries(client):
+    campaign_id, (row_id,) = _campaign(client, "fts-syntax", "Name,Email\nNoor,noor@fts.example\n")
+    _update(row_id, reply_text="Please reschedule the call: NEAR the station (after 5)")
+
+    assert list(_hits(client, "resched*", campaign_id)) == [row_id]
+    for q in ("NEAR(", 'station"', "call: NEAR", "-after", "(5)"):
+        assert list(_hits(client, q, campaign_id)) == [row_id], q
+    assert _hits(client, "reschedule tomorrow", campaign_id) == {}  # every word must match
+
+    assert to_match_query('"call me" back* x"y') == '"call me" "back"* "x""y"'
+    assert client.get("/search", params={"q": "* *"}).status_code == 400
@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import select
+
+from app.database import SessionLocal, engine
+from app.models import DataRow
+from app.segments import SegmentError, compile_segment, parse_segment, segment_matcher
+
+ROWS = [
+    {"City": "Pune", "Age": 34, "VIP": True, "Email": "a@test.example", "Lead Source": "web", "Score": 7.5, "Code": 7},
+    {"City": "pune", "Age": 29, "VIP": False, "Email": "b@example.com", "Lead Source": "referral", "Score": None,
+     "Code": "34"},
+    {"City": "Mumbai", "Age": 22, "Email": "c@example.com", "Code": "x"},
+    {"City": "Delhi", "Age": 51, "VIP": True, "Lead Source": "ads", "Note": "50% off_now", "Flag": 1},
+    {"City": None, "Age": None},
+    {"City": "Pune", "Tags": ["a", "b"]},
+]
+
+# Same result on every database
+SEGMENTS = [
+    'City == "Pune"',
+    'City = "Pune"',
+    'City != "Pune"',
+    'not City == "Pune"',
+    'not (City == "Pune" or City == "Mumbai")',
+    "Age >= 30",
+    "Age < 30 and Age != 22",
+    "not Age > 30",
+    "VIP == true",
+    "VIP != true",
+    "VIP == null",
+    "VIP != null",
+    "City == null",
+    "Score > 5",
+    '"Lead Source" in ["web", "referral"]',
+    'not "Lead Source" in ["web"]',
+    'Email contains "@TEST."',
+    'Note contains "50%"',
+    'Note contains "f_n"',
+    'Note contains "0 off_"',
+    '(Age >= 30 or VIP == true) and not Email contains "@test."',
+    'City == "Pune" and Age > 30 or City == "Delhi"',
+    'Missing == "x"',
+    'not Missing == "x"',
+]
+# SQLite semantics the archived-row matcher mirrors: numbers sort before text, JSON
+# booleans are 1 / 0, arrays are compared as JSON text (PostgreSQL orders JSONB differently)
+SQLITE_SEGMENTS = [
+    'Code > "3"',
+    "Code < 10",
+    "Flag == true",
+    "VIP == 1",
+    'Code in [7, "x"]',
+    'Tags contains "a"',
+    'Tags == "[\\"a\\",\\"b\\"]"',
+]
+
+
+@pytest.fixture(scope="module")
+def rows(client):
+    campaign_id = client.post(
+        "/campaigns", data={"name": "segments", "master_prompt": "p"},
+        files={"file": ("a.csv", b"Name,Email\nseed,seed@segments.example\n")},
+    ).json()["id"]
+    with SessionLocal() as db:
+        records = [DataRow(campaign_id=campaign_id, row_index=i + 1, row_data=data) for i, data in enumerate(ROWS)]
+        db.add_all(records)
+        db.commit()
+        return campaign_id, {r.id: r.row_data for r in records}
+
+
+def _sql_matches(campaign_id: int, row_ids, expression: str) -> set[int]:
+    with SessionLocal() as db:
+        return set(db.scalars(
+            select(DataRow.id).where(DataRow.campaign_id == campaign_id, DataRow.id.in_(row_ids), compile_segment(expression))
+        ))
+
+
+def _check_parity(rows, expression: str):
+    campaign_id, data = rows
+    matches = segment_matcher(expression)
+    expected = {row_id for row_id, row_data in data.items() if matches(row_data)}
+    assert _sql_matches(campaign_id, list(data), expression) == expected, expression
+
+
+@pytest.mark.parametrize("expression", SEGMENTS)
+def test_compiled_segment_matches_python_matcher(rows, expression):
+    _check_parity(rows, expression)
+
+
+@pytest.mark.skipif(engine.dialect.name != "sqlite", reason="SQLite-specific ordering and booleans")
+@pytest.mark.parametrize("expression", SQLITE_SEGMENTS)
+def test_compiled_segment_matches_python_matcher_on_sqlite(rows, expression):
+    _check_parity(rows, expression)
+
+
+def test_missing_keys_never_match():
+    matches = segment_matcher('not City == "Pune"')
+    assert not matches({}) and not matches({"City": "Pune"}) and matches({"City": "Goa"})
+    assert segment_matcher("City == null")({})
+
+
+@pytest.mark.parametrize("expression", [
+    "", "City ==", 'City == "a" and', "(City == 1", 'City ~ "a"', "Age > null", 'in ["a"]', '"a\\"b" == 1',
+])
+def test_invalid_segments_are_rejected(expression):
+    with pytest.raises(SegmentError):
+        parse_segment(expression)
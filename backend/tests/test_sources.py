@@ -0,0 +1,40 @@
+import sqlite3
+
+from conftest import wait_for
+
+
+def _sync_result(client, campaign_id: int, job_id: str) -> dict:
+    poll = lambda: client.get(f"/campaigns/{campaign_id}/sync/{job_id}").json()
+    assert wait_for(lambda: poll()["status"] in ("completed", "failed"))
+    job = poll()
+    assert job["status"] == "completed", job["errors"]
+    return job["result"]
+
+
+def test_incremental_sync_reads_rows_sharing_the_last_watermark(client, tmp_path):
+    path = tmp_path / "crm.db"
+    source = sqlite3.connect(path)
+    source.execute("CREATE TABLE contacts (id INTEGER PRIMARY KEY, name TEXT, email TEXT, updated_at INTEGER)")
+    source.executemany(
+        "INSERT INTO contacts VALUES (?, ?, ?, ?)",
+        [(1, "Asha", "asha@example.com", 100), (2, "Ravi", "ravi@example.com", 200)],
+    )
+    source.commit()
+
+    response = client.post("/campaigns/sql", json={
+        "name": "crm", "master_prompt": "p", "url": f"sqlite:///{path}",
+        "query": "SELECT id, name, email, updated_at FROM contacts",
+        "key_column": "id", "watermark_column": "updated_at",
+    }).json()
+    campaign_id = response["id"]
+    first = _sync_result(client, campaign_id, response["job"]["id"])
+    assert (first["inserted"], first["watermark"]) == (2, "200")
+
+    # Committed after the first sync, but with the same updated_at as its high mark
+    source.execute("INSERT INTO contacts VALUES (3, 'Meera', 'meera@example.com', 200)")
+    source.commit()
+
+    second = _sync_result(client, campaign_id, client.post(f"/campaigns/{campaign_id}/sync").json()["job"]["id"])
+    assert (second["total"], second["inserted"], second["updated"]) == (2, 1, 0)  # Ravi re-read, unchanged
+    assert client.get(f"/campaigns/{campaign_id}").json()["stats"]["total"] == 3
+    source.close()